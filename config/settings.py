@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ticketing.middleware.MetriquesMiddleware',
+    'ticketing.middleware.ProfilageMiddleware',
+    'ticketing.middleware.ReplicasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ticketing.middleware.FileAttenteMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -81,6 +86,71 @@ DATABASES = {
     }
 }
 
+# Réplicas en lecture (voir ticketing/replicas.py). Pour essayer en local avec
+# deux fichiers SQLite : REPLIQUES_SQLITE=replique1.sqlite3,replique2.sqlite3,
+# puis « manage.py synchroniser_repliques --intervalle 2 » tient lieu de
+# réplication. En production, déclarer ici les réplicas PostgreSQL.
+for numero, nom in enumerate(filter(None, os.environ.get('REPLIQUES_SQLITE', '').split(',')), 1):
+    DATABASES[f'replique{numero}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / nom,
+        # Les tests lisent la base de test principale.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['ticketing.replicas.RouteurReplicas']
+
+# Lectures des requêtes HTTP sur les réplicas ; un visiteur qui vient d'écrire
+# lit la base principale pendant DUREE_EPINGLAGE secondes.
+REPLIQUES = {
+    'ALIAS': tuple(alias for alias in DATABASES if alias != 'default'),
+    'DUREE_EPINGLAGE': 10,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# En production, utiliser un cache partagé entre processus, par exemple :
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://127.0.0.1:6379',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Profil de sessions : 'cache' (cache, recopiées en base : une lecture SQL
+# seulement si le cache les a perdues), 'cookie' (signées dans le cookie,
+# aucun stockage) ou 'base' (une lecture SQL par requête).
+SESSION_ENGINE = {
+    'base': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cached_db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSIONS', 'cache')]
+
+# L'utilisateur de chaque requête est lu dans le cache (ticketing/authentification.py).
+# Avec plusieurs processus, le cache doit être partagé : sinon un utilisateur
+# modifié reste jusqu'à CACHE_UTILISATEURS_DUREE dans le cache des autres.
+AUTHENTICATION_BACKENDS = ['ticketing.authentification.BackendUtilisateursCache']
+CACHE_UTILISATEURS_DUREE = 300
+# Rôles et permissions de chaque utilisateur, en cache (ticketing/droits.py).
+CACHE_DROITS_DUREE = 300
+
+# Durée de vie (secondes) de la liste des programmes en cache ; elle est de
+# toute façon invalidée à chaque modification d'un programme.
+CACHE_PROGRAMMES_DUREE = 3600
+
+# Jauge par section donnée aux programmes antérieurs à l'inventaire
+# (migration 0003_programme_capacite), à ajuster avant de migrer.
+CAPACITE_INITIALE = {'A': 1000, 'B': 5000}
+
+# Durée (en secondes) de l'option d'une réservation en ligne avant paiement
+# (ticketing/expirations.py, commande expirer_reservations). Plus longue que
+# la durée minimale d'une session Stripe (31 minutes) : une session ouverte
+# peu après la réservation se ferme avec l'option.
+RESERVATION_DUREE_OPTION = 45 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,4 +197,57 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # config/settings.py
 STRIPE_PUBLISHABLE_KEY = 'pk_test_VOTRE_CLE_PUBLIABLE'
-STRIPE_SECRET_KEY = 'sk_test_VOTRE_CLE_SECRETE'
\ No newline at end of file
+STRIPE_SECRET_KEY = 'sk_test_VOTRE_CLE_SECRETE'
+STRIPE_WEBHOOK_SECRET = 'whsec_VOTRE_SECRET_WEBHOOK'
+
+# Client Stripe (ticketing/paiements.py) : délais stricts, en secondes.
+# STRIPE_API_BASE permet de viser un faux serveur local (ticketing/faux_stripe.py).
+STRIPE_API_BASE = None
+STRIPE_DELAI_CONNEXION = 2.0
+STRIPE_DELAI_LECTURE = 10.0
+STRIPE_MAX_TENTATIVES = 1
+
+
+# Salle d'attente devant les vues de mise en vente (voir ticketing/file_attente.py).
+# En production, le cache doit être partagé entre les processus (Redis).
+FILE_ATTENTE = {
+    'ACTIVE': True,
+    'ADMISSIONS_PAR_SECONDE': 20,
+    'DUREE_ADMISSION': 15 * 60,
+    'VUES': ('reservation_create', 'create_checkout_session', 'create_checkout_session_async'),
+}
+
+
+# Billets électroniques (voir ticketing/billets.py). CLE est la clé maîtresse
+# dont dérivent les clés des lecteurs de contrôle ; vide, SECRET_KEY est
+# utilisée. La changer invalide tous les billets déjà émis.
+BILLETS = {
+    'CLE': os.environ.get('BILLETS_CLE', ''),
+}
+
+# Contrôle d'accès (ticketing/controle.py) : passages écrits en base par lots.
+CONTROLE = {
+    'TAILLE_LOT': 500,
+    'DELAI_ECRITURE': 0.5,
+}
+
+
+# Métriques par vue exposées sur /metrics (voir ticketing/metriques.py).
+# Avec plusieurs workers (gunicorn, uvicorn), REPERTOIRE doit désigner un
+# répertoire local partagé, vidé au démarrage du serveur.
+METRIQUES = {
+    'ACTIVE': True,
+    'REPERTOIRE': os.environ.get('METRIQUES_REPERTOIRE'),
+    'INTERVALLE_ECRITURE': 1.0,
+    'IPS_AUTORISEES': ('127.0.0.1', '::1'),
+}
+
+
+# Profilage à la demande (voir ticketing/profilage.py) : TAUX > 0 profile une
+# part des requêtes ; un membre du staff peut aussi profiler ses propres
+# requêtes avec l'en-tête signé obtenu sur /profilage/jeton/.
+PROFILAGE = {
+    'TAUX': float(os.environ.get('PROFILAGE_TAUX', 0)),
+    'SEUIL_SQL': 0.1,
+    'TAILLE': 50,
+}
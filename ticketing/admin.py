@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Programme, Reservation, Paiement
+from django.utils import timezone
+from .models import Billet, CustomUser, Programme, Reservation, Paiement, EvenementStripe
 from .forms import CustomUserCreationForm, CustomUserChangeForm
+from . import recherche
 
 # --- Personnalisation de l'interface d'administration ---
 
@@ -29,18 +31,25 @@ class ProgrammeAdmin(admin.ModelAdmin):
     Configuration pour le modèle Programme.
     """
     list_display = ('nom_equipe1', 'nom_equipe2', 'date', 'stadium', 'agent')
+    list_select_related = ('agent',)
     list_filter = ('date', 'division')
     search_fields = ('nom_equipe1', 'nom_equipe2', 'stadium')
     date_hierarchy = 'date'
     ordering = ('-date',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Index plein texte (ticketing/recherche.py) plutôt que des LIKE '%x%'.
+        return recherche.filtrer(queryset, search_term), False
+
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
     """
     Configuration pour le modèle Reservation.
     """
-    list_display = ('spectateur', 'programme', 'nombre_billet', 'date_reservation')
-    list_filter = ('date_reservation', 'type_reservation')
+    list_display = ('spectateur', 'programme', 'nombre_billet', 'date_reservation', 'statut')
+    # Jointures limitées à ce qu'affiche la liste (select_related() complet sinon).
+    list_select_related = ('spectateur', 'programme')
+    list_filter = ('date_reservation', 'type_reservation', 'statut')
     search_fields = ('spectateur__username', 'programme__nom_equipe1', 'programme__nom_equipe2')
     ordering = ('-date_reservation',)
 
@@ -50,6 +59,37 @@ class PaiementAdmin(admin.ModelAdmin):
     Configuration pour le modèle Paiement.
     """
     list_display = ('id_paiement', 'reservation', 'montant', 'mode_paiement', 'date_paiement')
+    list_select_related = ('reservation__spectateur',)
     list_filter = ('mode_paiement', 'date_paiement')
     search_fields = ('reservation__id_reservation', 'mode_paiement')
     ordering = ('-date_paiement',)
+
+
+@admin.register(Billet)
+class BilletAdmin(admin.ModelAdmin):
+    """
+    Billets électroniques (émis au paiement, voir ticketing/billets.py).
+    """
+    list_display = ('numero', 'section', 'programme', 'reservation', 'emis_le')
+    list_select_related = ('programme', 'reservation__spectateur')
+    list_filter = ('section',)
+    raw_id_fields = ('reservation', 'programme')
+    readonly_fields = ('code', 'emis_le')
+    # Ordre de la contrainte d'unicité : la liste est lue sur son index.
+    ordering = ('programme', 'section', 'numero')
+
+
+@admin.register(EvenementStripe)
+class EvenementStripeAdmin(admin.ModelAdmin):
+    """
+    Configuration pour la boîte de réception des webhooks Stripe.
+    """
+    list_display = ('id_evenement', 'type_evenement', 'statut', 'tentatives', 'recu_le', 'traite_le')
+    list_filter = ('statut', 'type_evenement')
+    search_fields = ('id_evenement',)
+    ordering = ('-recu_le',)
+    actions = ['rejouer']
+
+    @admin.action(description="Rejouer les événements sélectionnés")
+    def rejouer(self, request, queryset):
+        queryset.update(statut=EvenementStripe.STATUT_RECU, tentatives=0, prochain_essai=timezone.now())
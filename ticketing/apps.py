@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TicketingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ticketing'
+
+    def ready(self):
+        # Enregistre les receveurs de signaux (inventaire, caches, ...)
+        from . import signals  # noqa: F401
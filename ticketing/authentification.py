@@ -0,0 +1,60 @@
+"""
+Sessions et utilisateurs lus sans SQL sur le chemin des requêtes authentifiées.
+
+- Sessions : SESSION_ENGINE choisi par le profil SESSIONS des settings ; le
+  profil par défaut (cached_db) lit la session dans le cache et ne retombe sur
+  la table django_session que si le cache l'a perdue.
+- Utilisateurs : BackendUtilisateursCache garde l'utilisateur de la session
+  dans le cache. Toute sauvegarde ou suppression d'un utilisateur (mot de
+  passe, last_login, is_active, ...) efface son entrée (voir
+  ticketing/signals.py) ; un UPDATE en masse sur la table des utilisateurs
+  doit appeler oublier().
+
+La vérification du condensat de session (changement de mot de passe) se fait
+sur l'utilisateur en cache, sans SQL elle aussi ; les permissions viennent de
+l'instantané de ticketing/droits.py.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from . import droits
+
+
+def _duree():
+    return getattr(settings, 'CACHE_UTILISATEURS_DUREE', 300)
+
+
+def cle(pk):
+    return f'utilisateur:{pk}'
+
+
+def oublier(*pks):
+    cache.delete_many([cle(pk) for pk in pks])
+
+
+class BackendUtilisateursCache(ModelBackend):
+    """
+    ModelBackend dont get_user (appelé à chaque requête par
+    AuthenticationMiddleware) lit d'abord le cache, et dont les permissions
+    sont celles de l'instantané en cache.
+    """
+    def get_user(self, user_id):
+        utilisateur = cache.get(cle(user_id))
+        if utilisateur is None:
+            User = get_user_model()
+            # Sur la base principale : la copie d'un réplica en retard
+            # resterait en cache.
+            try:
+                utilisateur = User._default_manager.using(DEFAULT_DB_ALIAS).get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(cle(user_id), utilisateur, _duree())
+        return utilisateur if self.user_can_authenticate(utilisateur) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return droits.droits(user_obj).permissions
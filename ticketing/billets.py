@@ -0,0 +1,177 @@
+"""
+Billets électroniques signés, vérifiables hors ligne au contrôle d'accès.
+
+Chaque place d'une réservation payée reçoit un billet. Son code tient en
+20 octets écrits en base32, soit 32 caractères A-Z2-7 (mode alphanumérique
+des QR codes) :
+
+    version (1) | programme (4) | section (1) | numéro (4) | signature (10)
+
+La signature est un HMAC-SHA256 tronqué à 80 bits, sous une clé propre au
+programme, dérivée de la clé maîtresse BILLETS['CLE'] (cle_programme). Un
+lecteur de contrôle ne reçoit que la clé du match qu'il contrôle (commande
+cle_controle) : verifier() n'a besoin ni du réseau ni de la base, et un
+lecteur compromis ne permet de forger que des billets de ce match. Une
+signature asymétrique (Ed25519) supprimerait ce risque mais demanderait une
+dépendance (cryptography) ; l'octet de version permettra d'en changer.
+
+Les billets sont émis quand le paiement est enregistré : par le signal
+post_save de Paiement pour un paiement unitaire, directement pour les
+paiements en masse (session de groupe), et par la commande emettre_billets
+pour un rattrapage. Les numéros sont attribués par blocs, section par
+section, sur CompteurVentes.dernier_billet : un UPDATE relatif par couple
+programme/section et par lot, puis un seul INSERT pour tout le lot.
+"""
+import base64
+import hashlib
+import hmac
+import struct
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import Billet, CompteurVentes, Reservation
+
+
+VERSION = 1
+FORMAT = '>BIcI'
+TAILLE_SIGNATURE = 10
+TAILLE_LOT = 500
+
+
+class BilletInvalide(Exception):
+    """
+    Code illisible, de format inconnu ou dont la signature ne correspond pas.
+    """
+
+
+@dataclass(frozen=True)
+class Contenu:
+    programme_id: int
+    section: str
+    numero: int
+
+
+def cle_maitresse():
+    return (getattr(settings, 'BILLETS', {}).get('CLE') or settings.SECRET_KEY).encode()
+
+
+def cle_programme(programme_id):
+    """
+    Clé de signature des billets d'un programme, à installer sur les lecteurs
+    de contrôle de ce programme.
+    """
+    return hmac.new(cle_maitresse(), f'ticketing.billets:{programme_id}'.encode(), hashlib.sha256).digest()
+
+
+def _signature(cle, donnees):
+    return hmac.new(cle, donnees, hashlib.sha256).digest()[:TAILLE_SIGNATURE]
+
+
+def encoder(programme_id, section, numero, cle=None):
+    donnees = struct.pack(FORMAT, VERSION, programme_id, section.encode('ascii'), numero)
+    signature = _signature(cle or cle_programme(programme_id), donnees)
+    return base64.b32encode(donnees + signature).decode('ascii')
+
+
+def verifier(code, cle):
+    """
+    Vérifie un code avec la clé d'un programme, sans accès à la base ;
+    renvoie son Contenu ou lève BilletInvalide.
+    """
+    try:
+        brut = base64.b32decode(code.strip().upper())
+    except (ValueError, AttributeError):
+        raise BilletInvalide("Code illisible.")
+    taille = struct.calcsize(FORMAT)
+    if len(brut) != taille + TAILLE_SIGNATURE:
+        raise BilletInvalide("Longueur invalide.")
+    donnees, signature = brut[:taille], brut[taille:]
+    if not hmac.compare_digest(_signature(cle, donnees), signature):
+        raise BilletInvalide("Signature invalide.")
+    version, programme_id, section, numero = struct.unpack(FORMAT, donnees)
+    if version != VERSION:
+        raise BilletInvalide(f"Version {version} inconnue.")
+    return Contenu(programme_id, section.decode('ascii'), numero)
+
+
+def _allouer(programme_id, section, nombre):
+    """
+    Réserve `nombre` numéros consécutifs de la section (dans la transaction
+    de l'appelant : la ligne du compteur reste verrouillée jusqu'au commit).
+    """
+    compteur = CompteurVentes.objects.filter(programme_id=programme_id, section=section)
+    if not compteur.update(dernier_billet=F('dernier_billet') + nombre):
+        # Compteur absent (recréé par verifier_compteurs, par exemple) : il
+        # repart du plus grand numéro déjà émis.
+        dernier = Billet.objects.filter(programme_id=programme_id, section=section).aggregate(
+            dernier=Max('numero')
+        )['dernier'] or 0
+        CompteurVentes.objects.bulk_create(
+            [CompteurVentes(programme_id=programme_id, section=section, dernier_billet=dernier)],
+            ignore_conflicts=True,
+        )
+        compteur.update(dernier_billet=F('dernier_billet') + nombre)
+    fin = compteur.values_list('dernier_billet', flat=True).get()
+    return range(fin - nombre + 1, fin + 1)
+
+
+def emettre(reservations):
+    """
+    Émet les billets des `reservations` payées qui n'en ont pas encore ;
+    renvoie les billets créés.
+    """
+    reservations = [r for r in reservations if r.type_reservation in ('A', 'B')]
+    if not reservations:
+        return []
+    with transaction.atomic():
+        deja_emises = set(
+            Billet.objects.filter(reservation__in=[r.pk for r in reservations])
+            .values_list('reservation_id', flat=True).distinct()
+        )
+        par_section = defaultdict(list)
+        for reservation in reservations:
+            if reservation.pk not in deja_emises:
+                par_section[(reservation.programme_id, reservation.type_reservation)].append(reservation)
+
+        billets = []
+        for (programme_id, section), groupe in sorted(par_section.items()):
+            cle = cle_programme(programme_id)
+            numeros = iter(_allouer(programme_id, section, sum(r.nombre_billet for r in groupe)))
+            for reservation in groupe:
+                for _ in range(reservation.nombre_billet):
+                    numero = next(numeros)
+                    billets.append(Billet(
+                        reservation_id=reservation.pk, programme_id=programme_id, section=section,
+                        numero=numero, code=encoder(programme_id, section, numero, cle),
+                    ))
+        return Billet.objects.bulk_create(billets, batch_size=1000)
+
+
+def a_emettre():
+    """
+    Réservations payées sans billets (paiements antérieurs aux billets,
+    émission en échec).
+    """
+    return Reservation.objects.filter(
+        paiement__isnull=False, billets__isnull=True, type_reservation__in=('A', 'B'),
+    ).order_by('pk')
+
+
+def rattraper(taille=TAILLE_LOT):
+    """
+    Émet les billets manquants par lots ; renvoie le nombre de billets émis.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            # of=self : PostgreSQL refuse de verrouiller le côté nullable de la jointure.
+            lot = list(a_emettre().select_for_update(of=('self',)).only(
+                'programme_id', 'type_reservation', 'nombre_billet',
+            )[:taille])
+            if not lot:
+                return total
+            total += len(emettre(lot))
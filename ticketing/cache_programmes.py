@@ -0,0 +1,68 @@
+"""
+Cache versionné de la liste publique des programmes.
+
+Toutes les clés contiennent un numéro de version ; modifier ou supprimer un
+Programme incrémente ce numéro (voir ticketing/signals.py), ce qui rend
+immédiatement obsolètes toutes les entrées précédentes sans avoir à les
+énumérer. N'utilise que get/set/add/incr : fonctionne avec le cache mémoire
+local comme avec Redis ou Memcached.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Programme
+
+
+CLE_VERSION = 'programmes:version'
+
+
+def _duree():
+    return getattr(settings, 'CACHE_PROGRAMMES_DUREE', 3600)
+
+
+def version():
+    numero = cache.get(CLE_VERSION)
+    if numero is None:
+        # Partir de l'horloge (en ms) plutôt que de 1 : si la clé est évincée,
+        # la nouvelle version reste supérieure à toutes les précédentes.
+        cache.add(CLE_VERSION, int(time.time() * 1000), timeout=None)
+        numero = cache.get(CLE_VERSION)
+    return numero
+
+
+def invalider():
+    try:
+        cache.incr(CLE_VERSION)
+    except ValueError:
+        version()
+
+
+def cle(nom):
+    return f'programmes:{version()}:{nom}'
+
+
+def programmes(ordre):
+    """
+    Liste des programmes triée selon `ordre`, lue depuis le cache si possible.
+    """
+    cle_liste = cle(f'liste:{ordre}')
+    liste = cache.get(cle_liste)
+    if liste is None:
+        liste = list(Programme.objects.order_by(ordre))
+        cache.set(cle_liste, liste, _duree())
+    return liste
+
+
+def page(nom, produire):
+    """
+    Renvoie le rendu `nom` depuis le cache, ou l'obtient avec produire() et
+    le met en cache pour la version courante.
+    """
+    cle_page = cle(f'page:{nom}')
+    contenu = cache.get(cle_page)
+    if contenu is None:
+        contenu = produire()
+        cache.set(cle_page, contenu, _duree())
+    return contenu
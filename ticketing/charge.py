@@ -0,0 +1,378 @@
+"""
+Test de charge du parcours spectateur (commande tester_charge).
+
+Un serveur WSGI local (threads) sert l'application et un FauxStripe règle les
+sessions de paiement en renvoyant des webhooks signés à stripe_webhook. Des
+spectateurs virtuels, un par parcours, enchaînent par paliers de concurrence
+croissante :
+
+    inscription -> connexion -> reservation -> paiement -> reglement
+
+`paiement` crée la session (redirection vers le fournisseur), `reglement` est
+la visite de la page du fournisseur, qui envoie le webhook ; la durée de
+chaque envoi au webhook est notée comme une étape à part (`webhook`). Une
+étape en erreur interrompt le parcours.
+
+Après les paliers, la boîte de réception des webhooks est traitée puis les
+invariants sont vérifiés : chaque réservation réglée a exactement un
+Paiement, aucun paiement n'est orphelin, les compteurs de ventes et
+l'inventaire du programme concordent.
+
+L'inscription crée un CustomUser, que l'authentification (modèle
+utilisateur configuré) ne lit pas : la connexion utilise donc des comptes
+du modèle configuré, créés d'avance avec le même nom et mot de passe.
+"""
+import datetime
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+import httpx
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import compteurs, paiements, webhooks
+from .faux_stripe import FauxStripe
+from .models import CustomUser, EvenementStripe, Paiement, Programme, Reservation
+
+
+ETAPES = ('inscription', 'connexion', 'reservation', 'paiement', 'reglement', 'webhook')
+CENTILES = (50, 95, 99)
+SECRET_WEBHOOK = 'whsec_charge'
+
+
+@dataclass
+class Options:
+    paliers: tuple = (1, 5, 10, 20)
+    # Parcours par palier (au moins un par spectateur simultané).
+    parcours_par_palier: int = 50
+    taux_abandon: float = 0.2
+    taux_rejeu: float = 0.1
+    latence_stripe: float = 0.0
+    delai: float = 30.0
+    graine: int = 0
+
+
+@dataclass
+class Mesures:
+    """
+    Durées des appels réussis et nombre d'erreurs, par étape.
+    """
+    durees: dict = field(default_factory=lambda: {etape: [] for etape in ETAPES})
+    erreurs: dict = field(default_factory=lambda: dict.fromkeys(ETAPES, 0))
+    exemples: dict = field(default_factory=dict)
+    parcours_complets: int = 0
+    verrou: threading.Lock = field(default_factory=threading.Lock)
+
+    def noter(self, etape, duree, erreur=None):
+        with self.verrou:
+            if erreur is None:
+                self.durees[etape].append(duree)
+            else:
+                self.erreurs[etape] += 1
+                self.exemples.setdefault(etape, erreur)
+
+
+class EtapeEnErreur(Exception):
+    pass
+
+
+def centile(durees, p):
+    """
+    Centile `p` par la méthode du rang le plus proche (durees triées).
+    """
+    if not durees:
+        return None
+    return durees[max(math.ceil(p / 100 * len(durees)) - 1, 0)]
+
+
+def resume(mesures):
+    etapes = {}
+    for etape in ETAPES:
+        durees = sorted(mesures.durees[etape])
+        total = len(durees) + mesures.erreurs[etape]
+        etapes[etape] = {
+            'appels': total,
+            'erreurs': mesures.erreurs[etape],
+            'taux_erreur': round(mesures.erreurs[etape] / total, 4) if total else 0.0,
+            **{
+                f'p{p}_ms': None if not durees else round(centile(durees, p) * 1000, 2)
+                for p in CENTILES
+            },
+            'moyenne_ms': round(sum(durees) / len(durees) * 1000, 2) if durees else None,
+        }
+        if etape in mesures.exemples:
+            etapes[etape]['exemple_erreur'] = mesures.exemples[etape]
+    return etapes
+
+
+class _GestionnaireSilencieux(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ServeurLocal:
+    """
+    L'application servie en HTTP dans un thread, sur un port libre.
+    """
+    def __init__(self, hote='127.0.0.1', port=0):
+        self.serveur = ThreadedWSGIServer((hote, port), _GestionnaireSilencieux, allow_reuse_address=False)
+        self.serveur.set_app(WSGIHandler())
+        self._thread = None
+
+    @property
+    def url(self):
+        hote, port = self.serveur.server_address[:2]
+        return f'http://{hote}:{port}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serveur.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+
+class TestDeCharge:
+    def __init__(self, options, journal=None):
+        self.options = options
+        self.journal = journal or (lambda message: None)
+        self.prefixe = f'charge{int(time.time())}_'
+        self.mot_de_passe = f'Charge-{self.prefixe}-secret'
+
+    # Préparation et nettoyage
+    # ---
+
+    def nombre_parcours(self, concurrence):
+        return max(self.options.parcours_par_palier, concurrence)
+
+    def preparer(self):
+        """
+        Programme de capacité suffisante et comptes de connexion (un seul
+        hachage du mot de passe).
+        """
+        nombre = sum(self.nombre_parcours(concurrence) for concurrence in self.options.paliers)
+        User = get_user_model()
+        mot_de_passe = make_password(self.mot_de_passe)
+        User.objects.bulk_create([
+            User(username=f'{self.prefixe}{numero}', password=mot_de_passe) for numero in range(nombre)
+        ] + [User(username=f'{self.prefixe}agent', password=mot_de_passe, is_staff=True)], batch_size=1000)
+        self.utilisateurs = dict(
+            User.objects.filter(username__startswith=self.prefixe).values_list('username', 'pk')
+        )
+        self.programme = Programme.objects.create(
+            nom_equipe1='Charge', nom_equipe2=self.prefixe, stadium='Local',
+            date=timezone.localdate() + datetime.timedelta(days=30), version='1', division='Charge',
+            prix_a=20, prix_b=10, capacite_a=nombre * 4, capacite_b=nombre * 4,
+            agent_id=self.utilisateurs[f'{self.prefixe}agent'],
+        )
+
+    def nettoyer(self, faux_stripe):
+        self.programme.delete()
+        get_user_model().objects.filter(username__startswith=self.prefixe).delete()
+        CustomUser.objects.filter(username__startswith=self.prefixe).delete()
+        if faux_stripe is not None:
+            EvenementStripe.objects.filter(
+                pk__in={identifiant for identifiant, _, _ in faux_stripe.livraisons}
+            ).delete()
+
+    # Parcours d'un spectateur virtuel
+    # ---
+
+    def _etape(self, mesures, etape, appel, attendu):
+        debut = time.perf_counter()
+        try:
+            reponse = appel()
+        except httpx.HTTPError as e:
+            erreur = f'{type(e).__name__}: {e}'
+        else:
+            if reponse.status_code == attendu:
+                mesures.noter(etape, time.perf_counter() - debut)
+                return reponse
+            erreur = f'HTTP {reponse.status_code}'
+        mesures.noter(etape, 0, erreur)
+        raise EtapeEnErreur(etape)
+
+    def parcours(self, mesures, numero, serveur):
+        hasard = random.Random(f'{self.options.graine}-{numero}')
+        nom = f'{self.prefixe}{numero}'
+        with httpx.Client(base_url=serveur.url, timeout=self.options.delai) as client:
+            def poster(url, donnees):
+                return client.post(url, data=donnees, headers={'X-CSRFToken': client.cookies.get('csrftoken', '')})
+
+            def inscription():
+                client.get(reverse('signup'))
+                return poster(reverse('signup'), {
+                    'username': nom, 'email': f'{nom}@example.com', 'first_name': 'Charge', 'last_name': str(numero),
+                    'password1': self.mot_de_passe, 'password2': self.mot_de_passe,
+                })
+
+            self._etape(mesures, 'inscription', inscription, 302)
+            self._etape(mesures, 'connexion', lambda: poster(reverse('login'), {
+                'username': nom, 'password': self.mot_de_passe,
+            }), 302)
+            self._etape(mesures, 'reservation', lambda: poster(
+                reverse('reservation_create', args=[self.programme.pk]),
+                {'type_reservation': hasard.choice('AB'), 'nombre_billet': hasard.randint(1, 4)},
+            ), 302)
+            # La page d'historique ne donne pas l'identifiant : lu en base.
+            reservation_id = Reservation.objects.filter(
+                spectateur_id=self.utilisateurs[nom]
+            ).values_list('pk', flat=True).order_by('-pk').first()
+            session = self._etape(mesures, 'paiement', lambda: client.get(
+                reverse('create_checkout_session', args=[reservation_id])
+            ), 302)
+            if hasard.random() < self.options.taux_abandon:
+                return
+            self._etape(mesures, 'reglement', lambda: httpx.get(
+                session.headers['Location'], timeout=self.options.delai
+            ), 303)
+        with mesures.verrou:
+            mesures.parcours_complets += 1
+
+    def palier(self, concurrence, premier, serveur, faux_stripe):
+        mesures = Mesures()
+        livraisons = len(faux_stripe.livraisons)
+
+        def lancer(numero):
+            try:
+                self.parcours(mesures, numero, serveur)
+            except EtapeEnErreur:
+                pass
+
+        nombre = self.nombre_parcours(concurrence)
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(concurrence) as executeur:
+            list(executeur.map(lancer, range(premier, premier + nombre)))
+        duree = time.perf_counter() - debut
+        for _, duree_livraison, statut in faux_stripe.livraisons[livraisons:]:
+            mesures.noter('webhook', duree_livraison, None if statut == 200 else f'HTTP {statut}')
+        self.journal(
+            f"Palier {concurrence} : {nombre} parcours en {duree:.1f} s, {mesures.parcours_complets} réglés"
+        )
+        return {
+            'concurrence': concurrence,
+            'parcours': nombre,
+            'parcours_regles': mesures.parcours_complets,
+            'duree_s': round(duree, 3),
+            'parcours_par_seconde': round(nombre / duree, 2),
+            'etapes': resume(mesures),
+        }
+
+    # Vérifications
+    # ---
+
+    def traiter_webhooks(self):
+        total = {'traites': 0, 'echecs': 0, 'abandonnes': 0}
+        while True:
+            resultat = webhooks.traiter_lot()
+            for cle in total:
+                total[cle] += resultat[cle]
+            if not resultat['traites'] and not resultat['abandonnes']:
+                return total
+
+    def invariants(self, faux_stripe):
+        reglees = {
+            int(session['metadata']['reservation_id'])
+            for session in faux_stripe.sessions.values()
+            if session['status'] == 'complete' and 'reservation_id' in session['metadata']
+        }
+        reservations = Reservation.objects.filter(programme=self.programme)
+        par_reservation = dict(
+            Paiement.objects.filter(reservation__programme=self.programme)
+            .values('reservation_id').annotate(nombre=Count('pk')).values_list('reservation_id', 'nombre')
+        )
+        sans_paiement = sorted(pk for pk in reglees if pk not in par_reservation)
+        en_double = sorted(pk for pk, nombre in par_reservation.items() if nombre > 1)
+        # Orphelins : payés sans règlement chez le fournisseur, ou rattachés à
+        # une réservation qui n'existe plus (toute la base).
+        non_regles = sorted(pk for pk in par_reservation if pk not in reglees)
+        detaches = Paiement.objects.filter(
+            ~Exists(Reservation.objects.filter(pk=OuterRef('reservation_id')))
+        ).count()
+
+        programme = Programme.objects.get(pk=self.programme.pk)
+        vendus = dict(
+            reservations.exclude(statut=Reservation.STATUT_EXPIREE).values('type_reservation').annotate(billets=Sum('nombre_billet'))
+            .values_list('type_reservation', 'billets')
+        )
+        inventaire = (
+            programme.capacite_a - programme.places_restantes_a == vendus.get('A', 0)
+            and programme.capacite_b - programme.places_restantes_b == vendus.get('B', 0)
+        )
+        ecarts = compteurs.recalculer(programme_ids=[programme.pk])
+        resultat = {
+            'reservations': reservations.count(),
+            'reservations_reglees': len(reglees),
+            'paiements': sum(par_reservation.values()),
+            'reglees_sans_paiement': sans_paiement,
+            'paiements_en_double': en_double,
+            'paiements_orphelins': non_regles,
+            'paiements_detaches': detaches,
+            'inventaire_coherent': inventaire,
+            'ecarts_compteurs': len(ecarts),
+        }
+        resultat['ok'] = not (sans_paiement or en_double or non_regles or detaches or ecarts) and inventaire
+        return resultat
+
+    # Exécution
+    # ---
+
+    def executer(self, conserver=False):
+        self.preparer()
+        faux_stripe = None
+        try:
+            with ServeurLocal() as serveur, FauxStripe(
+                latence=self.options.latence_stripe,
+                webhook_url=serveur.url + reverse('stripe_webhook'),
+                secret_webhook=SECRET_WEBHOOK,
+                taux_rejeu=self.options.taux_rejeu,
+                graine=self.options.graine,
+            ) as faux_stripe, override_settings(
+                STRIPE_API_BASE=faux_stripe.url,
+                STRIPE_WEBHOOK_SECRET=SECRET_WEBHOOK,
+                FILE_ATTENTE={'ACTIVE': False},
+                ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+            ):
+                paiements.reinitialiser()
+                paliers = []
+                premier = 0
+                for concurrence in self.options.paliers:
+                    paliers.append(self.palier(concurrence, premier, serveur, faux_stripe))
+                    premier += self.nombre_parcours(concurrence)
+                self.journal("Traitement des webhooks reçus...")
+                evenements = self.traiter_webhooks()
+                invariants = self.invariants(faux_stripe)
+        finally:
+            paiements.reinitialiser()
+            if not conserver:
+                self.nettoyer(faux_stripe)
+        return {
+            'date': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'base': connection.vendor,
+            'options': {
+                'paliers': list(self.options.paliers),
+                'parcours_par_palier': self.options.parcours_par_palier,
+                'taux_abandon': self.options.taux_abandon,
+                'taux_rejeu': self.options.taux_rejeu,
+                'latence_stripe': self.options.latence_stripe,
+                'graine': self.options.graine,
+            },
+            'paliers': paliers,
+            'webhooks': evenements,
+            'invariants': invariants,
+        }
@@ -0,0 +1,155 @@
+"""
+Compteurs de ventes par programme et par section (CompteurVentes).
+
+Chaque réservation créée ou supprimée et chaque paiement enregistré ou
+supprimé applique un delta par un UPDATE relatif (F()), dans la transaction
+de l'écriture d'origine : le compteur ne peut pas diverger d'une réservation
+annulée. Les écritures unitaires passent par les signaux (ticketing/signals.py),
+les écritures en masse (bulk_create) appellent directement ce module.
+
+recalculer() refait les agrégats depuis les réservations et les paiements,
+signale les écarts et peut les corriger (commande verifier_compteurs).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import CompteurVentes, Paiement, Reservation
+
+
+CHAMPS = ('billets_reserves', 'billets_payes', 'recette')
+
+
+def initialiser(programmes):
+    """
+    Crée les compteurs à zéro de nouveaux programmes : chaque vente n'est
+    ensuite qu'un UPDATE.
+    """
+    CompteurVentes.objects.bulk_create([
+        CompteurVentes(programme_id=programme.pk, section=section)
+        for programme in programmes
+        for section, _ in Reservation.SECTION_CHOICES
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+def _appliquer(deltas, creer=True):
+    """
+    Applique {(programme_id, section): {champ: delta}} : un UPDATE par couple.
+    Un compteur absent est créé (sauf pour un retrait : le programme est
+    peut-être en cours de suppression).
+    """
+    for (programme_id, section), valeurs in deltas.items():
+        valeurs = {champ: delta for champ, delta in valeurs.items() if delta}
+        if not valeurs:
+            continue
+        compteur = CompteurVentes.objects.filter(programme_id=programme_id, section=section)
+        mise_a_jour = {champ: F(champ) + delta for champ, delta in valeurs.items()}
+        if compteur.update(**mise_a_jour) or not creer:
+            continue
+        # Compteur absent (programme antérieur aux compteurs, section ajoutée) :
+        # la contrainte d'unicité arbitre deux créations concurrentes, puis le
+        # delta est appliqué normalement.
+        CompteurVentes.objects.bulk_create(
+            [CompteurVentes(programme_id=programme_id, section=section)], ignore_conflicts=True
+        )
+        compteur.update(**mise_a_jour)
+
+
+def reservations_ajoutees(reservations, signe=1):
+    """
+    Compte (signe=1) ou décompte (signe=-1) des réservations.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for reservation in reservations:
+        deltas[(reservation.programme_id, reservation.type_reservation)]['billets_reserves'] += signe * reservation.nombre_billet
+    _appliquer(deltas, creer=signe > 0)
+
+
+def paiements_ajoutes(paiements, signe=1):
+    """
+    Compte (signe=1) ou décompte (signe=-1) des paiements ; leur réservation
+    doit être chargée.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for paiement in paiements:
+        reservation = paiement.reservation
+        delta = deltas[(reservation.programme_id, reservation.type_reservation)]
+        delta['billets_payes'] += signe * reservation.nombre_billet
+        delta['recette'] += signe * paiement.montant
+    _appliquer(deltas, creer=signe > 0)
+
+
+def par_programme(programmes):
+    """
+    Attache à chaque programme ses compteurs par section
+    (programme.ventes = {'A': CompteurVentes, 'B': ...}) et sa recette totale
+    (programme.recette), en une requête.
+    """
+    ventes = defaultdict(dict)
+    for compteur in CompteurVentes.objects.filter(programme__in=[p.pk for p in programmes]):
+        ventes[compteur.programme_id][compteur.section] = compteur
+    for programme in programmes:
+        programme.ventes = ventes.get(programme.pk, {})
+        programme.recette = sum((compteur.recette for compteur in programme.ventes.values()), Decimal('0.00'))
+    return programmes
+
+
+def _agregats(programme_ids):
+    attendus = defaultdict(lambda: dict.fromkeys(CHAMPS, 0))
+    # Les places d'une réservation expirée ont été rendues.
+    reservations = Reservation.objects.exclude(statut=Reservation.STATUT_EXPIREE)
+    paiements = Paiement.objects.all()
+    if programme_ids is not None:
+        reservations = reservations.filter(programme__in=programme_ids)
+        paiements = paiements.filter(reservation__programme__in=programme_ids)
+    for ligne in reservations.values('programme_id', 'type_reservation').annotate(
+        billets=Sum('nombre_billet')
+    ).order_by():
+        attendus[(ligne['programme_id'], ligne['type_reservation'])]['billets_reserves'] = ligne['billets']
+    for ligne in paiements.values(
+        'reservation__programme_id', 'reservation__type_reservation'
+    ).annotate(billets=Sum('reservation__nombre_billet'), recette=Sum('montant')).order_by():
+        valeurs = attendus[(ligne['reservation__programme_id'], ligne['reservation__type_reservation'])]
+        valeurs['billets_payes'] = ligne['billets']
+        valeurs['recette'] = ligne['recette']
+    return attendus
+
+
+def recalculer(programme_ids=None, corriger=False):
+    """
+    Compare les compteurs aux agrégats des réservations et paiements.
+    Renvoie la liste des écarts [(programme_id, section, {champ: (compteur, attendu)})] ;
+    avec `corriger`, les compteurs sont réécrits.
+    """
+    with transaction.atomic():
+        attendus = _agregats(programme_ids)
+        compteurs = CompteurVentes.objects.select_for_update()
+        if programme_ids is not None:
+            compteurs = compteurs.filter(programme__in=programme_ids)
+        existants = {(c.programme_id, c.section): c for c in compteurs}
+
+        ecarts = []
+        a_creer, a_mettre_a_jour = [], []
+        for cle in sorted(set(attendus) | set(existants)):
+            valeurs = attendus.get(cle, dict.fromkeys(CHAMPS, 0))
+            compteur = existants.get(cle)
+            if compteur is None:
+                compteur = CompteurVentes(programme_id=cle[0], section=cle[1])
+            differences = {
+                champ: (getattr(compteur, champ), valeurs[champ])
+                for champ in CHAMPS
+                if Decimal(getattr(compteur, champ)) != Decimal(valeurs[champ])
+            }
+            if not differences:
+                continue
+            ecarts.append((cle[0], cle[1], differences))
+            for champ in CHAMPS:
+                setattr(compteur, champ, valeurs[champ])
+            (a_mettre_a_jour if compteur.pk else a_creer).append(compteur)
+
+        if corriger:
+            CompteurVentes.objects.bulk_create(a_creer)
+            CompteurVentes.objects.bulk_update(a_mettre_a_jour, CHAMPS)
+    return ecarts
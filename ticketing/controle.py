@@ -0,0 +1,341 @@
+"""
+Contrôle d'accès des billets électroniques (vue controle_scans).
+
+Chaque processus garde, par programme et par section, deux ensembles de bits
+indexés par le numéro de billet : les billets émis et les billets déjà
+utilisés (quelques kilo-octets pour un stade entier). Un passage se décide en
+mémoire : signature du code (ticketing/billets.py), bit « émis », bit
+« utilisé ». Seuls les billets émis depuis le chargement demandent une
+lecture en base, groupée pour tout le lot.
+
+Les lecteurs envoient leurs passages par lots (un seul, ou tout un journal
+à la reconnexion). Un lot est traité dans l'ordre (horodatage du lecteur,
+appareil, rang) quel que soit l'ordre d'envoi ; en base, le passage retenu
+pour un billet est toujours le plus ancien, quel que soit l'ordre d'arrivée
+des lots : le résultat ne dépend pas des délais de reconnexion.
+
+Les passages acceptés sont écrits en différé, par lots (TAILLE_LOT passages
+ou DELAI_ECRITURE secondes) : une lecture et un UPDATE groupé par section.
+Un arrêt brutal du processus perd au plus les passages non écrits ; les bits
+sont rechargés depuis la base au redémarrage.
+
+Les bits vivent dans la mémoire du processus : les passages d'un même
+programme doivent être servis par un seul processus (ou un routage par
+programme). Sinon, deux processus peuvent accepter le même billet ; la base
+ne retient alors que le premier passage. Une annulation de billets
+(paiement ou réservation supprimés) incrémente la version du programme dans
+le cache : chaque processus recharge alors ses bits.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import billets
+from .models import Billet
+
+
+CONFIGURATION_DEFAUT = {
+    # En-tête portant le jeton signé du lecteur (commande cle_controle).
+    'EN_TETE': 'X-Controle-Jeton',
+    # Validité d'un jeton, en secondes.
+    'DUREE_JETON': 2 * 24 * 3600,
+    # Passages en attente au-delà desquels on écrit en base.
+    'TAILLE_LOT': 500,
+    # Âge maximal d'un passage en attente, en secondes.
+    'DELAI_ECRITURE': 0.5,
+}
+
+SEL_JETON = 'ticketing.controle'
+PASSAGES_MAX = 5000
+
+VALIDE = 'valide'
+DEJA_UTILISE = 'deja_utilise'
+INVALIDE = 'invalide'
+
+
+def configuration():
+    return {**CONFIGURATION_DEFAUT, **getattr(settings, 'CONTROLE', {})}
+
+
+class RequeteInvalide(Exception):
+    """
+    Lot de passages mal formé (refusé en entier).
+    """
+
+
+# Jetons des lecteurs
+# ---
+
+def jeton(programme_id, appareil):
+    """
+    Jeton d'un lecteur de contrôle, à placer dans l'en-tête CONTROLE['EN_TETE']
+    (commande cle_controle --appareil).
+    """
+    return signing.dumps({'p': programme_id, 'a': appareil}, salt=SEL_JETON)
+
+
+def lire_jeton(valeur, programme_id):
+    """
+    Nom de l'appareil du jeton, ou None si le jeton est invalide, expiré ou
+    destiné à un autre programme.
+    """
+    try:
+        donnees = signing.loads(valeur or '', salt=SEL_JETON, max_age=configuration()['DUREE_JETON'])
+    except signing.BadSignature:
+        return None
+    if donnees.get('p') != programme_id:
+        return None
+    return donnees.get('a')
+
+
+# Ensembles de bits
+# ---
+
+def _lire_bit(bits, numero):
+    octet = numero >> 3
+    return octet < len(bits) and bool(bits[octet] & (1 << (numero & 7)))
+
+
+def _ecrire_bit(bits, numero):
+    octet = numero >> 3
+    if octet >= len(bits):
+        bits.extend(bytes(octet - len(bits) + 1 + len(bits) // 2))
+    bits[octet] |= 1 << (numero & 7)
+
+
+class EtatProgramme:
+    """
+    Bits des billets émis et utilisés d'un programme, par section.
+    """
+    def __init__(self, programme_id, version):
+        self.programme_id = programme_id
+        self.version = version
+        self.cle = billets.cle_programme(programme_id)
+        self.emis = defaultdict(bytearray)
+        self.utilises = defaultdict(bytearray)
+        self.verrou = threading.Lock()
+
+    def charger(self):
+        lignes = Billet.objects.using(DEFAULT_DB_ALIAS).filter(programme_id=self.programme_id).values_list(
+            'section', 'numero', 'utilise_le',
+        )
+        for section, numero, utilise_le in lignes.iterator(chunk_size=5000):
+            self.marquer(section, numero, utilise_le)
+        return self
+
+    def marquer(self, section, numero, utilise_le):
+        _ecrire_bit(self.emis[section], numero)
+        if utilise_le is not None:
+            _ecrire_bit(self.utilises[section], numero)
+
+    def emis_inconnus(self, contenus):
+        """
+        Lit en une requête par section les billets émis depuis le chargement
+        parmi `contenus`.
+        """
+        inconnus = defaultdict(set)
+        with self.verrou:
+            for contenu in contenus:
+                if not _lire_bit(self.emis[contenu.section], contenu.numero):
+                    inconnus[contenu.section].add(contenu.numero)
+        for section, numeros in inconnus.items():
+            lignes = list(Billet.objects.using(DEFAULT_DB_ALIAS).filter(
+                programme_id=self.programme_id, section=section, numero__in=numeros,
+            ).values_list('numero', 'utilise_le'))
+            with self.verrou:
+                for numero, utilise_le in lignes:
+                    self.marquer(section, numero, utilise_le)
+
+
+_etats = {}
+_verrou_etats = threading.Lock()
+
+
+def _cle_version(programme_id):
+    return f'controle:version:{programme_id}'
+
+
+def revoquer(programme_id):
+    """
+    Des billets du programme ont été annulés : tous les processus rechargent
+    leurs bits au prochain lot.
+    """
+    # Une valeur jamais vue (horloge) : seule l'égalité compte, et une clé
+    # évincée puis recréée ne redonne pas une ancienne version.
+    cache.set(_cle_version(programme_id), time.time_ns(), timeout=None)
+
+
+def etat(programme_id):
+    version = cache.get(_cle_version(programme_id), 0)
+    with _verrou_etats:
+        courant = _etats.get(programme_id)
+        if courant is not None and courant.version == version:
+            return courant
+    if courant is not None:
+        # Les passages en attente doivent être en base avant le rechargement.
+        vider()
+    # Chargement hors du verrou global : les autres programmes restent servis.
+    courant = EtatProgramme(programme_id, version).charger()
+    with _verrou_etats:
+        _etats[programme_id] = courant
+    return courant
+
+
+def reinitialiser():
+    with _verrou_etats:
+        _etats.clear()
+    with _verrou_tampon:
+        _tampon.clear()
+
+
+# Écriture différée des passages
+# ---
+
+@dataclass(frozen=True)
+class Passage:
+    programme_id: int
+    section: str
+    numero: int
+    horodatage: object
+    appareil: str
+
+    @property
+    def ordre(self):
+        return (self.horodatage, self.appareil)
+
+
+_tampon = []
+_verrou_tampon = threading.Lock()
+_derniere_ecriture = [time.monotonic()]
+
+
+def _ajouter(passages):
+    config = configuration()
+    with _verrou_tampon:
+        premier = not _tampon
+        _tampon.extend(passages)
+        a_ecrire = (
+            len(_tampon) >= config['TAILLE_LOT']
+            or (_tampon and time.monotonic() - _derniere_ecriture[0] >= config['DELAI_ECRITURE'])
+        )
+    if a_ecrire:
+        vider()
+    elif premier and passages:
+        # Écriture garantie même si les lecteurs se taisent.
+        minuterie = threading.Timer(config['DELAI_ECRITURE'], _vider_en_arriere_plan)
+        minuterie.daemon = True
+        minuterie.start()
+
+
+def _vider_en_arriere_plan():
+    try:
+        vider()
+    finally:
+        connections.close_all()
+
+
+def vider():
+    """
+    Écrit les passages en attente ; renvoie le nombre de billets mis à jour.
+    """
+    with _verrou_tampon:
+        passages = list(_tampon)
+        _tampon.clear()
+        _derniere_ecriture[0] = time.monotonic()
+    if not passages:
+        return 0
+    premiers = {}
+    for passage in passages:
+        cle = (passage.programme_id, passage.section, passage.numero)
+        if cle not in premiers or passage.ordre < premiers[cle].ordre:
+            premiers[cle] = passage
+    par_section = defaultdict(dict)
+    for (programme_id, section, numero), passage in premiers.items():
+        par_section[(programme_id, section)][numero] = passage
+
+    modifies = []
+    with transaction.atomic():
+        for (programme_id, section), par_numero in sorted(par_section.items()):
+            for billet in Billet.objects.select_for_update().filter(
+                programme_id=programme_id, section=section, numero__in=par_numero,
+            ).only('numero', 'utilise_le', 'appareil'):
+                passage = par_numero[billet.numero]
+                # Le plus ancien passage l'emporte, quel que soit l'ordre d'arrivée.
+                if billet.utilise_le is None or passage.ordre < (billet.utilise_le, billet.appareil):
+                    billet.utilise_le, billet.appareil = passage.horodatage, passage.appareil
+                    modifies.append(billet)
+        Billet.objects.bulk_update(modifies, ['utilise_le', 'appareil'], batch_size=1000)
+    return len(modifies)
+
+
+atexit.register(vider)
+
+
+# Lots de passages
+# ---
+
+def _horodatage(valeur, maintenant):
+    if valeur is None:
+        return maintenant
+    horodatage = parse_datetime(valeur) if isinstance(valeur, str) else None
+    if horodatage is None or timezone.is_naive(horodatage):
+        raise RequeteInvalide(f"Horodatage invalide : {valeur!r}")
+    # Un lecteur dont l'horloge avance ne passe pas devant les autres.
+    return min(horodatage, maintenant)
+
+
+def traiter(programme_id, appareil, scans):
+    """
+    Traite un lot de passages [{'code': ..., 'horodatage': ISO 8601}] d'un
+    appareil ; renvoie un résultat par passage, dans l'ordre du lot.
+    """
+    if not isinstance(scans, list) or len(scans) > PASSAGES_MAX:
+        raise RequeteInvalide(f"Liste d'au plus {PASSAGES_MAX} passages attendue.")
+    maintenant = timezone.now()
+    lus = []
+    for rang, scan in enumerate(scans):
+        if not isinstance(scan, dict) or not isinstance(scan.get('code'), str):
+            raise RequeteInvalide(f"Passage {rang} sans code.")
+        lus.append((_horodatage(scan.get('horodatage'), maintenant), rang, scan['code']))
+
+    etat_programme = etat(programme_id)
+    contenus = {}
+    for _, rang, code in lus:
+        try:
+            contenu = billets.verifier(code, etat_programme.cle)
+        except billets.BilletInvalide:
+            contenu = None
+        # La clé est propre au programme : un billet d'un autre match ne
+        # passe pas la signature, sauf falsification.
+        contenus[rang] = contenu if contenu and contenu.programme_id == programme_id else None
+    etat_programme.emis_inconnus(contenu for contenu in contenus.values() if contenu)
+
+    resultats = [None] * len(lus)
+    acceptes = []
+    with etat_programme.verrou:
+        for horodatage, rang, code in sorted(lus, key=lambda lu: (lu[0], lu[1])):
+            contenu = contenus[rang]
+            if contenu is None or not _lire_bit(etat_programme.emis[contenu.section], contenu.numero):
+                statut = INVALIDE
+            elif _lire_bit(etat_programme.utilises[contenu.section], contenu.numero):
+                statut = DEJA_UTILISE
+            else:
+                statut = VALIDE
+                _ecrire_bit(etat_programme.utilises[contenu.section], contenu.numero)
+            if statut in (VALIDE, DEJA_UTILISE):
+                # Un passage refusé compte aussi : il peut être le plus ancien.
+                acceptes.append(Passage(programme_id, contenu.section, contenu.numero, horodatage, appareil))
+            resultats[rang] = {'code': code, 'statut': statut}
+            if statut != INVALIDE:
+                resultats[rang].update(section=contenu.section, numero=contenu.numero)
+    _ajouter(acceptes)
+    return resultats
@@ -0,0 +1,117 @@
+"""
+Cumuls journaliers des ventes (CumulJournalier) pour les rapports de saison.
+
+cumuler() agrège les réservations et paiements d'une plage de jours en deux
+GROUP BY (jour, division, stade) puis remplace les cumuls de ces jours : le
+calcul est idempotent et peut être rejoué sur n'importe quelle plage
+(rattrapage, correction après suppression de ventes). Sans plage, seuls les
+jours clos depuis le dernier cumul sont traités.
+
+rapport() ne lit que les cumuls : sa durée dépend du nombre de jours et de
+stades, pas du nombre de réservations.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import CumulJournalier, Paiement, Reservation
+
+
+CHAMPS = ('reservations', 'billets_reserves', 'paiements', 'billets_payes', 'recette')
+
+GROUPEMENTS = {
+    'jour': F('jour'),
+    'mois': TruncMonth('jour'),
+    'annee': TruncYear('jour'),
+}
+
+
+def dernier_jour_clos():
+    """
+    Veille de la date courante : la journée en cours n'est pas encore cumulée.
+    """
+    return timezone.localdate() - datetime.timedelta(days=1)
+
+
+def dernier_cumul():
+    return CumulJournalier.objects.aggregate(dernier=Max('jour'))['dernier']
+
+
+def plage_incrementale():
+    """
+    Jours à traiter depuis le dernier cumul, ou None si tout est à jour.
+    Le dernier jour déjà cumulé est retraité : une exécution pendant cette
+    journée ne l'avait peut-être vu que partiellement.
+    """
+    fin = dernier_jour_clos()
+    dernier = dernier_cumul()
+    if dernier is not None:
+        debut = dernier
+    else:
+        premiers = [
+            Reservation.objects.aggregate(jour=Min('date_reservation'))['jour'],
+            Paiement.objects.aggregate(jour=Min('date_paiement'))['jour'],
+        ]
+        premiers = [jour for jour in premiers if jour is not None]
+        if not premiers:
+            return None
+        debut = min(premiers)
+    if debut > fin:
+        return None
+    return debut, fin
+
+
+def cumuler(debut, fin):
+    """
+    Recalcule les cumuls des jours debut..fin inclus. Renvoie le nombre de
+    lignes de cumul écrites.
+    """
+    with transaction.atomic():
+        cumuls = defaultdict(lambda: dict.fromkeys(CHAMPS, 0))
+        for ligne in Reservation.objects.filter(date_reservation__range=(debut, fin)).values(
+            'date_reservation', 'programme__division', 'programme__stadium'
+        ).annotate(nombre=Count('pk'), billets=Sum('nombre_billet')).order_by():
+            valeurs = cumuls[(ligne['date_reservation'], ligne['programme__division'], ligne['programme__stadium'])]
+            valeurs['reservations'] = ligne['nombre']
+            valeurs['billets_reserves'] = ligne['billets']
+        for ligne in Paiement.objects.filter(date_paiement__range=(debut, fin)).values(
+            'date_paiement', 'reservation__programme__division', 'reservation__programme__stadium'
+        ).annotate(
+            nombre=Count('pk'), billets=Sum('reservation__nombre_billet'), recette=Sum('montant')
+        ).order_by():
+            valeurs = cumuls[(
+                ligne['date_paiement'], ligne['reservation__programme__division'], ligne['reservation__programme__stadium']
+            )]
+            valeurs['paiements'] = ligne['nombre']
+            valeurs['billets_payes'] = ligne['billets']
+            valeurs['recette'] = ligne['recette']
+
+        CumulJournalier.objects.filter(jour__range=(debut, fin)).delete()
+        CumulJournalier.objects.bulk_create([
+            CumulJournalier(jour=jour, division=division, stadium=stadium, **valeurs)
+            for (jour, division, stadium), valeurs in cumuls.items()
+        ], batch_size=1000)
+    return len(cumuls)
+
+
+def rapport(par='jour', date_debut=None, date_fin=None, division=None, stadium=None):
+    """
+    Ventes regroupées par période (`par` : jour, mois ou annee), division et
+    stade, lues dans les cumuls. Les totaux sont préfixés par total_.
+    """
+    cumuls = CumulJournalier.objects.all()
+    if date_debut:
+        cumuls = cumuls.filter(jour__gte=date_debut)
+    if date_fin:
+        cumuls = cumuls.filter(jour__lte=date_fin)
+    if division:
+        cumuls = cumuls.filter(division=division)
+    if stadium:
+        cumuls = cumuls.filter(stadium=stadium)
+    return cumuls.annotate(periode=GROUPEMENTS[par]).values('periode', 'division', 'stadium').annotate(
+        **{f'total_{champ}': Sum(champ) for champ in CHAMPS}
+    ).order_by('-periode', 'division', 'stadium')
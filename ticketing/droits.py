@@ -0,0 +1,154 @@
+"""
+Instantané des droits d'un utilisateur, gardé dans le cache.
+
+Un instantané réunit les rôles (agent, spectateur, staff, superuser) et les
+permissions (propres et héritées des groupes) d'un utilisateur. Il est
+calculé une fois (deux requêtes SQL) puis relu depuis le cache par
+BackendUtilisateursCache.get_all_permissions : permission_required et
+user.has_perm ne touchent plus la base. role_requis vérifie un rôle de la
+même façon.
+
+Invalidation (ticketing/signals.py) :
+
+- un utilisateur (ou son CustomUser) est modifié ou supprimé : son entrée est
+  effacée ;
+- les groupes, les permissions ou leurs associations changent : la version
+  globale est incrémentée, ce qui rend obsolètes tous les instantanés sans
+  avoir à les énumérer (comme ticketing/cache_programmes.py).
+
+Les permissions sont lues sur les tables de auth.User : les requêtes de
+ModelBackend (group__user, user) aboutissent aux tables de CustomUser, qui
+revendique les mêmes noms de relation inverse.
+"""
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from .models import CustomUser
+
+
+CLE_VERSION = 'droits:version'
+ROLES = ('agent', 'spectateur', 'staff', 'superuser')
+
+
+@dataclass(frozen=True)
+class Droits:
+    utilisateur: int
+    agent: bool
+    spectateur: bool
+    staff: bool
+    superuser: bool
+    permissions: frozenset
+
+    def a_le_role(self, role):
+        return getattr(self, role)
+
+
+def _duree():
+    return getattr(settings, 'CACHE_DROITS_DUREE', 300)
+
+
+def version():
+    numero = cache.get(CLE_VERSION)
+    if numero is None:
+        # Depuis l'horloge : si la clé est évincée, la nouvelle version reste
+        # supérieure aux précédentes.
+        cache.add(CLE_VERSION, int(time.time() * 1000), timeout=None)
+        numero = cache.get(CLE_VERSION)
+    return numero
+
+
+def invalider():
+    try:
+        cache.incr(CLE_VERSION)
+    except ValueError:
+        version()
+
+
+def cle(username):
+    return f'droits:{version()}:{username}'
+
+
+def oublier(username):
+    cache.delete(cle(username))
+
+
+def calculer(utilisateur):
+    """
+    Instantané lu sur la base principale (la copie d'un réplica en retard
+    resterait en cache).
+    """
+    User = get_user_model()
+    profil = CustomUser.objects.using(DEFAULT_DB_ALIAS).filter(username=utilisateur.username).values(
+        'is_agent', 'is_spectateur',
+    ).first()
+    agent = utilisateur.is_staff or bool(profil and profil['is_agent'])
+    spectateur = profil['is_spectateur'] if profil else not agent
+
+    permissions = Permission.objects.using(DEFAULT_DB_ALIAS)
+    if not utilisateur.is_superuser:
+        groupes = User.groups.through.objects.filter(user_id=utilisateur.pk).values('group_id')
+        permissions = permissions.filter(
+            Q(pk__in=User.user_permissions.through.objects.filter(user_id=utilisateur.pk).values('permission_id'))
+            | Q(pk__in=Group.permissions.through.objects.filter(group_id__in=groupes).values('permission_id'))
+        )
+    return Droits(
+        utilisateur=utilisateur.pk,
+        agent=agent,
+        spectateur=spectateur,
+        staff=utilisateur.is_staff,
+        superuser=utilisateur.is_superuser,
+        permissions=frozenset(
+            f'{app_label}.{codename}'
+            for app_label, codename in permissions.values_list('content_type__app_label', 'codename')
+        ),
+    )
+
+
+def droits(utilisateur):
+    """
+    Instantané de `utilisateur` (authentifié), gardé aussi sur l'objet pour
+    le reste de la requête.
+    """
+    instantane = getattr(utilisateur, '_droits', None)
+    if instantane is not None:
+        return instantane
+    cle_droits = cle(utilisateur.username)
+    instantane = cache.get(cle_droits)
+    # Un nom d'utilisateur renommé puis repris désigne un autre compte.
+    if instantane is None or instantane.utilisateur != utilisateur.pk:
+        instantane = calculer(utilisateur)
+        cache.set(cle_droits, instantane, _duree())
+    utilisateur._droits = instantane
+    return instantane
+
+
+def role_requis(*roles):
+    """
+    Décorateur de vue : l'utilisateur doit être connecté, actif et avoir l'un
+    des `roles` (voir ROLES), sinon 403. Lu dans l'instantané, sans SQL.
+    """
+    for role in roles:
+        if role not in ROLES:
+            raise ValueError(f"Rôle inconnu : {role!r}")
+
+    def decorateur(vue):
+        @wraps(vue)
+        def verifier(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            instantane = droits(request.user)
+            if not request.user.is_active or not any(instantane.a_le_role(role) for role in roles):
+                raise PermissionDenied
+            return vue(request, *args, **kwargs)
+        return verifier
+    return decorateur
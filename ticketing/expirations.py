@@ -0,0 +1,126 @@
+"""
+Options sur les réservations en ligne.
+
+Une réservation créée par un spectateur (reservation_create, réservation de
+groupe) retire ses places de l'inventaire mais reste une option
+(STATUT_EN_ATTENTE) jusqu'à `expire_le` :
+
+- son paiement la confirme (signal de Paiement, webhook de groupe) ;
+- sinon expirer() la passe en STATUT_EXPIREE et rend ses places
+  (commande expirer_reservations, lancée périodiquement), mais jamais tant
+  que sa session Stripe est encore ouverte : Stripe impose au moins
+  30 minutes à une session, qui peut donc survivre à l'option.
+
+Les réservations saisies par un agent sont confirmées dès leur création.
+
+expirer() lit les options échues par lots sur l'index partiel
+reservation_option_expire_idx (limité aux options en cours : l'historique
+n'est jamais parcouru), puis, par lot, un UPDATE des statuts et un UPDATE
+relatif de l'inventaire et des compteurs par couple programme/section.
+
+Un paiement qui arrive malgré tout après l'expiration (webhook en retard)
+confirme quand même la réservation : ses places sont reprises si
+l'inventaire le permet, sinon le dépassement est journalisé.
+"""
+import datetime
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import compteurs
+from .inventory import PlacesInsuffisantes, liberer_places, reserver_places
+from .models import Reservation
+
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 1000
+
+
+def duree():
+    return datetime.timedelta(seconds=getattr(settings, 'RESERVATION_DUREE_OPTION', 45 * 60))
+
+
+def echeance(maintenant=None):
+    """
+    Fin de l'option d'une réservation créée maintenant.
+    """
+    return (maintenant or timezone.now()) + duree()
+
+
+def a_expirer(maintenant=None):
+    maintenant = maintenant or timezone.now()
+    # Le filtre sur statut reprend la condition de l'index partiel ; une
+    # session Stripe encore payable retient l'option jusqu'à sa fin.
+    return Reservation.objects.filter(
+        Q(stripe_session_expire__isnull=True) | Q(stripe_session_expire__lte=maintenant),
+        statut=Reservation.STATUT_EN_ATTENTE, expire_le__lte=maintenant,
+    )
+
+
+def _expirer_lot(taille, maintenant):
+    with transaction.atomic():
+        # skip_locked : plusieurs balayeurs (ou un paiement en cours) ne se
+        # disputent pas les mêmes lignes (ignoré par SQLite).
+        lot = list(
+            a_expirer(maintenant).select_for_update(skip_locked=True)
+            .order_by('expire_le').only('programme_id', 'type_reservation', 'nombre_billet')[:taille]
+        )
+        if not lot:
+            return 0
+        Reservation.objects.filter(pk__in=[r.pk for r in lot]).update(statut=Reservation.STATUT_EXPIREE)
+        places = defaultdict(int)
+        for reservation in lot:
+            places[(reservation.programme_id, reservation.type_reservation)] += reservation.nombre_billet
+        # Ordre fixe : deux balayeurs verrouillent les programmes dans le même ordre.
+        for (programme_id, section), nombre in sorted(places.items()):
+            liberer_places(programme_id, section, nombre)
+        compteurs.reservations_ajoutees(lot, signe=-1)
+        return len(lot)
+
+
+def expirer(taille=TAILLE_LOT, maintenant=None):
+    """
+    Expire les options échues par lots (une transaction par lot) ; renvoie
+    le nombre de réservations expirées.
+    """
+    maintenant = maintenant or timezone.now()
+    total = 0
+    while True:
+        nombre = _expirer_lot(taille, maintenant)
+        total += nombre
+        if nombre < taille:
+            return total
+
+
+def confirmer(reservations):
+    """
+    Confirme les `reservations` payées (dans la transaction du paiement).
+    """
+    a_confirmer = [r for r in reservations if r.statut != Reservation.STATUT_CONFIRMEE]
+    if not a_confirmer:
+        return
+    expirees = list(
+        Reservation.objects.select_for_update().filter(
+            pk__in=[r.pk for r in a_confirmer], statut=Reservation.STATUT_EXPIREE,
+        ).only('programme_id', 'type_reservation', 'nombre_billet')
+    )
+    Reservation.objects.filter(pk__in=[r.pk for r in a_confirmer]).update(
+        statut=Reservation.STATUT_CONFIRMEE, expire_le=None,
+    )
+    for reservation in a_confirmer:
+        reservation.statut, reservation.expire_le = Reservation.STATUT_CONFIRMEE, None
+    # Payée après son expiration : les places rendues sont reprises.
+    for reservation in expirees:
+        try:
+            reserver_places(reservation.programme_id, reservation.type_reservation, reservation.nombre_billet)
+        except PlacesInsuffisantes:
+            logger.error(
+                "Réservation %s payée après expiration : section %s complète, %s place(s) en dépassement.",
+                reservation.pk, reservation.type_reservation, reservation.nombre_billet,
+            )
+    compteurs.reservations_ajoutees(expirees)
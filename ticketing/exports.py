@@ -0,0 +1,115 @@
+"""
+Exports en flux (CSV ou NDJSON) des réservations et des paiements.
+
+Les lignes sont lues par paquets (QuerySet.iterator, curseur côté serveur sur
+PostgreSQL) sous forme de tuples, puis sérialisées au fil de l'eau : la
+mémoire utilisée reste constante et les premiers octets partent tout de suite,
+quelle que soit la taille de l'export.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Paiement, Reservation
+
+
+TAILLE_PAQUET = 2000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (nom de colonne, chemin ORM)
+COLONNES_RESERVATIONS = [
+    ('id_reservation', 'id_reservation'),
+    ('date_reservation', 'date_reservation'),
+    ('section', 'type_reservation'),
+    ('nombre_billet', 'nombre_billet'),
+    ('spectateur', 'spectateur__username'),
+    ('spectateur_email', 'spectateur__email'),
+    ('id_programme', 'programme_id'),
+    ('equipe1', 'programme__nom_equipe1'),
+    ('equipe2', 'programme__nom_equipe2'),
+    ('stadium', 'programme__stadium'),
+    ('date_programme', 'programme__date'),
+    ('division', 'programme__division'),
+]
+
+COLONNES_PAIEMENTS = [
+    ('id_paiement', 'id_paiement'),
+    ('date_paiement', 'date_paiement'),
+    ('montant', 'montant'),
+    ('mode_paiement', 'mode_paiement'),
+    ('id_reservation', 'reservation_id'),
+    ('section', 'reservation__type_reservation'),
+    ('nombre_billet', 'reservation__nombre_billet'),
+    ('spectateur', 'reservation__spectateur__username'),
+    ('spectateur_email', 'reservation__spectateur__email'),
+    ('id_programme', 'reservation__programme_id'),
+    ('equipe1', 'reservation__programme__nom_equipe1'),
+    ('equipe2', 'reservation__programme__nom_equipe2'),
+    ('stadium', 'reservation__programme__stadium'),
+    ('date_programme', 'reservation__programme__date'),
+    ('division', 'reservation__programme__division'),
+]
+
+# modèle, colonnes, (champ date, champ programme, champ section) pour FiltreVentesForm
+EXPORTS = {
+    'reservations': (Reservation, COLONNES_RESERVATIONS, ('date_reservation', 'programme', 'type_reservation')),
+    'paiements': (Paiement, COLONNES_PAIEMENTS, ('date_paiement', 'reservation__programme', 'reservation__type_reservation')),
+}
+
+
+def lignes(nom, filtres):
+    """
+    Renvoie (noms de colonnes, itérateur de tuples) pour l'export `nom`,
+    filtré par un FiltreVentesForm.
+    """
+    modele, colonnes, champs_filtres = EXPORTS[nom]
+    queryset = filtres.filtrer(modele.objects.all(), *champs_filtres)
+    champ_date = champs_filtres[0]
+    queryset = queryset.order_by(champ_date, modele._meta.pk.name).values_list(
+        *[chemin for _, chemin in colonnes]
+    )
+    return [nom_colonne for nom_colonne, _ in colonnes], queryset.iterator(chunk_size=TAILLE_PAQUET)
+
+
+def _vider(tampon):
+    contenu = tampon.getvalue()
+    tampon.seek(0)
+    tampon.truncate()
+    return contenu
+
+
+# Les lignes sont regroupées en blocs de TAILLE_PAQUET pour éviter un appel au
+# serveur WSGI par ligne ; la première ligne part seule, sans attendre le bloc.
+
+def flux_csv(entetes, rangees):
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    writer.writerow(entetes)
+    for numero, rangee in enumerate(rangees, start=1):
+        writer.writerow(rangee)
+        if numero == 1 or numero % TAILLE_PAQUET == 0:
+            yield _vider(tampon)
+    yield _vider(tampon)
+
+
+def flux_ndjson(entetes, rangees):
+    tampon = io.StringIO()
+    encodeur = DjangoJSONEncoder()
+    for numero, rangee in enumerate(rangees, start=1):
+        tampon.write(encodeur.encode(dict(zip(entetes, rangee))))
+        tampon.write('\n')
+        if numero == 1 or numero % TAILLE_PAQUET == 0:
+            yield _vider(tampon)
+    yield _vider(tampon)
+
+
+def flux(nom, format_export, filtres):
+    entetes, rangees = lignes(nom, filtres)
+    if format_export == 'ndjson':
+        return flux_ndjson(entetes, rangees)
+    return flux_csv(entetes, rangees)
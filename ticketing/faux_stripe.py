@@ -0,0 +1,212 @@
+"""
+Faux serveur Stripe local, pour les tests et les bancs d'essai.
+
+Il répond à la création de sessions de paiement (POST /v1/checkout/sessions)
+comme l'API Stripe, avec une latence configurable pour simuler un fournisseur
+lent. Les vues l'utilisent dès que STRIPE_API_BASE pointe vers lui.
+
+Avec une URL de webhook, visiter l'URL d'une session (GET /pay/<id>) la règle :
+l'événement checkout.session.completed, signé comme le fait Stripe
+(en-tête Stripe-Signature), est envoyé au webhook avant la redirection vers
+success_url. Une part des événements peut être renvoyée une seconde fois,
+comme les rejeux de Stripe.
+"""
+import hashlib
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def signature(payload, secret, horodatage=None):
+    """
+    Valeur de l'en-tête Stripe-Signature d'un payload (octets).
+    """
+    horodatage = int(time.time()) if horodatage is None else horodatage
+    signe = hmac.new(secret.encode(), f'{horodatage}.'.encode() + payload, hashlib.sha256).hexdigest()
+    return f't={horodatage},v1={signe}'
+
+
+class _Gestionnaire(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _repondre(self, statut, corps):
+        contenu = json.dumps(corps).encode()
+        self.send_response(statut)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    def do_POST(self):
+        longueur = int(self.headers.get('Content-Length') or 0)
+        donnees = dict(parse_qsl(self.rfile.read(longueur).decode()))
+        if self.path.rstrip('/') != '/v1/checkout/sessions':
+            self._repondre(404, {'error': {'message': 'Ressource inconnue', 'type': 'invalid_request_error'}})
+            return
+        session = self.server.creer_session(donnees, self.headers.get('Idempotency-Key'))
+        # Comme chez un vrai fournisseur lent, la session existe déjà quand la
+        # réponse tarde.
+        if self.server.latence:
+            time.sleep(self.server.latence)
+        self._repondre(200, session)
+
+    def do_GET(self):
+        correspondance = re.fullmatch(r'/pay/(cs_test_\w+)', self.path)
+        session = self.server.regler(correspondance.group(1)) if correspondance else None
+        if session is None:
+            self._repondre(404, {'error': {'message': 'Session inconnue', 'type': 'invalid_request_error'}})
+            return
+        self.send_response(303)
+        self.send_header('Location', session['success_url'] or '/')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class FauxStripe(ThreadingHTTPServer):
+    """
+    Serveur HTTP qui tourne dans un thread :
+
+        with FauxStripe(latence=0.2) as serveur:
+            settings.STRIPE_API_BASE = serveur.url
+
+    Chaque envoi au webhook est noté dans `livraisons` (identifiant de
+    l'événement, durée, statut HTTP ; 0 si le webhook est injoignable).
+    """
+    daemon_threads = True
+
+    def __init__(self, latence=0.0, hote='127.0.0.1', port=0, webhook_url=None, secret_webhook='',
+                 taux_rejeu=0.0, graine=None):
+        super().__init__((hote, port), _Gestionnaire)
+        self.latence = latence
+        self.webhook_url = webhook_url
+        self.secret_webhook = secret_webhook
+        self.taux_rejeu = taux_rejeu
+        self.sessions = {}
+        self.idempotence = {}
+        self.livraisons = []
+        self._hasard = random.Random(graine)
+        self._verrou = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        hote, port = self.server_address[:2]
+        return f'http://{hote}:{port}'
+
+    def creer_session(self, donnees, cle_idempotence=None):
+        """
+        Construit une session à partir des paramètres encodés par le client
+        Stripe (line_items[0][price_data][unit_amount]=..., metadata[x]=...).
+        Une clé d'idempotence déjà vue renvoie la même session.
+        """
+        if cle_idempotence:
+            with self._verrou:
+                if cle_idempotence in self.idempotence:
+                    return self.sessions[self.idempotence[cle_idempotence]]
+        montant = 0
+        for cle, valeur in donnees.items():
+            correspondance = re.fullmatch(r'line_items\[(\d+)\]\[price_data\]\[unit_amount\]', cle)
+            if correspondance:
+                quantite = int(donnees.get(f'line_items[{correspondance.group(1)}][quantity]', 1))
+                montant += int(valeur) * quantite
+        metadata = {
+            cle[len('metadata['):-1]: valeur
+            for cle, valeur in donnees.items() if cle.startswith('metadata[')
+        }
+        identifiant = f'cs_test_{uuid.uuid4().hex}'
+        session = {
+            'id': identifiant,
+            'object': 'checkout.session',
+            'amount_total': montant,
+            'currency': donnees.get('line_items[0][price_data][currency]', 'usd'),
+            'metadata': metadata,
+            'mode': donnees.get('mode', 'payment'),
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'expires_at': int(donnees.get('expires_at') or time.time() + 24 * 3600),
+            'success_url': donnees.get('success_url'),
+            'cancel_url': donnees.get('cancel_url'),
+            'url': f'{self.url}/pay/{identifiant}',
+        }
+        with self._verrou:
+            if cle_idempotence:
+                # Deux requêtes simultanées : la première enregistrée l'emporte.
+                identifiant = self.idempotence.setdefault(cle_idempotence, identifiant)
+                if identifiant != session['id']:
+                    return self.sessions[identifiant]
+            self.sessions[identifiant] = session
+        return session
+
+    def regler(self, identifiant):
+        """
+        Marque la session payée et envoie l'événement au webhook (une seule
+        fois par session). Renvoie la session, ou None si elle est inconnue.
+        """
+        with self._verrou:
+            session = self.sessions.get(identifiant)
+            if session is None:
+                return None
+            deja_reglee = session['status'] == 'complete'
+            session.update(status='complete', payment_status='paid')
+            rejeu = self._hasard.random() < self.taux_rejeu
+        if self.webhook_url and not deja_reglee:
+            evenement = {
+                'id': f'evt_{uuid.uuid4().hex}',
+                'object': 'event',
+                'type': 'checkout.session.completed',
+                'created': int(time.time()),
+                'data': {'object': dict(session)},
+            }
+            payload = json.dumps(evenement).encode()
+            for _ in range(2 if rejeu else 1):
+                self.livrer(evenement['id'], payload)
+        return session
+
+    def livrer(self, identifiant, payload):
+        requete = urllib.request.Request(self.webhook_url, data=payload, method='POST', headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': signature(payload, self.secret_webhook),
+        })
+        debut = time.perf_counter()
+        try:
+            with urllib.request.urlopen(requete, timeout=10) as reponse:
+                statut = reponse.status
+        except urllib.error.HTTPError as e:
+            statut = e.code
+        except OSError:
+            statut = 0
+        with self._verrou:
+            self.livraisons.append((identifiant, time.perf_counter() - debut, statut))
+        return statut
+
+    def handle_error(self, request, client_address):
+        # Un client parti avant la réponse (délai dépassé) n'est pas une erreur.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def demarrer(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def arreter(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.demarrer()
+
+    def __exit__(self, *exc):
+        self.arreter()
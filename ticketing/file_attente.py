@@ -0,0 +1,164 @@
+"""
+Salle d'attente virtuelle devant les vues de mise en vente.
+
+Chaque visiteur reçoit un numéro d'ordre par portée (un programme pour
+reservation_create, la vue elle-même pour create_checkout_session). Le nombre
+de numéros admis progresse au plus à ADMISSIONS_PAR_SECONDE : la charge vue
+par la base reste constante quelle que soit la taille du pic.
+
+Tout l'état vit dans le cache Django (compteurs incrémentés atomiquement avec
+cache.incr) et dans un cookie signé : aucune requête SQL n'est faite pour
+placer un visiteur ou lui afficher sa position. En déploiement multi-processus,
+le cache doit être partagé (Redis, Memcached).
+"""
+import math
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CONFIGURATION_DEFAUT = {
+    'ACTIVE': True,
+    'ADMISSIONS_PAR_SECONDE': 20,
+    # Durée pendant laquelle un visiteur admis n'est plus mis en file (secondes).
+    'DUREE_ADMISSION': 15 * 60,
+    'VUES': ('reservation_create', 'create_checkout_session', 'create_checkout_session_async'),
+}
+
+PREFIXE_COOKIE = 'file_attente_'
+SEL_COOKIE = 'ticketing.file_attente'
+
+
+def configuration():
+    return {**CONFIGURATION_DEFAUT, **getattr(settings, 'FILE_ATTENTE', {})}
+
+
+@dataclass
+class Place:
+    """
+    Place d'un visiteur dans la file d'une portée.
+    """
+    portee: str
+    numero: int
+    position: int
+    attente_estimee: int
+    admis: bool
+
+    def as_dict(self):
+        return {
+            'portee': self.portee,
+            'numero': self.numero,
+            'position': self.position,
+            'attente_estimee': self.attente_estimee,
+            'admis': self.admis,
+        }
+
+
+def portee_pour_vue(url_name, view_kwargs):
+    """
+    Une file par programme quand la vue en désigne un, sinon une file par vue
+    (les variantes asynchrones partagent la file de la vue synchrone).
+    """
+    if 'programme_id' in view_kwargs:
+        return f"programme-{view_kwargs['programme_id']}"
+    return url_name.removesuffix('_async').replace('_', '-')
+
+
+def _cle(portee, nom):
+    return f'file_attente:{portee}:{nom}'
+
+
+def _prendre_numero(portee):
+    cle = _cle(portee, 'dernier')
+    cache.add(cle, 0, timeout=None)
+    try:
+        return cache.incr(cle)
+    except ValueError:
+        # Clé évincée entre add() et incr() : on repart de 1.
+        cache.add(cle, 1, timeout=None)
+        return 1
+
+
+def _nombre_admis(portee, maintenant, debit):
+    """
+    Fait avancer le curseur d'admission au rythme de `debit` numéros par
+    seconde, sans dépasser le dernier numéro distribué (seau à jetons).
+    Une file inactive n'accumule qu'une seconde de crédit : le pic suivant
+    n'est pas admis d'un bloc.
+
+    La lecture/écriture du curseur n'est pas atomique ; deux processus
+    concurrents peuvent au pire admettre un ou deux visiteurs de plus ou de
+    moins pendant une seconde, ce qui est acceptable ici.
+    """
+    dernier = cache.get(_cle(portee, 'dernier'), 0)
+    admis, depuis = cache.get(_cle(portee, 'admission'), (0, maintenant - 1))
+    depuis = max(depuis, maintenant - 1)
+    nouveau = min(dernier, admis + int((maintenant - depuis) * debit))
+    if nouveau > admis:
+        depuis += (nouveau - admis) / debit
+        cache.set(_cle(portee, 'admission'), (nouveau, depuis), timeout=None)
+    return max(nouveau, admis)
+
+
+def nom_cookie(portee):
+    return PREFIXE_COOKIE + portee
+
+
+def lire_numero(request, portee, max_age):
+    """
+    Renvoie (numero, admis) depuis le cookie signé du visiteur, ou (None, False).
+    """
+    valeur = request.get_signed_cookie(
+        nom_cookie(portee), default=None, salt=SEL_COOKIE, max_age=max_age
+    )
+    if not valeur:
+        return None, False
+    numero, _, etat = valeur.partition(':')
+    try:
+        return int(numero), etat == 'admis'
+    except ValueError:
+        return None, False
+
+
+def placer(request, portee):
+    """
+    Place le visiteur dans la file de `portee` (en lui attribuant un numéro
+    s'il n'en a pas) et renvoie (place, valeur_cookie). valeur_cookie vaut None
+    si le cookie du visiteur n'a pas à être réécrit.
+    """
+    config = configuration()
+    debit = max(1, int(config['ADMISSIONS_PAR_SECONDE']))
+    maintenant = time.time()
+
+    numero, deja_admis = lire_numero(request, portee, config['DUREE_ADMISSION'])
+    if numero is not None and deja_admis:
+        return Place(portee, numero, 0, 0, True), None
+
+    # Le cookie « en attente » reste valable longtemps : recharger la page ne
+    # fait pas perdre sa place.
+    # Une admission expirée, ou un numéro que le cache a oublié (vidage,
+    # éviction), renvoie en fin de file.
+    if numero is None:
+        numero, admission_expiree = lire_numero(request, portee, 24 * 3600)
+        if admission_expiree or (numero or 0) > cache.get(_cle(portee, 'dernier'), 0):
+            numero = None
+    valeur_cookie = None
+    if numero is None:
+        numero = _prendre_numero(portee)
+        valeur_cookie = str(numero)
+
+    admis = _nombre_admis(portee, maintenant, debit)
+    if numero <= admis:
+        return Place(portee, numero, 0, 0, True), f'{numero}:admis'
+
+    position = numero - admis
+    return Place(portee, numero, position, math.ceil(position / debit), False), valeur_cookie
+
+
+def ecrire_cookie(response, portee, valeur):
+    response.set_signed_cookie(
+        nom_cookie(portee), valeur, salt=SEL_COOKIE, max_age=24 * 3600,
+        httponly=True, samesite='Lax',
+    )
@@ -1,6 +1,29 @@
 from django import forms
+from django.urls import reverse
 from .models import CustomUser, Programme, Reservation, Paiement
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from . import suggestions
+
+# --- Widgets ---
+
+class SaisieAssistee(forms.Widget):
+    """
+    Champ de clé étrangère saisi par suggestions (vue suggestions) : la
+    valeur est dans un champ caché, le libellé dans un champ de recherche
+    alimenté à la frappe (script de base.html). Aucune liste n'est chargée au
+    rendu : seul le libellé de la valeur courante est lu, par sa clé.
+    """
+    template_name = 'ticket_app/widgets/saisie_assistee.html'
+
+    def __init__(self, entite, attrs=None):
+        super().__init__(attrs)
+        self.entite = entite
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['url'] = reverse('suggestions', args=[self.entite])
+        context['widget']['libelle'] = suggestions.libelle(self.entite, value) if value not in (None, '') else ''
+        return context
 
 # --- Formulaires pour les modèles ---
 
@@ -50,7 +73,8 @@ class ProgrammeForm(forms.ModelForm):
     """
     class Meta:
         model = Programme
-        fields = '__all__'
+        # Les places restantes sont gérées par l'inventaire, jamais par le formulaire.
+        exclude = ('places_restantes_a', 'places_restantes_b')
         widgets = {
             'nom_equipe1': forms.TextInput(attrs={'class': 'form-control'}),
             'nom_equipe2': forms.TextInput(attrs={'class': 'form-control'}),
@@ -60,15 +84,30 @@ class ProgrammeForm(forms.ModelForm):
             'division': forms.TextInput(attrs={'class': 'form-control'}),
             'prix_a': forms.NumberInput(attrs={'class': 'form-control'}),
             'prix_b': forms.NumberInput(attrs={'class': 'form-control'}),
-            # Pour le champ agent, nous utilisons un champ texte pour le datalist
+            'capacite_a': forms.NumberInput(attrs={'class': 'form-control'}),
+            'capacite_b': forms.NumberInput(attrs={'class': 'form-control'}),
+            'agent': SaisieAssistee('agents', attrs={'class': 'form-control', 'placeholder': "Nom d'utilisateur"}),
         }
-    
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Créez une liste de noms d'utilisateurs pour le datalist.
-        # Note : Le datalist est une fonctionnalité front-end qui n'est pas gérée par le widget standard de Django.
-        # Vous devrez créer le <datalist> dans votre template HTML.
-        self.fields['agent'].choices = [(user.pk, user.username) for user in CustomUser.objects.filter(is_agent=True)]
+        # Facultatif : à la création, l'agent connecté ; à la modification,
+        # l'agent actuel est conservé.
+        self.fields['agent'].required = False
+        self.fields['agent'].queryset = self.fields['agent'].queryset.filter(is_staff=True)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('agent') and self.instance.agent_id:
+            cleaned_data['agent'] = self.instance.agent
+        # Une capacité ne peut pas descendre sous le nombre de places déjà vendues.
+        if self.instance.pk:
+            for section in ('a', 'b'):
+                capacite = cleaned_data.get(f'capacite_{section}')
+                vendues = getattr(self.instance, f'capacite_{section}') - getattr(self.instance, f'places_restantes_{section}')
+                if capacite is not None and capacite < vendues:
+                    self.add_error(f'capacite_{section}', f"{vendues} places sont déjà réservées dans cette section.")
+        return cleaned_data
 
 class ReservationForm(forms.ModelForm):
     """
@@ -80,9 +119,20 @@ class ReservationForm(forms.ModelForm):
         widgets = {
             'type_reservation': forms.TextInput(attrs={'class': 'form-control'}),
             'nombre_billet': forms.NumberInput(attrs={'class': 'form-control'}),
-            # Utilisation de champs texte pour le datalist
-            'spectateur': forms.TextInput(attrs={'class': 'form-control', 'list': 'spectateur_list'}),
-            'programme': forms.TextInput(attrs={'class': 'form-control', 'list': 'programme_list'}),
+            'spectateur': SaisieAssistee('spectateurs', attrs={'class': 'form-control'}),
+            'programme': SaisieAssistee('programmes', attrs={'class': 'form-control'}),
+        }
+
+class ReservationSpectateurForm(ReservationForm):
+    """
+    Formulaire de réservation rempli par le spectateur : le spectateur et le
+    programme sont fixés par la vue.
+    """
+    class Meta(ReservationForm.Meta):
+        fields = ('type_reservation', 'nombre_billet')
+        widgets = {
+            'type_reservation': forms.Select(attrs={'class': 'form-select'}),
+            'nombre_billet': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
 
 class PaiementForm(forms.ModelForm):
@@ -95,5 +145,54 @@ class PaiementForm(forms.ModelForm):
         widgets = {
             'mode_paiement': forms.TextInput(attrs={'class': 'form-control'}),
             'montant': forms.NumberInput(attrs={'class': 'form-control'}),
-            'reservation': forms.TextInput(attrs={'class': 'form-control', 'list': 'reservation_list'}),
+            'reservation': SaisieAssistee('reservations', attrs={'class': 'form-control'}),
         }
+
+
+class FiltreVentesForm(forms.Form):
+    """
+    Filtres des vues de gestion des réservations et des paiements.
+    """
+    programme = forms.IntegerField(required=False, widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'ID programme'}))
+    date_debut = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_fin = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    section = forms.ChoiceField(required=False, choices=[('', 'Toutes les sections')] + Reservation.SECTION_CHOICES, widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def filtrer(self, queryset, champ_date, champ_programme, champ_section):
+        """
+        Applique les filtres valides à `queryset` ; les filtres invalides sont ignorés.
+        """
+        if not self.is_bound or not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['section']:
+            queryset = queryset.filter(**{champ_section: data['section']})
+        if data['programme']:
+            queryset = queryset.filter(**{f'{champ_programme}_id': data['programme']})
+        if data['date_debut']:
+            queryset = queryset.filter(**{f'{champ_date}__gte': data['date_debut']})
+        if data['date_fin']:
+            queryset = queryset.filter(**{f'{champ_date}__lte': data['date_fin']})
+        return queryset
+
+
+class RapportVentesForm(forms.Form):
+    """
+    Filtres du rapport de ventes (lu dans les cumuls journaliers).
+    """
+    par = forms.ChoiceField(initial='mois', choices=[('jour', 'Par jour'), ('mois', 'Par mois'), ('annee', 'Par année')], widget=forms.Select(attrs={'class': 'form-select'}))
+    date_debut = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_fin = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    division = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Division'}))
+    stadium = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Stade'}))
+
+
+class RechercheProgrammesForm(forms.Form):
+    """
+    Recherche de programmes par équipe, stade ou division, et par dates.
+    """
+    q = forms.CharField(required=False, max_length=200, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Équipe, stade, division...', 'type': 'search'}))
+    date_debut = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_fin = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    division = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Division'}))
+    page = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
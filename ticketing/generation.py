@@ -0,0 +1,301 @@
+"""
+Génération de données réalistes à grande échelle (commande generer_donnees).
+
+Les lignes sont produites par lots et insérées par un INSERT préparé exécuté
+avec executemany, clés primaires comprises : ni instanciation de modèles, ni
+RETURNING, ni signaux. Les séquences des clés sont recalées en fin de
+génération. Le mot de passe n'est haché qu'une fois pour tous les
+utilisateurs. Une même graine produit les mêmes données.
+
+Les réservations respectent l'inventaire : la capacité de chaque section est
+calculée à partir des billets générés (taux de remplissage aléatoire), puis
+les compteurs de ventes sont recalculés.
+
+Sous SQLite, le cache de pages est agrandi et la synchronisation disque
+suspendue le temps de la génération (1M de réservations : 88 s -> 48 s) :
+des données de test perdues sur une coupure se régénèrent.
+"""
+import datetime
+import math
+import random
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import cache_programmes, compteurs
+from .models import Paiement, Programme, Reservation
+
+
+TAILLE_LOT = 10000
+MOT_DE_PASSE = 'motdepasse'
+
+EQUIPES = (
+    'Espérance', 'Club Africain', 'Étoile du Sahel', 'CS Sfaxien', 'US Monastir', 'Stade Tunisien',
+    'CA Bizertin', 'US Ben Guerdane', 'AS Soliman', 'JS Kairouan', 'Olympique Béja', 'ES Métlaoui',
+    'AS Marsa', 'ES Zarzis', 'CS Hammam-Lif', 'Stade Gabésien',
+)
+STADES = (
+    'Radès', 'Olympique de Sousse', 'Taïeb Mhiri', 'Mustapha Ben Jannet', 'Chedly Zouiten',
+    '15 Octobre', 'Ben Guerdane', 'Hamda Laouani',
+)
+DIVISIONS = ('Ligue 1', 'Ligue 2', 'Coupe')
+PRENOMS = ('Amine', 'Sarra', 'Youssef', 'Meriem', 'Karim', 'Ines', 'Walid', 'Nour', 'Hedi', 'Rim')
+NOMS = ('Ben Ali', 'Trabelsi', 'Gharbi', 'Jaziri', 'Hammami', 'Mejri', 'Saidi', 'Chaabane', 'Ayari')
+
+
+@dataclass
+class Volumes:
+    agents: int = 10
+    spectateurs: int = 1000
+    saisons: int = 1
+    programmes_par_saison: int = 240
+    reservations: int = 10000
+    taux_paiement: float = 0.7
+    premiere_saison: int = 2024
+
+
+@dataclass
+class Bilan:
+    utilisateurs: int = 0
+    programmes: int = 0
+    reservations: int = 0
+    paiements: int = 0
+    premiers_ids: dict = field(default_factory=dict)
+
+
+def _inserer(modele, champs, lignes):
+    """
+    INSERT préparé de `lignes` (tuples dans l'ordre de `champs`, noms
+    d'attributs), exécuté par executemany.
+    """
+    meta = modele._meta
+    qn = connection.ops.quote_name
+    colonnes = [meta.get_field(nom).column for nom in champs]
+    requete = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(meta.db_table), ', '.join(qn(colonne) for colonne in colonnes), ', '.join(['%s'] * len(colonnes)),
+    )
+    with connection.cursor() as curseur:
+        curseur.executemany(requete, lignes)
+
+
+def _prochain_id(modele):
+    return (modele.objects.aggregate(dernier=Max('pk'))['dernier'] or 0) + 1
+
+
+def _reinitialiser_sequences(modeles):
+    """
+    Recale les séquences des clés primaires après les INSERT à clés
+    explicites (PostgreSQL ; rien à faire sous SQLite).
+    """
+    requetes = connection.ops.sequence_reset_sql(no_style(), modeles)
+    with connection.cursor() as curseur:
+        for requete in requetes:
+            curseur.execute(requete)
+
+
+def _par_lots(lignes, taille):
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+@contextmanager
+def _reglages_sqlite():
+    """
+    PRAGMA de chargement en masse, rétablis en sortie. Sans effet hors SQLite
+    ou dans une transaction (synchronous n'y est pas modifiable).
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    reglages = {'cache_size': -262144, 'synchronous': 0}
+    with connection.cursor() as curseur:
+        anciens = {}
+        for nom, valeur in reglages.items():
+            curseur.execute(f'PRAGMA {nom}')
+            anciens[nom] = curseur.fetchone()[0]
+            curseur.execute(f'PRAGMA {nom} = {valeur}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as curseur:
+            for nom, valeur in anciens.items():
+                curseur.execute(f'PRAGMA {nom} = {valeur}')
+
+
+class Generateur:
+    def __init__(self, volumes, graine=0, taille_lot=TAILLE_LOT, journal=None):
+        self.volumes = volumes
+        self.rng = random.Random(graine)
+        self.taille_lot = taille_lot
+        self.journal = journal or (lambda message: None)
+        self.bilan = Bilan()
+
+    def _inserer_par_lots(self, modele, champs, lignes):
+        total = 0
+        for lot in _par_lots(lignes, self.taille_lot):
+            # Une transaction par lot : verrous et journal restent bornés.
+            with transaction.atomic():
+                _inserer(modele, champs, lot)
+            total += len(lot)
+            if total % (self.taille_lot * 50) == 0:
+                self.journal(f"  {modele._meta.model_name} : {total}")
+        return total
+
+    def utilisateurs(self):
+        User = get_user_model()
+        premier = _prochain_id(User)
+        mot_de_passe = make_password(MOT_DE_PASSE)
+        inscription = connection.ops.adapt_datetimefield_value(timezone.now())
+        nombre = self.volumes.agents + self.volumes.spectateurs
+        rng = self.rng
+
+        def lignes():
+            for i in range(nombre):
+                pk = premier + i
+                agent = i < self.volumes.agents
+                prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+                yield (
+                    pk, f"{'agent' if agent else 'spectateur'}{pk}", mot_de_passe, prenom, nom,
+                    f'{prenom.lower()}.{pk}@example.com', agent, True, False, inscription,
+                )
+
+        self.bilan.utilisateurs = self._inserer_par_lots(User, (
+            User._meta.pk.attname, 'username', 'password', 'first_name', 'last_name', 'email',
+            'is_staff', 'is_active', 'is_superuser', 'date_joined',
+        ), lignes())
+        self.agents = range(premier, premier + self.volumes.agents)
+        self.spectateurs = range(premier + self.volumes.agents, premier + nombre)
+        self.bilan.premiers_ids['utilisateur'] = premier
+
+    def programmes(self):
+        premier = _prochain_id(Programme)
+        rng = self.rng
+        self.catalogue = []
+        lignes = []
+        pk = premier
+        for saison in range(self.volumes.saisons):
+            debut = datetime.date(self.volumes.premiere_saison + saison, 8, 15)
+            for i in range(self.volumes.programmes_par_saison):
+                equipe1, equipe2 = rng.sample(EQUIPES, 2)
+                date = debut + datetime.timedelta(days=rng.randrange(270))
+                prix_a = Decimal(rng.choice((20, 25, 30, 40, 50)))
+                prix_b = prix_a / 2
+                # Popularité : quelques affiches concentrent les ventes.
+                self.catalogue.append((pk, date, prix_a, prix_b, rng.paretovariate(1.5)))
+                # Capacités provisoires, ajustées après la génération des ventes.
+                lignes.append((
+                    pk, equipe1, equipe2, rng.choice(STADES), date, str(saison + 1), rng.choice(DIVISIONS),
+                    prix_a, prix_b, rng.choice(self.agents), 0, 0, 0, 0,
+                ))
+                pk += 1
+        self.bilan.programmes = self._inserer_par_lots(Programme, (
+            'id_programme', 'nom_equipe1', 'nom_equipe2', 'stadium', 'date', 'version', 'division',
+            'prix_a', 'prix_b', 'agent_id', 'capacite_a', 'capacite_b', 'places_restantes_a', 'places_restantes_b',
+        ), lignes)
+        self.bilan.premiers_ids['programme'] = premier
+
+    def ventes(self):
+        """
+        Réservations et paiements, générés lot par lot (jamais tous en mémoire).
+        """
+        premiere_reservation = _prochain_id(Reservation)
+        premier_paiement = _prochain_id(Paiement)
+        rng = self.rng
+        poids = [programme[4] for programme in self.catalogue]
+        vendus = defaultdict(int)
+        jours = {}
+
+        def jour(date, decalage):
+            cle = (date, decalage)
+            if cle not in jours:
+                jours[cle] = date - datetime.timedelta(days=decalage)
+            return jours[cle]
+
+        reservation_id = premiere_reservation
+        paiement_id = premier_paiement
+        restantes = self.volumes.reservations
+        while restantes:
+            nombre = min(self.taille_lot, restantes)
+            restantes -= nombre
+            reservations, paiements = [], []
+            for programme in rng.choices(self.catalogue, weights=poids, k=nombre):
+                pk, date, prix_a, prix_b, _ = programme
+                section = 'A' if rng.random() < 0.3 else 'B'
+                billets = min(int(rng.expovariate(0.6)) + 1, 10)
+                vendus[(pk, section)] += billets
+                reserve_le = jour(date, rng.randrange(1, 60))
+                reservations.append((
+                    reservation_id, reserve_le, section, billets, rng.choice(self.spectateurs), pk, '', '',
+                    Reservation.STATUT_CONFIRMEE, '',
+                ))
+                if rng.random() < self.volumes.taux_paiement:
+                    prix = prix_a if section == 'A' else prix_b
+                    paiements.append((
+                        paiement_id, rng.choice(('Stripe', 'Stripe', 'Stripe', 'Espèces')),
+                        min(jour(reserve_le, -rng.randrange(3)), date), prix * billets, reservation_id,
+                    ))
+                    paiement_id += 1
+                reservation_id += 1
+            with transaction.atomic():
+                _inserer(Reservation, (
+                    'id_reservation', 'date_reservation', 'type_reservation', 'nombre_billet',
+                    'spectateur_id', 'programme_id', 'stripe_session_id', 'stripe_session_url', 'statut',
+                    'session_groupe',
+                ), reservations)
+                _inserer(Paiement, ('id_paiement', 'mode_paiement', 'date_paiement', 'montant', 'reservation_id'), paiements)
+            self.bilan.reservations += len(reservations)
+            self.bilan.paiements += len(paiements)
+            if self.bilan.reservations % (self.taille_lot * 50) == 0:
+                self.journal(f"  réservations : {self.bilan.reservations}")
+        self.bilan.premiers_ids['reservation'] = premiere_reservation
+        self._capacites(vendus)
+
+    def _capacites(self, vendus):
+        """
+        Capacité de chaque section : billets vendus / taux de remplissage.
+        """
+        lignes = []
+        for pk, *_ in self.catalogue:
+            valeurs = []
+            for section in ('A', 'B'):
+                vendu = vendus.get((pk, section), 0)
+                capacite = max(math.ceil(vendu / self.rng.uniform(0.6, 1.0)), 50 if section == 'A' else 200)
+                valeurs += [capacite, capacite - vendu]
+            lignes.append((*valeurs, pk))
+        qn = connection.ops.quote_name
+        requete = 'UPDATE {} SET {} = %s, {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+            qn(Programme._meta.db_table),
+            *(qn(Programme._meta.get_field(nom).column) for nom in (
+                'capacite_a', 'places_restantes_a', 'capacite_b', 'places_restantes_b', 'id_programme',
+            )),
+        )
+        with transaction.atomic(), connection.cursor() as curseur:
+            curseur.executemany(requete, lignes)
+
+    def generer(self):
+        with _reglages_sqlite():
+            self.journal("Utilisateurs...")
+            self.utilisateurs()
+            self.journal("Programmes...")
+            self.programmes()
+            self.journal("Réservations et paiements...")
+            self.ventes()
+            _reinitialiser_sequences([get_user_model(), Programme, Reservation, Paiement])
+            self.journal("Compteurs de ventes...")
+            compteurs.recalculer(corriger=True)
+        cache_programmes.invalider()
+        return self.bilan
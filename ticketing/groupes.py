@@ -0,0 +1,199 @@
+"""
+Réservations de groupe : un club ou un sponsor réserve en une requête des
+places sur plusieurs programmes et sections.
+
+Les lignes sont validées sans requête, les programmes chargés en une seule
+requête, et l'inventaire décrémenté par un UPDATE conditionnel par couple
+(programme, section) plutôt que par ligne. Toutes les réservations sont
+insérées par un seul bulk_create et payées par une seule session Stripe.
+
+Deux modes :
+- MODE_TOUT_OU_RIEN : une seule ligne refusée annule toute la demande ;
+- MODE_PARTIEL : les lignes acceptées sont réservées, les autres refusées
+  avec leur motif.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from . import compteurs, expirations
+from .inventory import SECTIONS, PlacesInsuffisantes, reserver_places
+from .models import Programme, Reservation
+
+
+MODE_TOUT_OU_RIEN = 'tout_ou_rien'
+MODE_PARTIEL = 'partiel'
+MODES = (MODE_TOUT_OU_RIEN, MODE_PARTIEL)
+
+LIGNES_MAX = 500
+# Stripe limite une session de paiement à 100 articles : un article par
+# couple (programme, section).
+ARTICLES_MAX = 100
+
+STATUT_RESERVEE = 'reservee'
+STATUT_REFUSEE = 'refusee'
+STATUT_INVALIDE = 'invalide'
+
+
+class DemandeInvalide(Exception):
+    """
+    La demande entière est rejetée (format, mode, nombre de lignes).
+    """
+
+
+@dataclass
+class Ligne:
+    numero: int
+    programme_id: int = None
+    section: str = None
+    quantite: int = None
+    statut: str = None
+    erreur: str = ''
+    reservation: Reservation = None
+
+    def as_dict(self):
+        resultat = {
+            'ligne': self.numero,
+            'programme': self.programme_id,
+            'section': self.section,
+            'quantite': self.quantite,
+            'statut': self.statut,
+        }
+        if self.erreur:
+            resultat['erreur'] = self.erreur
+        if self.reservation is not None:
+            resultat['reservation'] = self.reservation.pk
+        return resultat
+
+
+def _entier_positif(valeur):
+    if isinstance(valeur, bool):
+        raise ValueError
+    valeur = int(valeur)
+    if valeur < 1:
+        raise ValueError
+    return valeur
+
+
+def lire_lignes(donnees):
+    """
+    Valide la forme des lignes ({programme, section, quantite}) sans requête.
+    Les lignes mal formées sont marquées invalides.
+    """
+    if not isinstance(donnees, list) or not donnees:
+        raise DemandeInvalide("'lignes' doit être une liste non vide.")
+    if len(donnees) > LIGNES_MAX:
+        raise DemandeInvalide(f"Au plus {LIGNES_MAX} lignes par demande.")
+    lignes = []
+    for numero, brut in enumerate(donnees, start=1):
+        ligne = Ligne(numero)
+        lignes.append(ligne)
+        if not isinstance(brut, dict):
+            ligne.statut, ligne.erreur = STATUT_INVALIDE, "Ligne mal formée."
+            continue
+        ligne.section = brut.get('section')
+        try:
+            ligne.programme_id = _entier_positif(brut.get('programme'))
+        except (TypeError, ValueError):
+            ligne.statut, ligne.erreur = STATUT_INVALIDE, "Programme invalide."
+            continue
+        try:
+            ligne.quantite = _entier_positif(brut.get('quantite'))
+        except (TypeError, ValueError):
+            ligne.statut, ligne.erreur = STATUT_INVALIDE, "La quantité doit être un entier positif."
+            continue
+        if ligne.section not in SECTIONS:
+            ligne.statut, ligne.erreur = STATUT_INVALIDE, "Section inconnue."
+    return lignes
+
+
+def _reserver_couple(programme_id, section, lignes, partiel):
+    """
+    Retire les places d'un couple (programme, section) en un seul UPDATE. En
+    mode partiel, si la section ne peut pas tout servir, les lignes sont
+    reprises une à une pour accepter celles qui tiennent encore.
+    """
+    quantite = sum(ligne.quantite for ligne in lignes)
+    try:
+        if partiel:
+            with transaction.atomic():
+                reserver_places(programme_id, section, quantite)
+        else:
+            # Tout ou rien : un refus annule de toute façon la transaction.
+            reserver_places(programme_id, section, quantite)
+    except PlacesInsuffisantes as e:
+        if not partiel or len(lignes) == 1:
+            for ligne in lignes:
+                ligne.statut, ligne.erreur = STATUT_REFUSEE, str(e)
+            return
+        for ligne in lignes:
+            _reserver_couple(programme_id, section, [ligne], partiel)
+        return
+    for ligne in lignes:
+        ligne.statut = STATUT_RESERVEE
+
+
+def _annuler(lignes):
+    """
+    Tout ou rien : les lignes qui n'ont pas elles-mêmes échoué sont refusées.
+    """
+    for ligne in lignes:
+        if ligne.statut in (None, STATUT_RESERVEE):
+            ligne.statut, ligne.erreur = STATUT_REFUSEE, "Demande annulée (tout ou rien)."
+    return []
+
+
+def reserver_groupe(spectateur, lignes, mode=MODE_TOUT_OU_RIEN):
+    """
+    Réserve les lignes pour le spectateur. Renvoie la liste des réservations
+    créées (vide si la demande tout-ou-rien est refusée) ; le statut de
+    chaque ligne est renseigné.
+    """
+    if mode not in MODES:
+        raise DemandeInvalide(f"Mode inconnu : {mode!r}.")
+    partiel = mode == MODE_PARTIEL
+
+    valides = [ligne for ligne in lignes if ligne.statut is None]
+    programmes = Programme.objects.only(
+        'id_programme', 'nom_equipe1', 'nom_equipe2', 'prix_a', 'prix_b'
+    ).in_bulk({ligne.programme_id for ligne in valides})
+    couples = defaultdict(list)
+    for ligne in valides:
+        if ligne.programme_id not in programmes:
+            ligne.statut, ligne.erreur = STATUT_INVALIDE, "Programme introuvable."
+        else:
+            couples[(ligne.programme_id, ligne.section)].append(ligne)
+    if len(couples) > ARTICLES_MAX:
+        raise DemandeInvalide(f"Au plus {ARTICLES_MAX} couples (programme, section) par demande.")
+
+    if not partiel and any(ligne.statut for ligne in lignes):
+        return _annuler(lignes)
+
+    with transaction.atomic():
+        # Ordre fixe des programmes : deux demandes concurrentes verrouillent
+        # les lignes dans le même ordre et ne peuvent pas s'interbloquer.
+        for (programme_id, section), lignes_couple in sorted(couples.items()):
+            _reserver_couple(programme_id, section, lignes_couple, partiel)
+            if not partiel and lignes_couple[0].statut != STATUT_RESERVEE:
+                transaction.set_rollback(True)
+                return _annuler(lignes)
+
+        acceptees = [ligne for ligne in lignes if ligne.statut == STATUT_RESERVEE]
+        expire_le = expirations.echeance()
+        reservations = Reservation.objects.bulk_create([
+            Reservation(
+                spectateur=spectateur,
+                programme=programmes[ligne.programme_id],
+                type_reservation=ligne.section,
+                nombre_billet=ligne.quantite,
+                statut=Reservation.STATUT_EN_ATTENTE,
+                expire_le=expire_le,
+            )
+            for ligne in acceptees
+        ])
+        # bulk_create n'envoie pas post_save.
+        compteurs.reservations_ajoutees(reservations)
+    for ligne, reservation in zip(acceptees, reservations):
+        ligne.reservation = reservation
+    return reservations
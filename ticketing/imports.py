@@ -0,0 +1,222 @@
+"""
+Import en masse des programmes d'une saison (CSV ou JSON).
+
+Les lignes sont validées champ par champ sans requête, les agents sont
+résolus en une seule requête, puis les programmes sont insérés (bulk_create)
+ou mis à jour (un UPDATE paramétré exécuté en lot) dans une seule transaction. L'import est
+rejouable : un programme est identifié par ses équipes, sa date et son stade.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from . import cache_programmes, compteurs
+from .models import Programme
+
+
+TAILLE_LOT = 1000
+
+CHAMPS = (
+    'nom_equipe1', 'nom_equipe2', 'stadium', 'date', 'version', 'division',
+    'prix_a', 'prix_b', 'capacite_a', 'capacite_b',
+)
+# Champs mis à jour quand le programme existe déjà (la clé ne change pas).
+CHAMPS_MIS_A_JOUR = ('version', 'division', 'prix_a', 'prix_b', 'agent', 'capacite_a', 'capacite_b',
+                     'places_restantes_a', 'places_restantes_b')
+CHAMPS_MIS_A_JOUR_ATTRIBUTS = tuple(Programme._meta.get_field(nom).attname for nom in CHAMPS_MIS_A_JOUR)
+
+
+@dataclass
+class RapportImport:
+    crees: int = 0
+    mis_a_jour: int = 0
+    inchanges: int = 0
+    # (numéro de ligne, {champ: message})
+    erreurs: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'crees': self.crees,
+            'mis_a_jour': self.mis_a_jour,
+            'inchanges': self.inchanges,
+            'erreurs': [{'ligne': ligne, 'erreurs': erreurs} for ligne, erreurs in self.erreurs],
+        }
+
+
+def lire(fichier, format_fichier):
+    """
+    Lit un fichier texte CSV (avec en-tête) ou JSON (liste d'objets) ; lève
+    ValidationError si le fichier est illisible.
+    """
+    try:
+        if format_fichier == 'json':
+            lignes = json.load(fichier)
+            if not isinstance(lignes, list):
+                raise ValidationError("Le fichier JSON doit contenir une liste de programmes.")
+            return lignes
+        return list(csv.DictReader(fichier))
+    except (csv.Error, ValueError) as e:
+        # ValueError couvre aussi JSONDecodeError et UnicodeDecodeError.
+        raise ValidationError(f"Fichier illisible : {e}")
+
+
+def lire_televersement(fichier):
+    """
+    Lit un fichier téléversé ; le format est déduit de son extension.
+    """
+    format_fichier = 'json' if fichier.name.lower().endswith('.json') else 'csv'
+    return lire(io.TextIOWrapper(fichier, encoding='utf-8-sig'), format_fichier)
+
+
+def cle(programme):
+    return (programme.nom_equipe1, programme.nom_equipe2, programme.date, programme.stadium)
+
+
+def _nom_agent(ligne):
+    return str(ligne.get('agent') or '').strip() if isinstance(ligne, dict) else ''
+
+
+def _valider(ligne, agents, agent_defaut):
+    """
+    Construit un Programme non enregistré à partir d'une ligne, ou lève
+    ValidationError avec un dictionnaire d'erreurs par champ.
+    """
+    if not isinstance(ligne, dict):
+        raise ValidationError({'__all__': "Un objet décrivant un programme est attendu."})
+    erreurs = {}
+    valeurs = {}
+    for nom in CHAMPS:
+        champ = Programme._meta.get_field(nom)
+        brut = ligne.get(nom)
+        if isinstance(brut, str):
+            brut = brut.strip()
+        if brut in (None, '') and champ.has_default():
+            brut = champ.get_default()
+        try:
+            valeurs[nom] = champ.clean(brut, None)
+        except ValidationError as e:
+            erreurs[nom] = ' '.join(e.messages)
+
+    nom_agent = _nom_agent(ligne)
+    if nom_agent:
+        if nom_agent not in agents:
+            erreurs['agent'] = f"Agent inconnu : {nom_agent}"
+        valeurs['agent_id'] = agents.get(nom_agent)
+    elif agent_defaut is not None:
+        valeurs['agent_id'] = agent_defaut.pk
+    else:
+        erreurs['agent'] = "Agent manquant."
+
+    if erreurs:
+        raise ValidationError(erreurs)
+    return Programme(
+        places_restantes_a=valeurs['capacite_a'],
+        places_restantes_b=valeurs['capacite_b'],
+        **valeurs,
+    )
+
+
+def _mettre_a_jour(programmes):
+    """
+    Réécrit les programmes existants avec un seul UPDATE préparé exécuté par
+    executemany : bulk_update construit un CASE WHEN par ligne et par champ,
+    dont la compilation coûte plusieurs millisecondes par programme.
+    """
+    if not programmes:
+        return
+    meta = Programme._meta
+    colonnes = [meta.get_field(nom) for nom in CHAMPS_MIS_A_JOUR]
+    qn = connection.ops.quote_name
+    requete = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        qn(meta.db_table),
+        ', '.join(f'{qn(champ.column)} = %s' for champ in colonnes),
+        qn(meta.pk.column),
+    )
+    parametres = [
+        [champ.get_db_prep_save(getattr(programme, champ.attname), connection) for champ in colonnes]
+        + [programme.pk]
+        for programme in programmes
+    ]
+    with connection.cursor() as curseur:
+        curseur.executemany(requete, parametres)
+
+
+def importer_programmes(lignes, agent_defaut=None, simulation=False, taille_lot=TAILLE_LOT):
+    """
+    Importe les programmes décrits par `lignes` (dictionnaires). Les lignes
+    invalides sont ignorées et décrites dans le rapport ; les autres sont
+    créées ou mises à jour. `simulation` valide sans rien écrire.
+    """
+    rapport = RapportImport()
+    noms_agents = {_nom_agent(ligne) for ligne in lignes} - {''}
+    agents = dict(
+        get_user_model().objects.filter(username__in=noms_agents).values_list('username', 'pk')
+    )
+
+    programmes = {}
+    for numero, ligne in enumerate(lignes, start=1):
+        try:
+            programme = _valider(ligne, agents, agent_defaut)
+        except ValidationError as e:
+            rapport.erreurs.append((numero, {k: ' '.join(v) for k, v in e.message_dict.items()}))
+            continue
+        if cle(programme) in programmes:
+            rapport.erreurs.append((numero, {'__all__': f"Doublon de la ligne {programmes[cle(programme)][0]}."}))
+            continue
+        programmes[cle(programme)] = (numero, programme)
+
+    if not programmes:
+        return rapport
+
+    with transaction.atomic():
+        dates = [programme.date for _, programme in programmes.values()]
+        stades = {programme.stadium for _, programme in programmes.values()}
+        existants = {
+            cle(programme): programme
+            for programme in Programme.objects.select_for_update().filter(
+                date__range=(min(dates), max(dates)), stadium__in=stades
+            )
+        }
+
+        a_creer = []
+        a_mettre_a_jour = []
+        for numero, programme in programmes.values():
+            existant = existants.get(cle(programme))
+            if existant is None:
+                a_creer.append(programme)
+                continue
+            # La capacité change, les places déjà vendues restent vendues.
+            erreurs = {}
+            for section in ('a', 'b'):
+                restantes = (getattr(existant, f'places_restantes_{section}')
+                             + getattr(programme, f'capacite_{section}')
+                             - getattr(existant, f'capacite_{section}'))
+                if restantes < 0:
+                    erreurs[f'capacite_{section}'] = "Capacité inférieure aux places déjà réservées."
+                setattr(programme, f'places_restantes_{section}', restantes)
+            if erreurs:
+                rapport.erreurs.append((numero, erreurs))
+                continue
+            programme.pk = existant.pk
+            # Les lignes inchangées (réimport du même fichier) ne sont pas réécrites.
+            if any(getattr(programme, nom) != getattr(existant, nom) for nom in CHAMPS_MIS_A_JOUR_ATTRIBUTS):
+                a_mettre_a_jour.append(programme)
+            else:
+                rapport.inchanges += 1
+
+        if not simulation:
+            Programme.objects.bulk_create(a_creer, batch_size=taille_lot)
+            compteurs.initialiser(a_creer)
+            _mettre_a_jour(a_mettre_a_jour)
+            # Ni bulk_create ni l'UPDATE direct n'envoient de signaux.
+            transaction.on_commit(cache_programmes.invalider)
+        rapport.crees = len(a_creer)
+        rapport.mis_a_jour = len(a_mettre_a_jour)
+
+    rapport.erreurs.sort()
+    return rapport
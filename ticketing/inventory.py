@@ -0,0 +1,67 @@
+"""
+Gestion de l'inventaire des places par programme et par section.
+
+Chaque réservation décrémente les places restantes par un UPDATE conditionnel
+(« ... WHERE places_restantes >= n ») : la base sérialise les écritures sur la
+ligne du programme, sans verrou global ni lecture préalable. Une section
+complète est rejetée par un simple UPDATE qui ne touche aucune ligne. Les
+places rendues sont bornées par la capacité de la section.
+"""
+from django.db.models import F
+from django.db.models.functions import Least
+
+from .models import Programme
+
+
+SECTIONS = {
+    'A': 'places_restantes_a',
+    'B': 'places_restantes_b',
+}
+
+CAPACITES = {
+    'A': 'capacite_a',
+    'B': 'capacite_b',
+}
+
+
+class PlacesInsuffisantes(Exception):
+    """
+    Levée lorsque la section demandée n'a plus assez de places.
+    """
+
+
+def _champ_section(section):
+    try:
+        return SECTIONS[section]
+    except KeyError:
+        raise ValueError(f"Section inconnue : {section!r}")
+
+
+def reserver_places(programme_id, section, nombre):
+    """
+    Retire `nombre` places de la section d'un programme, de manière atomique.
+    Lève PlacesInsuffisantes si la section n'a pas assez de places.
+    """
+    if nombre < 1:
+        raise ValueError("Le nombre de billets doit être positif.")
+    champ = _champ_section(section)
+    modifies = Programme.objects.filter(
+        pk=programme_id, **{f'{champ}__gte': nombre}
+    ).update(**{champ: F(champ) - nombre})
+    if not modifies:
+        raise PlacesInsuffisantes(
+            f"Plus assez de places en section {section} pour ce programme."
+        )
+
+
+def liberer_places(programme_id, section, nombre):
+    """
+    Remet `nombre` places dans la section d'un programme (annulation,
+    suppression ou expiration d'une réservation).
+    """
+    champ = _champ_section(section)
+    # Borné par la capacité : une réservation créée hors inventaire (import,
+    # administration) ne peut pas faire dépasser la jauge en étant supprimée.
+    Programme.objects.filter(pk=programme_id).update(
+        **{champ: Least(F(champ) + nombre, F(CAPACITES[section]))}
+    )
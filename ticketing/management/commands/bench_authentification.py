@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+PROFILS = {
+    'base': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'cache': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['ticketing.authentification.BackendUtilisateursCache'],
+    },
+    'cookie': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'AUTHENTICATION_BACKENDS': ['ticketing.authentification.BackendUtilisateursCache'],
+    },
+}
+
+# Tables lues par SessionMiddleware et AuthenticationMiddleware.
+TABLES_AUTHENTIFICATION = ('"django_session"', '"auth_user"')
+
+
+def requetes_authentification(requetes):
+    return [r for r in requetes if any(table in r['sql'] for table in TABLES_AUTHENTIFICATION)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure, par profil de sessions (base, cache, cookie), les requêtes SQL "
+        "d'authentification et la durée des pages vues par un utilisateur connecté."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=500, help="Requêtes par page et par profil.")
+        parser.add_argument('--profils', default=','.join(PROFILS), help="Profils à mesurer, séparés par des virgules.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        spectateur = User.objects.create_user(f'bench_authentification_{int(time.time())}', password='bench')
+        pages = [reverse('home'), reverse('reservation_history')]
+        try:
+            for profil in options['profils'].split(','):
+                with override_settings(ALLOWED_HOSTS=['testserver'], FILE_ATTENTE={'ACTIVE': False}, **PROFILS[profil]):
+                    for page in pages:
+                        self.stdout.write(self._mesurer(profil, page, spectateur, options['requetes']))
+        finally:
+            spectateur.delete()
+
+    def _mesurer(self, profil, page, spectateur, nombre):
+        client = Client()
+        client.force_login(spectateur)
+        # Première requête hors mesure (cache froid).
+        client.get(page)
+        durees, authentification, total = [], 0, 0
+        for _ in range(nombre):
+            with CaptureQueriesContext(connection) as requetes:
+                debut = time.perf_counter()
+                response = client.get(page)
+                durees.append(time.perf_counter() - debut)
+            assert response.status_code == 200, response.status_code
+            authentification += len(requetes_authentification(requetes.captured_queries))
+            total += len(requetes.captured_queries)
+        durees.sort()
+        return (
+            f"{profil:<7} {page:<26} SQL auth {authentification / nombre:4.2f}/req   "
+            f"SQL total {total / nombre:4.2f}/req   "
+            f"p50 {statistics.median(durees) * 1000:6.2f} ms   p95 {durees[int(nombre * 0.95) - 1] * 1000:6.2f} ms"
+        )
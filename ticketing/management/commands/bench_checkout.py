@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from ticketing import paiements
+from ticketing.faux_stripe import FauxStripe
+from ticketing.models import Programme, Reservation
+
+
+def _resume(nom, durees, total):
+    durees = sorted(durees)
+    return (
+        f"{nom:<10} {len(durees) / total:8.1f} req/s   "
+        f"p50 {statistics.median(durees) * 1000:7.1f} ms   "
+        f"p95 {durees[int(len(durees) * 0.95) - 1] * 1000:7.1f} ms"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit de création de sessions de paiement entre la vue "
+        "synchrone (pool de threads type WSGI) et la vue asynchrone (une seule "
+        "boucle d'événements type ASGI), face à un faux Stripe lent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=4, help="Threads du worker synchrone.")
+        parser.add_argument('--concurrence', type=int, default=100, help="Requêtes simultanées côté asynchrone.")
+        parser.add_argument('--latence', type=float, default=0.2, help="Latence simulée de Stripe (s).")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        suffixe = int(time.time())
+        spectateur = User.objects.create_user(f'bench_checkout_{suffixe}', password='bench')
+        programme = Programme.objects.create(
+            nom_equipe1='Bench', nom_equipe2='Checkout', stadium='Local', date=datetime.date.today(),
+            version='1', division='Bench', prix_a=10, prix_b=5, capacite_a=10, capacite_b=10, agent=spectateur,
+        )
+        reservation = Reservation.objects.create(
+            spectateur=spectateur, programme=programme, type_reservation='A', nombre_billet=1,
+        )
+        try:
+            with FauxStripe(latence=options['latence']) as serveur, override_settings(
+                STRIPE_API_BASE=serveur.url,
+                FILE_ATTENTE={'ACTIVE': False},
+                ALLOWED_HOSTS=['testserver'],
+            ):
+                paiements.reinitialiser()
+                self.stdout.write(
+                    f"{options['requetes']} requêtes, latence Stripe {options['latence'] * 1000:.0f} ms"
+                )
+                self.stdout.write(self._bench_sync(spectateur, reservation, options))
+                self.stdout.write(self._bench_async(spectateur, reservation, options))
+        finally:
+            paiements.reinitialiser()
+            spectateur.delete()
+
+    def _bench_sync(self, spectateur, reservation, options):
+        url = reverse('create_checkout_session', args=[reservation.pk])
+
+        def requete(client):
+            debut = time.perf_counter()
+            response = client.get(url)
+            assert response.status_code == 302, response.status_code
+            return time.perf_counter() - debut
+
+        clients = []
+        for _ in range(options['threads']):
+            client = Client()
+            client.force_login(spectateur)
+            clients.append(client)
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executeur:
+            durees = list(executeur.map(
+                requete, (clients[i % len(clients)] for i in range(options['requetes']))
+            ))
+        return _resume('synchrone', durees, time.perf_counter() - debut)
+
+    def _bench_async(self, spectateur, reservation, options):
+        url = reverse('create_checkout_session_async', args=[reservation.pk])
+
+        async def campagne():
+            client = AsyncClient()
+            await client.aforce_login(spectateur)
+            limite = asyncio.Semaphore(options['concurrence'])
+
+            async def requete():
+                async with limite:
+                    debut = time.perf_counter()
+                    response = await client.get(url)
+                    assert response.status_code == 302, response.status_code
+                    return time.perf_counter() - debut
+
+            debut = time.perf_counter()
+            durees = await asyncio.gather(*(requete() for _ in range(options['requetes'])))
+            return durees, time.perf_counter() - debut
+
+        durees, total = asyncio.run(campagne())
+        return _resume('asynchrone', durees, total)
@@ -0,0 +1,68 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ticketing import recherche
+from ticketing.generation import DIVISIONS, EQUIPES, STADES, Generateur, Volumes
+from ticketing.models import Programme
+
+
+def _resume(nom, durees):
+    durees = sorted(durees)
+    return (
+        f"{nom:<14} p50 {statistics.median(durees) * 1000:7.2f} ms   "
+        f"p95 {durees[int(len(durees) * 0.95) - 1] * 1000:7.2f} ms   "
+        f"p99 {durees[int(len(durees) * 0.99) - 1] * 1000:7.2f} ms"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la recherche de programmes (index plein texte) face à la même "
+        "recherche par LIKE, sur un catalogue complété au besoin jusqu'à "
+        "--programmes lignes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--programmes', type=int, default=100000, help="Taille minimale du catalogue.")
+        parser.add_argument('--requetes', type=int, default=300)
+        parser.add_argument('--graine', type=int, default=0)
+
+    def handle(self, *args, **options):
+        manquants = options['programmes'] - Programme.objects.count()
+        if manquants > 0:
+            self.stdout.write(f"Génération de {manquants} programme(s)...")
+            Generateur(Volumes(
+                agents=1, spectateurs=0, saisons=1, programmes_par_saison=manquants, reservations=0,
+            ), options['graine']).generer()
+
+        rng = random.Random(options['graine'])
+        mots = [mot for nom in EQUIPES + STADES + DIVISIONS for mot in recherche.mots(nom) if len(mot) >= 3]
+        recherches = []
+        for _ in range(options['requetes']):
+            # Préfixes de un ou deux mots, avec une plage de dates une fois sur trois.
+            texte = ' '.join(mot[:rng.randint(3, len(mot))] for mot in rng.sample(mots, rng.choice((1, 1, 2))))
+            debut = fin = None
+            if rng.random() < 1 / 3:
+                debut = datetime.date(2024, 8, 15) + datetime.timedelta(days=rng.randrange(200))
+                fin = debut + datetime.timedelta(days=30)
+            recherches.append((texte, debut, fin))
+
+        self.stdout.write(
+            f"{Programme.objects.count()} programmes, {len(recherches)} recherches ({connection.vendor})"
+        )
+        index, like = [], []
+        for texte, debut, fin in recherches:
+            t = time.perf_counter()
+            recherche.rechercher(texte, debut, fin)
+            index.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            list(recherche._programmes_sans_index(recherche.mots(texte), debut, fin, None)[:recherche.TAILLE_PAGE + 1])
+            like.append(time.perf_counter() - t)
+        self.stdout.write(_resume('index', index))
+        self.stdout.write(_resume('LIKE', like))
@@ -0,0 +1,25 @@
+import base64
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ticketing import billets, controle
+from ticketing.models import Programme
+
+
+class Command(BaseCommand):
+    help = (
+        "Affiche la clé de vérification des billets d'un programme, à installer "
+        "sur ses lecteurs de contrôle (vérification hors ligne), et avec "
+        "--appareil le jeton du lecteur pour l'envoi des passages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('programme', type=int, help="Identifiant du programme.")
+        parser.add_argument('--appareil', help="Nom du lecteur : affiche aussi son jeton de contrôle.")
+
+    def handle(self, *args, **options):
+        if not Programme.objects.filter(pk=options['programme']).exists():
+            raise CommandError(f"Programme {options['programme']} introuvable.")
+        self.stdout.write(base64.b32encode(billets.cle_programme(options['programme'])).decode('ascii'))
+        if options['appareil']:
+            self.stdout.write(controle.jeton(options['programme'], options['appareil']))
@@ -0,0 +1,46 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from ticketing import cumuls
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule les cumuls journaliers des ventes. Sans option, traite les "
+        "jours clos depuis le dernier cumul ; --depuis/--jusqu-au recalculent "
+        "une plage (rattrapage)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', help="Premier jour à recalculer (AAAA-MM-JJ).")
+        parser.add_argument('--jusqu-au', dest='jusqu_au', help="Dernier jour à recalculer (hier par défaut).")
+        parser.add_argument('--jours-par-lot', type=int, default=31,
+                            help="Jours agrégés par transaction lors d'un rattrapage.")
+
+    def _date(self, valeur):
+        jour = parse_date(valeur)
+        if jour is None:
+            raise CommandError(f"Date invalide : {valeur}")
+        return jour
+
+    def handle(self, *args, **options):
+        if options['depuis']:
+            debut = self._date(options['depuis'])
+            fin = self._date(options['jusqu_au']) if options['jusqu_au'] else cumuls.dernier_jour_clos()
+        else:
+            plage = cumuls.plage_incrementale()
+            if plage is None:
+                self.stdout.write("Cumuls à jour.")
+                return
+            debut, fin = plage
+
+        # Une longue plage est traitée par tranches : chaque transaction reste courte.
+        lignes = 0
+        jour = debut
+        while jour <= fin:
+            fin_lot = min(fin, jour + datetime.timedelta(days=options['jours_par_lot'] - 1))
+            lignes += cumuls.cumuler(jour, fin_lot)
+            jour = fin_lot + datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Cumuls du {debut} au {fin} : {lignes} ligne(s)."))
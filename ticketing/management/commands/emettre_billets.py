@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ticketing import billets
+
+
+class Command(BaseCommand):
+    help = (
+        "Émet les billets électroniques des réservations payées qui n'en ont "
+        "pas encore (paiements antérieurs aux billets, émission en échec)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=billets.TAILLE_LOT, help="Réservations par transaction.")
+
+    def handle(self, *args, **options):
+        emis = billets.rattraper(options['lot'])
+        self.stdout.write(self.style.SUCCESS(f"{emis} billet(s) émis."))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticketing import expirations
+
+
+class Command(BaseCommand):
+    help = "Expire les réservations en attente de paiement dont l'option est échue et rend leurs places."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=expirations.TAILLE_LOT, help="Réservations par transaction.")
+        parser.add_argument('--boucle', action='store_true', help="Tourne en continu (worker).")
+        parser.add_argument('--pause', type=float, default=30.0, help="Attente (s) entre deux passages.")
+
+    def handle(self, *args, **options):
+        while True:
+            expirees = expirations.expirer(options['lot'])
+            if expirees or not options['boucle']:
+                self.stdout.write(self.style.SUCCESS(f"{expirees} réservation(s) expirée(s)."))
+            if not options['boucle']:
+                return
+            time.sleep(options['pause'])
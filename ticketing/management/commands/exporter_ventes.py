@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ticketing.exports import EXPORTS, FORMATS, flux
+from ticketing.forms import FiltreVentesForm
+
+
+class Command(BaseCommand):
+    help = "Exporte en flux les réservations ou les paiements (CSV ou NDJSON)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='format_export', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--programme', type=int)
+        parser.add_argument('--date-debut', help="AAAA-MM-JJ")
+        parser.add_argument('--date-fin', help="AAAA-MM-JJ")
+        parser.add_argument('--section', choices=['A', 'B'])
+        parser.add_argument('--sortie', help="Fichier de sortie (sortie standard par défaut).")
+
+    def handle(self, *args, **options):
+        filtres = FiltreVentesForm({
+            'programme': options['programme'],
+            'date_debut': options['date_debut'],
+            'date_fin': options['date_fin'],
+            'section': options['section'],
+        })
+        if not filtres.is_valid():
+            raise CommandError(filtres.errors.as_text())
+
+        blocs = flux(options['export'], options['format_export'], filtres)
+        if not options['sortie']:
+            for bloc in blocs:
+                self.stdout.write(bloc, ending='')
+            return
+        with open(options['sortie'], 'w', newline='', encoding='utf-8') as sortie:
+            for bloc in blocs:
+                sortie.write(bloc)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticketing.generation import MOT_DE_PASSE, TAILLE_LOT, Generateur, Volumes
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère des agents, spectateurs, saisons de programmes, réservations et "
+        "paiements réalistes, par lots (ex. --reservations 10000000)."
+    )
+
+    def add_arguments(self, parser):
+        defaut = Volumes()
+        parser.add_argument('--graine', type=int, default=0, help="Une même graine produit les mêmes données.")
+        parser.add_argument('--agents', type=int, default=defaut.agents)
+        parser.add_argument('--spectateurs', type=int, default=defaut.spectateurs)
+        parser.add_argument('--saisons', type=int, default=defaut.saisons)
+        parser.add_argument('--programmes-par-saison', type=int, default=defaut.programmes_par_saison)
+        parser.add_argument('--premiere-saison', type=int, default=defaut.premiere_saison)
+        parser.add_argument('--reservations', type=int, default=defaut.reservations)
+        parser.add_argument('--taux-paiement', type=float, default=defaut.taux_paiement,
+                            help="Part des réservations payées (0 à 1).")
+        parser.add_argument('--lot', type=int, default=TAILLE_LOT, help="Lignes par INSERT et par transaction.")
+
+    def handle(self, *args, **options):
+        volumes = Volumes(
+            agents=max(options['agents'], 1),
+            spectateurs=max(options['spectateurs'], 1),
+            saisons=options['saisons'],
+            programmes_par_saison=options['programmes_par_saison'],
+            reservations=options['reservations'],
+            taux_paiement=options['taux_paiement'],
+            premiere_saison=options['premiere_saison'],
+        )
+        debut = time.perf_counter()
+        bilan = Generateur(volumes, options['graine'], options['lot'], journal=self.stdout.write).generer()
+        self.stdout.write(self.style.SUCCESS(
+            f"{bilan.utilisateurs} utilisateur(s), {bilan.programmes} programme(s), "
+            f"{bilan.reservations} réservation(s), {bilan.paiements} paiement(s) "
+            f"en {time.perf_counter() - debut:.1f} s. Mot de passe de tous les comptes : {MOT_DE_PASSE}"
+        ))
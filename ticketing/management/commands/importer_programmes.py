@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ticketing.imports import importer_programmes, lire
+
+
+class Command(BaseCommand):
+    help = "Importe (ou met à jour) les programmes d'une saison depuis un fichier CSV ou JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', dest='format_fichier', choices=['csv', 'json'],
+                            help="Déduit de l'extension par défaut.")
+        parser.add_argument('--agent', help="Agent par défaut des lignes sans colonne agent.")
+        parser.add_argument('--simulation', action='store_true', help="Valide sans rien enregistrer.")
+
+    def handle(self, *args, **options):
+        agent_defaut = None
+        if options['agent']:
+            try:
+                agent_defaut = get_user_model().objects.get(username=options['agent'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Agent inconnu : {options['agent']}")
+
+        format_fichier = options['format_fichier'] or (
+            'json' if options['fichier'].lower().endswith('.json') else 'csv'
+        )
+        with open(options['fichier'], encoding='utf-8-sig', newline='') as fichier:
+            try:
+                lignes = lire(fichier, format_fichier)
+            except ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+
+        rapport = importer_programmes(lignes, agent_defaut, simulation=options['simulation'])
+        for numero, erreurs in rapport.erreurs:
+            for champ, message in erreurs.items():
+                self.stderr.write(f"Ligne {numero} [{champ}] : {message}")
+        self.stdout.write(
+            f"{rapport.crees} programme(s) créé(s), {rapport.mis_a_jour} mis à jour, "
+            f"{rapport.inchanges} inchangé(s), "
+            f"{len(rapport.erreurs)} ligne(s) en erreur"
+            + (" (simulation)" if options['simulation'] else "")
+        )
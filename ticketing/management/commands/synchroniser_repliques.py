@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ticketing import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copie la base principale SQLite dans les réplicas SQLite (REPLIQUES['ALIAS']), "
+        "pour essayer les réplicas en local. Avec --intervalle, recommence "
+        "indéfiniment : les réplicas ont alors jusqu'à cet intervalle de retard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalle', type=float, help="Secondes entre deux copies.")
+
+    def handle(self, *args, **options):
+        alias = replicas.configuration()['ALIAS']
+        if not alias:
+            raise CommandError("Aucun réplica configuré (REPLIQUES_SQLITE).")
+        for nom in ('default', *alias):
+            if connections[nom].vendor != 'sqlite':
+                raise CommandError(f"La base {nom} n'est pas une base SQLite.")
+        while True:
+            for nom in alias:
+                replicas.synchroniser_sqlite(nom)
+            self.stdout.write(f"Réplicas synchronisés : {', '.join(alias)}.")
+            if not options['intervalle']:
+                return
+            time.sleep(options['intervalle'])
@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ticketing.charge import Options, TestDeCharge
+
+
+def _paliers(valeur):
+    try:
+        paliers = tuple(int(palier) for palier in valeur.split(','))
+    except ValueError:
+        paliers = ()
+    if not paliers or min(paliers) < 1:
+        raise ValueError(valeur)
+    return paliers
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge du parcours inscription -> réservation -> paiement -> "
+        "webhook, par paliers de concurrence, contre un serveur local et un "
+        "faux Stripe. Écrit les centiles par étape et les invariants en JSON."
+    )
+
+    def add_arguments(self, parser):
+        defaut = Options()
+        parser.add_argument('--paliers', type=_paliers, default=defaut.paliers,
+                            help="Spectateurs simultanés de chaque palier, ex. 1,5,10,20.")
+        parser.add_argument('--parcours', type=int, default=defaut.parcours_par_palier, help="Parcours par palier.")
+        parser.add_argument('--taux-abandon', type=float, default=defaut.taux_abandon,
+                            help="Part des parcours arrêtés avant le règlement (0 à 1).")
+        parser.add_argument('--taux-rejeu', type=float, default=defaut.taux_rejeu,
+                            help="Part des webhooks envoyés deux fois, comme les rejeux de Stripe.")
+        parser.add_argument('--latence-stripe', type=float, default=defaut.latence_stripe,
+                            help="Latence simulée de création des sessions (s).")
+        parser.add_argument('--graine', type=int, default=defaut.graine)
+        parser.add_argument('--sortie', help="Fichier JSON du résultat (sortie standard par défaut).")
+        parser.add_argument('--conserver', action='store_true', help="Conserve les données créées.")
+
+    def handle(self, *args, **options):
+        test = TestDeCharge(Options(
+            paliers=options['paliers'],
+            parcours_par_palier=options['parcours'],
+            taux_abandon=options['taux_abandon'],
+            taux_rejeu=options['taux_rejeu'],
+            latence_stripe=options['latence_stripe'],
+            graine=options['graine'],
+        ), journal=self.stderr.write)
+        resultat = test.executer(conserver=options['conserver'])
+        texte = json.dumps(resultat, indent=2, ensure_ascii=False)
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as f:
+                f.write(texte + '\n')
+        else:
+            self.stdout.write(texte)
+        if not resultat['invariants']['ok']:
+            # Code de sortie non nul : utilisable en intégration continue.
+            raise CommandError(f"Invariants non respectés : {json.dumps(resultat['invariants'])}")
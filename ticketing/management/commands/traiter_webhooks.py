@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticketing import webhooks
+
+
+class Command(BaseCommand):
+    help = "Traite par lots les événements Stripe de la boîte de réception."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=webhooks.TAILLE_LOT, help="Taille d'un lot.")
+        parser.add_argument('--max-tentatives', type=int, default=webhooks.MAX_TENTATIVES)
+        parser.add_argument('--boucle', action='store_true', help="Tourne en continu (worker).")
+        parser.add_argument('--pause', type=float, default=1.0, help="Attente (s) quand la boîte est vide.")
+
+    def handle(self, *args, **options):
+        while True:
+            resultat = webhooks.traiter_lot(options['lot'], options['max_tentatives'])
+            if any(resultat.values()):
+                self.stdout.write(
+                    f"{resultat['traites']} traité(s), {resultat['echecs']} en échec, "
+                    f"{resultat['abandonnes']} abandonné(s)"
+                )
+            if not options['boucle']:
+                return
+            # Lot incomplet : la boîte est vide, inutile d'interroger la base en continu.
+            if sum(resultat.values()) < options['lot']:
+                time.sleep(options['pause'])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ticketing import compteurs
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les compteurs de ventes aux réservations et paiements, "
+        "signale les écarts et peut les corriger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('programmes', nargs='*', type=int, help="Programmes à vérifier (tous par défaut).")
+        parser.add_argument('--corriger', action='store_true', help="Réécrit les compteurs en écart.")
+
+    def handle(self, *args, **options):
+        ecarts = compteurs.recalculer(options['programmes'] or None, corriger=options['corriger'])
+        for programme_id, section, differences in ecarts:
+            detail = ', '.join(
+                f"{champ} {compteur} au lieu de {attendu}" for champ, (compteur, attendu) in differences.items()
+            )
+            self.stdout.write(f"Programme {programme_id} section {section} : {detail}")
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("Compteurs à jour."))
+        elif options['corriger']:
+            self.stdout.write(self.style.SUCCESS(f"{len(ecarts)} compteur(s) corrigé(s)."))
+        else:
+            # Code de sortie non nul : utilisable comme contrôle périodique.
+            raise CommandError(f"{len(ecarts)} compteur(s) en écart (--corriger pour les réécrire).")
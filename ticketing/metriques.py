@@ -0,0 +1,234 @@
+"""
+Métriques des vues et des appels au fournisseur de paiement, exposées au
+format texte de Prometheus (vue metriques, /metrics).
+
+Chaque processus tient ses histogrammes en mémoire (quelques opérations de
+dictionnaire par requête, sous un verrou). Avec plusieurs workers WSGI/ASGI,
+chaque processus recopie périodiquement ses valeurs dans un fichier de
+METRIQUES['REPERTOIRE'] (un fichier par pid, écriture atomique) ; l'endpoint
+additionne les fichiers de tous les processus. Les fichiers des workers
+arrêtés sont conservés : leurs compteurs restent dans les totaux, comme
+l'attend Prometheus pour des compteurs cumulatifs.
+
+Les requêtes SQL sont mesurées par un execute_wrapper installé sur chaque
+connexion ; la requête HTTP en cours est suivie par une ContextVar, qui suit
+aussi le code des vues asynchrones exécuté dans des threads (sync_to_async).
+"""
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+CONFIGURATION_DEFAUT = {
+    'ACTIVE': True,
+    # Répertoire partagé par les workers d'une même machine ; None : un seul processus.
+    'REPERTOIRE': None,
+    # Délai minimal (s) entre deux écritures du fichier d'un processus.
+    'INTERVALLE_ECRITURE': 1.0,
+    # Adresses autorisées à lire /metrics.
+    'IPS_AUTORISEES': ('127.0.0.1', '::1'),
+}
+
+SECONDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NOMBRES = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+OCTETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMMES = {
+    'ticketing_vue_duree_secondes': ("Durée de traitement des requêtes par vue.", SECONDES),
+    'ticketing_vue_requetes_sql': ("Nombre de requêtes SQL par requête HTTP.", NOMBRES),
+    'ticketing_vue_sql_secondes': ("Temps passé en base par requête HTTP.", SECONDES),
+    'ticketing_vue_reponse_octets': ("Taille des réponses (hors réponses en flux).", OCTETS),
+    'ticketing_paiement_duree_secondes': ("Durée des appels au fournisseur de paiement.", SECONDES),
+}
+
+
+def configuration():
+    return {**CONFIGURATION_DEFAUT, **getattr(settings, 'METRIQUES', {})}
+
+
+class Registre:
+    """
+    Histogrammes cumulatifs d'un processus : {(nom, étiquettes): [compteurs
+    par seau..., somme, nombre]}.
+    """
+    def __init__(self):
+        self._series = {}
+        self._verrou = threading.Lock()
+        self._derniere_ecriture = 0.0
+
+    def observer(self, nom, etiquettes, valeur):
+        seaux = HISTOGRAMMES[nom][1]
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._verrou:
+            serie = self._series.get(cle)
+            if serie is None:
+                serie = self._series[cle] = [0] * (len(seaux) + 2)
+            for i, borne in enumerate(seaux):
+                if valeur <= borne:
+                    serie[i] += 1
+                    break
+            serie[-2] += valeur
+            serie[-1] += 1
+
+    def instantane(self):
+        with self._verrou:
+            return [[nom, list(etiquettes), list(serie)] for (nom, etiquettes), serie in self._series.items()]
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._series.clear()
+            self._derniere_ecriture = 0.0
+
+    def _fichier(self, repertoire):
+        return os.path.join(repertoire, f'metriques-{os.getpid()}.json')
+
+    def ecrire(self, repertoire, forcer=False, intervalle=1.0):
+        """
+        Recopie les valeurs du processus dans son fichier, au plus une fois par
+        `intervalle` secondes.
+        """
+        maintenant = time.monotonic()
+        if not forcer and maintenant - self._derniere_ecriture < intervalle:
+            return
+        self._derniere_ecriture = maintenant
+        os.makedirs(repertoire, exist_ok=True)
+        fichier = self._fichier(repertoire)
+        temporaire = f'{fichier}.{threading.get_ident()}.tmp'
+        with open(temporaire, 'w') as f:
+            json.dump(self.instantane(), f)
+        os.replace(temporaire, fichier)
+
+
+registre = Registre()
+
+
+def _series_agregees(config):
+    """
+    Additionne les séries de tous les processus (ou du seul processus courant).
+    """
+    repertoire = config['REPERTOIRE']
+    if not repertoire:
+        instantanes = [registre.instantane()]
+    else:
+        registre.ecrire(repertoire, forcer=True)
+        instantanes = []
+        for fichier in glob.glob(os.path.join(repertoire, 'metriques-*.json')):
+            try:
+                with open(fichier) as f:
+                    instantanes.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    series = {}
+    for instantane in instantanes:
+        for nom, etiquettes, valeurs in instantane:
+            cle = (nom, tuple(tuple(paire) for paire in etiquettes))
+            if cle in series:
+                series[cle] = [a + b for a, b in zip(series[cle], valeurs)]
+            else:
+                series[cle] = valeurs
+    return series
+
+
+def _etiquettes(paires):
+    return ','.join('{}="{}"'.format(cle, str(valeur).replace('\\', r'\\').replace('"', r'\"')) for cle, valeur in paires)
+
+
+def exposition(config=None):
+    """
+    Texte d'exposition Prometheus de toutes les séries.
+    """
+    config = config or configuration()
+    series = _series_agregees(config)
+    lignes = []
+    for nom, (aide, seaux) in HISTOGRAMMES.items():
+        lignes.append(f'# HELP {nom} {aide}')
+        lignes.append(f'# TYPE {nom} histogram')
+        for (nom_serie, etiquettes), valeurs in sorted(series.items()):
+            if nom_serie != nom:
+                continue
+            cumul = 0
+            for borne, nombre in zip(seaux, valeurs):
+                cumul += nombre
+                lignes.append(f'{nom}_bucket{{{_etiquettes(etiquettes + (("le", borne),))}}} {cumul}')
+            lignes.append(f'{nom}_bucket{{{_etiquettes(etiquettes + (("le", "+Inf"),))}}} {valeurs[-1]}')
+            lignes.append(f'{nom}_sum{{{_etiquettes(etiquettes)}}} {valeurs[-2]}')
+            lignes.append(f'{nom}_count{{{_etiquettes(etiquettes)}}} {valeurs[-1]}')
+    return '\n'.join(lignes) + '\n'
+
+
+# Mesure SQL de la requête HTTP en cours (None hors requête).
+_mesure_sql = contextvars.ContextVar('ticketing_mesure_sql', default=None)
+
+
+class MesureSQL:
+    __slots__ = ('nombre', 'duree')
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+
+def mesurer_sql(execute, sql, params, many, context):
+    """
+    execute_wrapper installé sur chaque connexion (voir ticketing/signals.py).
+    """
+    mesure = _mesure_sql.get()
+    if mesure is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesure.duree += time.perf_counter() - debut
+        mesure.nombre += 1
+
+
+def installer_sur(connexion):
+    if mesurer_sql not in connexion.execute_wrappers:
+        connexion.execute_wrappers.append(mesurer_sql)
+
+
+def debut_requete():
+    mesure = MesureSQL()
+    return mesure, _mesure_sql.set(mesure), time.perf_counter()
+
+
+def fin_requete(request, response, mesure, jeton, debut):
+    duree = time.perf_counter() - debut
+    _mesure_sql.reset(jeton)
+    correspondance = getattr(request, 'resolver_match', None)
+    etiquettes = {'vue': correspondance.view_name if correspondance else 'non_resolue'}
+    registre.observer('ticketing_vue_duree_secondes', etiquettes, duree)
+    registre.observer('ticketing_vue_requetes_sql', etiquettes, mesure.nombre)
+    registre.observer('ticketing_vue_sql_secondes', etiquettes, mesure.duree)
+    if not response.streaming:
+        registre.observer('ticketing_vue_reponse_octets', etiquettes, len(response.content))
+    config = configuration()
+    if config['REPERTOIRE']:
+        registre.ecrire(config['REPERTOIRE'], intervalle=config['INTERVALLE_ECRITURE'])
+
+
+@contextmanager
+def chronometre_paiement(operation):
+    """
+    Mesure un appel au fournisseur de paiement (résultat ok ou erreur).
+    Utilisable dans du code synchrone comme asynchrone.
+    """
+    debut = time.perf_counter()
+    resultat = 'erreur'
+    try:
+        yield
+        resultat = 'ok'
+    finally:
+        if configuration()['ACTIVE']:
+            registre.observer(
+                'ticketing_paiement_duree_secondes',
+                {'operation': operation, 'resultat': resultat},
+                time.perf_counter() - debut,
+            )
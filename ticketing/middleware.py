@@ -0,0 +1,159 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.shortcuts import render
+from django.utils.deprecation import MiddlewareMixin
+
+from . import file_attente, metriques, profilage, replicas
+
+
+class FileAttenteMiddleware(MiddlewareMixin):
+    """
+    Met en file d'attente les visiteurs des vues de mise en vente
+    (FILE_ATTENTE['VUES']) et n'en laisse passer qu'un nombre limité par
+    seconde. La page d'attente est servie sans accès à la base : ni la session
+    ni l'utilisateur ne sont chargés.
+
+    MiddlewareMixin le rend utilisable en synchrone comme en asynchrone : sous
+    ASGI, il ne force pas les vues asynchrones à passer par un thread.
+    """
+    def process_response(self, request, response):
+        cookie = getattr(request, '_file_attente_cookie', None)
+        if cookie:
+            file_attente.ecrire_cookie(response, *cookie)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = file_attente.configuration()
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if not config['ACTIVE'] or url_name not in config['VUES']:
+            return None
+
+        portee = file_attente.portee_pour_vue(url_name, view_kwargs)
+        place, valeur_cookie = file_attente.placer(request, portee)
+        if valeur_cookie:
+            request._file_attente_cookie = (portee, valeur_cookie)
+        if place.admis:
+            return None
+
+        response = render(request, 'ticket_app/file_attente.html', {
+            'place': place,
+            'rafraichir': min(max(place.attente_estimee, 2), 15),
+        }, status=503)
+        response['Retry-After'] = str(place.attente_estimee)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class MetriquesMiddleware:
+    """
+    Mesure chaque requête (durée, requêtes SQL, temps en base, taille de la
+    réponse) par nom de vue ; voir ticketing/metriques.py. À placer en tête de
+    MIDDLEWARE pour inclure le coût des autres middlewares.
+
+    Contrairement à FileAttenteMiddleware, il doit entourer tout le traitement
+    (la mesure SQL vit pendant l'appel à get_response) : il implémente donc
+    directement les deux modes, synchrone et asynchrone.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not metriques.configuration()['ACTIVE']:
+            return self.get_response(request)
+        mesure = metriques.debut_requete()
+        response = self.get_response(request)
+        metriques.fin_requete(request, response, *mesure)
+        return response
+
+    async def __acall__(self, request):
+        if not metriques.configuration()['ACTIVE']:
+            return await self.get_response(request)
+        mesure = metriques.debut_requete()
+        response = await self.get_response(request)
+        metriques.fin_requete(request, response, *mesure)
+        return response
+
+
+class ProfilageMiddleware:
+    """
+    Profile les requêtes tirées au sort ou portant l'en-tête signé de
+    profilage ; voir ticketing/profilage.py. Les autres requêtes ne paient
+    qu'un tirage et une lecture d'en-tête.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = profilage.configuration()
+        if not profilage.a_profiler(request, config):
+            return self.get_response(request)
+        mesure = profilage.debut(config)
+        if mesure is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            profilage.abandonner(*mesure)
+            raise
+        profilage.fin(request, response, config, *mesure)
+        return response
+
+    async def __acall__(self, request):
+        # En asynchrone, cProfile ne voit que le thread de la boucle
+        # d'événements ; les requêtes SQL lentes sont toutes capturées.
+        config = profilage.configuration()
+        if not profilage.a_profiler(request, config):
+            return await self.get_response(request)
+        mesure = profilage.debut(config)
+        if mesure is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            profilage.abandonner(*mesure)
+            raise
+        # Les EXPLAIN passent par l'ORM synchrone, hors de la boucle.
+        profil = profilage.arreter(request, response, config, *mesure)
+        await sync_to_async(profilage.conserver)(profil, config)
+        return response
+
+
+class ReplicasMiddleware:
+    """
+    Choisit la base des lectures de la requête (ticketing/replicas.py) et
+    pose le cookie d'épinglage après une écriture. À placer avant
+    SessionMiddleware : la session et l'utilisateur sont lus comme le reste.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        jeton = replicas.debut_requete(request)
+        return replicas.fin_requete(self.get_response(request), jeton)
+
+    async def __acall__(self, request):
+        jeton = replicas.debut_requete(request)
+        return replicas.fin_requete(await self.get_response(request), jeton)
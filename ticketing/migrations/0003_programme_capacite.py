@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:41
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def initialiser_inventaire(apps, schema_editor):
+    """
+    Jauge des programmes existants : CAPACITE_INITIALE, ou les billets déjà
+    réservés s'ils la dépassent ; les places restantes en sont déduites.
+    Sans cela, tous les programmes existants seraient complets.
+    """
+    Programme = apps.get_model('ticketing', 'Programme')
+    Reservation = apps.get_model('ticketing', 'Reservation')
+    capacites = getattr(settings, 'CAPACITE_INITIALE', {})
+    reserves = {
+        (ligne['programme_id'], ligne['type_reservation']): ligne['billets']
+        for ligne in Reservation.objects.values('programme_id', 'type_reservation').annotate(
+            billets=Sum('nombre_billet')
+        ).order_by()
+    }
+    programmes = list(Programme.objects.only('pk'))
+    for programme in programmes:
+        for section in ('A', 'B'):
+            vendus = reserves.get((programme.pk, section), 0)
+            capacite = max(capacites.get(section, 0), vendus)
+            setattr(programme, f'capacite_{section.lower()}', capacite)
+            setattr(programme, f'places_restantes_{section.lower()}', capacite - vendus)
+    Programme.objects.bulk_update(
+        programmes, ['capacite_a', 'capacite_b', 'places_restantes_a', 'places_restantes_b'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0002_remove_programme_agent_createur_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programme',
+            name='capacite_a',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='programme',
+            name='capacite_b',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='programme',
+            name='places_restantes_a',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='programme',
+            name='places_restantes_b',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='nombre_billet',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='type_reservation',
+            field=models.CharField(choices=[('A', 'Section A'), ('B', 'Section B')], max_length=50),
+        ),
+        migrations.RunPython(initialiser_inventaire, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='programme',
+            constraint=models.CheckConstraint(condition=models.Q(('places_restantes_a__gte', 0), ('places_restantes_a__lte', models.F('capacite_a'))), name='programme_places_restantes_a_valides'),
+        ),
+        migrations.AddConstraint(
+            model_name='programme',
+            constraint=models.CheckConstraint(condition=models.Q(('places_restantes_b__gte', 0), ('places_restantes_b__lte', models.F('capacite_b'))), name='programme_places_restantes_b_valides'),
+        ),
+    ]
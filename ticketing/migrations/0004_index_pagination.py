@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0003_programme_capacite'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paiement',
+            index=models.Index(fields=['date_paiement', 'id_paiement'], name='paiement_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date_reservation', 'id_reservation'], name='reservation_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['programme', 'date_reservation', 'id_reservation'], name='reservation_prog_date_id_idx'),
+        ),
+    ]
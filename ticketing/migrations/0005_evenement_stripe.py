@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0004_index_pagination'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementStripe',
+            fields=[
+                ('id_evenement', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('type_evenement', models.CharField(max_length=100)),
+                ('payload', models.TextField()),
+                ('statut', models.CharField(choices=[('recu', 'Reçu'), ('traite', 'Traité'), ('echec', 'En échec (sera retenté)'), ('abandonne', 'Abandonné')], default='recu', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('recu_le', models.DateTimeField(auto_now_add=True)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('traite_le', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('statut__in', ['recu', 'echec'])), fields=['prochain_essai'], name='evenement_a_traiter_idx')],
+            },
+        ),
+    ]
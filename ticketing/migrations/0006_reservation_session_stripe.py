@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0005_evenement_stripe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='stripe_session_expire',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='stripe_session_montant',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='stripe_session_url',
+            field=models.TextField(blank=True),
+        ),
+    ]
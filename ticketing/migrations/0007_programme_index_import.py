@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0006_reservation_session_stripe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='programme',
+            index=models.Index(fields=['date', 'stadium'], name='programme_date_stade_idx'),
+        ),
+    ]
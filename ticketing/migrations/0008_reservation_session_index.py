@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0007_programme_index_import'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
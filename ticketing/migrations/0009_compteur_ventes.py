@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def remplir_compteurs(apps, schema_editor):
+    """
+    Initialise les compteurs à partir des ventes existantes.
+    """
+    Reservation = apps.get_model('ticketing', 'Reservation')
+    Paiement = apps.get_model('ticketing', 'Paiement')
+    CompteurVentes = apps.get_model('ticketing', 'CompteurVentes')
+    compteurs = {}
+    for ligne in Reservation.objects.values('programme_id', 'type_reservation').annotate(
+        billets=Sum('nombre_billet')
+    ).order_by():
+        cle = (ligne['programme_id'], ligne['type_reservation'])
+        compteurs[cle] = CompteurVentes(programme_id=cle[0], section=cle[1], billets_reserves=ligne['billets'])
+    for ligne in Paiement.objects.values('reservation__programme_id', 'reservation__type_reservation').annotate(
+        billets=Sum('reservation__nombre_billet'), recette=Sum('montant')
+    ).order_by():
+        compteur = compteurs[(ligne['reservation__programme_id'], ligne['reservation__type_reservation'])]
+        compteur.billets_payes = ligne['billets']
+        compteur.recette = ligne['recette']
+    CompteurVentes.objects.bulk_create(compteurs.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0008_reservation_session_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurVentes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('A', 'Section A'), ('B', 'Section B')], max_length=50)),
+                ('billets_reserves', models.IntegerField(default=0)),
+                ('billets_payes', models.IntegerField(default=0)),
+                ('recette', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('programme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compteurs', to='ticketing.programme')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('programme', 'section'), name='compteur_programme_section_unique')],
+            },
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
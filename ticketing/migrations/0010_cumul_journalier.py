@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0009_compteur_ventes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('division', models.CharField(max_length=50)),
+                ('stadium', models.CharField(max_length=200)),
+                ('reservations', models.PositiveIntegerField(default=0)),
+                ('billets_reserves', models.PositiveIntegerField(default=0)),
+                ('paiements', models.PositiveIntegerField(default=0)),
+                ('billets_payes', models.PositiveIntegerField(default=0)),
+                ('recette', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('jour', 'division', 'stadium'), name='cumul_jour_division_stade_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+
+COLONNES = ('nom_equipe1', 'nom_equipe2', 'stadium', 'division')
+
+SQLITE = [
+    "CREATE VIRTUAL TABLE ticketing_programme_fts USING fts5("
+    "nom_equipe1, nom_equipe2, stadium, division, "
+    "content='ticketing_programme', content_rowid='id_programme', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER ticketing_programme_fts_insertion AFTER INSERT ON ticketing_programme BEGIN "
+    "INSERT INTO ticketing_programme_fts(rowid, {colonnes}) VALUES (new.id_programme, {nouvelles}); END",
+    "CREATE TRIGGER ticketing_programme_fts_suppression AFTER DELETE ON ticketing_programme BEGIN "
+    "INSERT INTO ticketing_programme_fts(ticketing_programme_fts, rowid, {colonnes}) "
+    "VALUES ('delete', old.id_programme, {anciennes}); END",
+    "CREATE TRIGGER ticketing_programme_fts_modification AFTER UPDATE OF {colonnes} ON ticketing_programme BEGIN "
+    "INSERT INTO ticketing_programme_fts(ticketing_programme_fts, rowid, {colonnes}) "
+    "VALUES ('delete', old.id_programme, {anciennes}); "
+    "INSERT INTO ticketing_programme_fts(rowid, {colonnes}) VALUES (new.id_programme, {nouvelles}); END",
+    # Indexe les programmes existants.
+    "INSERT INTO ticketing_programme_fts(ticketing_programme_fts) VALUES ('rebuild')",
+]
+SQLITE_RETOUR = [
+    'DROP TRIGGER IF EXISTS ticketing_programme_fts_insertion',
+    'DROP TRIGGER IF EXISTS ticketing_programme_fts_suppression',
+    'DROP TRIGGER IF EXISTS ticketing_programme_fts_modification',
+    'DROP TABLE IF EXISTS ticketing_programme_fts',
+]
+
+# Même expression que ticketing.recherche.VECTEUR_POSTGRES : l'index n'est
+# utilisé que si la requête la reproduit à l'identique.
+POSTGRES = [
+    "CREATE INDEX ticketing_programme_recherche ON ticketing_programme USING gin ("
+    "to_tsvector('simple', coalesce(nom_equipe1, '') || ' ' || coalesce(nom_equipe2, '') || ' ' "
+    "|| coalesce(stadium, '') || ' ' || coalesce(division, '')))",
+]
+POSTGRES_RETOUR = ['DROP INDEX IF EXISTS ticketing_programme_recherche']
+
+
+def _executer(schema_editor, instructions):
+    colonnes = ', '.join(COLONNES)
+    for instruction in instructions:
+        schema_editor.execute(instruction.format(
+            colonnes=colonnes,
+            nouvelles=', '.join(f'new.{colonne}' for colonne in COLONNES),
+            anciennes=', '.join(f'old.{colonne}' for colonne in COLONNES),
+        ))
+
+
+def creer_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _executer(schema_editor, SQLITE)
+    elif vendor == 'postgresql':
+        _executer(schema_editor, POSTGRES)
+
+
+def supprimer_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _executer(schema_editor, SQLITE_RETOUR)
+    elif vendor == 'postgresql':
+        _executer(schema_editor, POSTGRES_RETOUR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0010_cumul_journalier'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
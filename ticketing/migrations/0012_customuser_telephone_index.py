@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def creer_index_agents(apps, schema_editor):
+    """
+    Index partiel des noms d'utilisateur du staff : la saisie assistée des
+    agents ne parcourt pas les comptes spectateurs de même préfixe.
+    """
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX ticketing_agents_username_idx ON {schema_editor.quote_name(table)} (username) WHERE is_staff'
+    )
+
+
+def supprimer_index_agents(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP INDEX IF EXISTS ticketing_agents_username_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ticketing', '0011_recherche_programmes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='num_phone',
+            field=models.CharField(blank=True, db_index=True, max_length=15, null=True),
+        ),
+        migrations.RunPython(creer_index_agents, supprimer_index_agents),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0012_customuser_telephone_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compteurventes',
+            name='dernier_billet',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Billet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('A', 'Section A'), ('B', 'Section B')], max_length=1)),
+                ('numero', models.PositiveIntegerField()),
+                ('code', models.CharField(max_length=40)),
+                ('emis_le', models.DateTimeField(auto_now_add=True)),
+                ('programme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billets', to='ticketing.programme')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billets', to='ticketing.reservation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('programme', 'section', 'numero'), name='billet_programme_section_numero_unique')],
+            },
+        ),
+    ]
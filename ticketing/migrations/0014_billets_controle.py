@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0013_billets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billet',
+            name='appareil',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='billet',
+            name='utilise_le',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0014_billets_controle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='expire_le',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='statut',
+            field=models.CharField(choices=[('attente', 'En attente de paiement'), ('confirmee', 'Confirmée'), ('expiree', 'Expirée')], default='confirmee', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('statut', 'attente')), fields=['expire_le'], name='reservation_option_expire_idx'),
+        ),
+    ]
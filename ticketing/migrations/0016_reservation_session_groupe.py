@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir_session_groupe(apps, schema_editor):
+    """
+    Sessions de groupe existantes : celles que partagent plusieurs réservations.
+    """
+    Reservation = apps.get_model('ticketing', 'Reservation')
+    sessions = (
+        Reservation.objects.exclude(stripe_session_id='').values('stripe_session_id')
+        .annotate(nombre=Count('pk')).filter(nombre__gt=1).values_list('stripe_session_id', flat=True)
+    )
+    for session_id in sessions:
+        Reservation.objects.filter(stripe_session_id=session_id).update(session_groupe=session_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticketing', '0015_reservations_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='session_groupe',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.RunPython(remplir_session_groupe, migrations.RunPython.noop),
+    ]
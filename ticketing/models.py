@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.conf import settings
 
 class CustomUser(AbstractUser):
@@ -8,7 +11,7 @@ class CustomUser(AbstractUser):
     Il remplace les modèles 'Agent' et 'Spectateur' pour une gestion simplifiée.
     """
     # Champ spécifique au Spectateur
-    num_phone = models.CharField(max_length=15, blank=True, null=True)
+    num_phone = models.CharField(max_length=15, blank=True, null=True, db_index=True)
     ville_spect = models.CharField(max_length=100, blank=True, null=True)
 
     # Nous utiliserons les permissions et les groupes de Django pour différencier
@@ -51,6 +54,14 @@ class Programme(models.Model):
     division = models.CharField(max_length=50)
     prix_a = models.DecimalField(max_digits=10, decimal_places=2)
     prix_b = models.DecimalField(max_digits=10, decimal_places=2)
+
+    # Capacité par section et places encore disponibles.
+    # Les places restantes ne sont jamais écrites par save() : elles sont
+    # décrémentées par des UPDATE conditionnels (voir ticketing/inventory.py).
+    capacite_a = models.PositiveIntegerField(default=0)
+    capacite_b = models.PositiveIntegerField(default=0)
+    places_restantes_a = models.PositiveIntegerField(default=0)
+    places_restantes_b = models.PositiveIntegerField(default=0)
     
     # La relation est maintenant vers le modèle CustomUser
     agent = models.ForeignKey(
@@ -59,17 +70,67 @@ class Programme(models.Model):
         related_name='programmes_crees'
     )
 
+    class Meta:
+        indexes = [
+            # Recherche des programmes existants lors des imports de saison.
+            models.Index(fields=['date', 'stadium'], name='programme_date_stade_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(places_restantes_a__gte=0) & Q(places_restantes_a__lte=F('capacite_a')),
+                name='programme_places_restantes_a_valides',
+            ),
+            models.CheckConstraint(
+                condition=Q(places_restantes_b__gte=0) & Q(places_restantes_b__lte=F('capacite_b')),
+                name='programme_places_restantes_b_valides',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.nom_equipe1} vs {self.nom_equipe2}"
 
+    def save(self, *args, **kwargs):
+        """
+        À la création, toutes les places sont disponibles.
+        À la mise à jour, les colonnes d'inventaire ne sont pas réécrites depuis
+        l'instance (qui peut être périmée) : un changement de capacité est
+        reporté sur les places restantes par un UPDATE relatif.
+        """
+        if self._state.adding or kwargs.get('update_fields') is not None:
+            if self._state.adding:
+                self.places_restantes_a = self.capacite_a
+                self.places_restantes_b = self.capacite_b
+            return super().save(*args, **kwargs)
+
+        inventaire = ('capacite_a', 'capacite_b', 'places_restantes_a', 'places_restantes_b')
+        kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in inventaire
+        ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Dans un UPDATE, F('capacite_x') désigne l'ancienne valeur de la ligne.
+            Programme.objects.filter(pk=self.pk).update(
+                capacite_a=self.capacite_a,
+                capacite_b=self.capacite_b,
+                places_restantes_a=F('places_restantes_a') + self.capacite_a - F('capacite_a'),
+                places_restantes_b=F('places_restantes_b') + self.capacite_b - F('capacite_b'),
+            )
+        self.refresh_from_db(fields=inventaire)
+
 class Reservation(models.Model):
     """
     Cette classe représente une réservation de billet.
     """
     id_reservation = models.AutoField(primary_key=True)
+    SECTION_CHOICES = [
+        ('A', 'Section A'),
+        ('B', 'Section B'),
+    ]
+
     date_reservation = models.DateField(auto_now_add=True)
-    type_reservation = models.CharField(max_length=50)
-    nombre_billet = models.IntegerField()
+    type_reservation = models.CharField(max_length=50, choices=SECTION_CHOICES)
+    nombre_billet = models.IntegerField(validators=[MinValueValidator(1)])
     
     # La relation est maintenant vers le modèle CustomUser
     spectateur = models.ForeignKey(
@@ -83,6 +144,44 @@ class Reservation(models.Model):
         related_name='reservations'
     )
 
+    # Dernière session de paiement Stripe ouverte pour cette réservation,
+    # réutilisée tant qu'elle n'a pas expiré et que le montant n'a pas changé.
+    # Indexé : le webhook d'une session de groupe retrouve ses réservations par cet identifiant.
+    stripe_session_id = models.CharField(max_length=255, blank=True, db_index=True)
+    stripe_session_url = models.TextField(blank=True)
+    stripe_session_expire = models.DateTimeField(blank=True, null=True)
+    stripe_session_montant = models.PositiveIntegerField(blank=True, null=True)
+    # Session de paiement du groupe de la réservation (reservation_groupe).
+    # Contrairement à stripe_session_id, jamais remplacée par un paiement
+    # individuel : le webhook du groupe retrouve ses réservations par elle.
+    session_groupe = models.CharField(max_length=255, blank=True, db_index=True)
+
+    # Une réservation en ligne est une option jusqu'à `expire_le` : confirmée
+    # par son paiement, ou expirée (places rendues) par ticketing/expirations.py.
+    STATUT_EN_ATTENTE = 'attente'
+    STATUT_CONFIRMEE = 'confirmee'
+    STATUT_EXPIREE = 'expiree'
+    STATUT_CHOICES = [
+        (STATUT_EN_ATTENTE, 'En attente de paiement'),
+        (STATUT_CONFIRMEE, 'Confirmée'),
+        (STATUT_EXPIREE, 'Expirée'),
+    ]
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default=STATUT_CONFIRMEE)
+    expire_le = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Pagination par curseur de la gestion des réservations.
+            models.Index(fields=['date_reservation', 'id_reservation'], name='reservation_date_id_idx'),
+            models.Index(fields=['programme', 'date_reservation', 'id_reservation'], name='reservation_prog_date_id_idx'),
+            # Partiel : seules les options en cours y figurent, l'historique
+            # des réservations ne ralentit pas la recherche des expirées.
+            models.Index(
+                fields=['expire_le'], name='reservation_option_expire_idx',
+                condition=models.Q(statut='attente'),
+            ),
+        ]
+
     def __str__(self):
         return f"Réservation {self.id_reservation} par {self.spectateur.username}"
 
@@ -101,6 +200,139 @@ class Paiement(models.Model):
         on_delete=models.CASCADE, 
         related_name='paiement'
     )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_paiement', 'id_paiement'], name='paiement_date_id_idx'),
+        ]
     
     def __str__(self):
         return f"Paiement {self.id_paiement} pour réservation {self.reservation.id_reservation}"
+
+
+class Billet(models.Model):
+    """
+    Billet électronique : un par place d'une réservation payée. Le code signé
+    (voir ticketing/billets.py) identifie le programme, la section et le
+    numéro du billet, et se vérifie sans accès à la base.
+    """
+    reservation = models.ForeignKey(
+        'Reservation',
+        on_delete=models.CASCADE,
+        related_name='billets'
+    )
+    programme = models.ForeignKey(
+        'Programme',
+        on_delete=models.CASCADE,
+        related_name='billets'
+    )
+    section = models.CharField(max_length=1, choices=Reservation.SECTION_CHOICES)
+    numero = models.PositiveIntegerField()
+    code = models.CharField(max_length=40)
+    emis_le = models.DateTimeField(auto_now_add=True)
+    # Passage au contrôle retenu (le plus ancien, voir ticketing/controle.py).
+    utilise_le = models.DateTimeField(blank=True, null=True)
+    appareil = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['programme', 'section', 'numero'], name='billet_programme_section_numero_unique'),
+        ]
+
+    def __str__(self):
+        return f"Billet {self.section}-{self.numero} du programme {self.programme_id}"
+
+
+class CompteurVentes(models.Model):
+    """
+    Compteurs de ventes d'un programme pour une section, tenus à jour à chaque
+    réservation et paiement (voir ticketing/compteurs.py) : la liste des
+    programmes les lit sans parcourir les réservations.
+    """
+    programme = models.ForeignKey(
+        'Programme',
+        on_delete=models.CASCADE,
+        related_name='compteurs'
+    )
+    section = models.CharField(max_length=50, choices=Reservation.SECTION_CHOICES)
+    billets_reserves = models.IntegerField(default=0)
+    billets_payes = models.IntegerField(default=0)
+    recette = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Dernier numéro de billet électronique attribué dans la section (ticketing/billets.py).
+    dernier_billet = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['programme', 'section'], name='compteur_programme_section_unique'),
+        ]
+
+    def __str__(self):
+        return f"Ventes {self.programme_id} section {self.section}"
+
+
+class CumulJournalier(models.Model):
+    """
+    Ventes d'une journée pour une division et un stade, calculées par la
+    commande cumuler_ventes. Les réservations sont comptées au jour de leur
+    création, les paiements au jour de leur encaissement. Les rapports de
+    saison ne lisent que cette table.
+    """
+    jour = models.DateField()
+    division = models.CharField(max_length=50)
+    stadium = models.CharField(max_length=200)
+    reservations = models.PositiveIntegerField(default=0)
+    billets_reserves = models.PositiveIntegerField(default=0)
+    paiements = models.PositiveIntegerField(default=0)
+    billets_payes = models.PositiveIntegerField(default=0)
+    recette = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'division', 'stadium'], name='cumul_jour_division_stade_unique'),
+        ]
+
+    def __str__(self):
+        return f"Ventes du {self.jour} ({self.division}, {self.stadium})"
+
+
+class EvenementStripe(models.Model):
+    """
+    Boîte de réception des webhooks Stripe.
+    La vue stripe_webhook se contente d'y enregistrer l'événement brut (une
+    seule fois par identifiant) ; la commande traiter_webhooks le traite
+    ensuite en arrière-plan.
+    """
+    STATUT_RECU = 'recu'
+    STATUT_TRAITE = 'traite'
+    STATUT_ECHEC = 'echec'
+    STATUT_ABANDONNE = 'abandonne'
+    STATUT_CHOICES = [
+        (STATUT_RECU, 'Reçu'),
+        (STATUT_TRAITE, 'Traité'),
+        (STATUT_ECHEC, 'En échec (sera retenté)'),
+        (STATUT_ABANDONNE, 'Abandonné'),
+    ]
+
+    id_evenement = models.CharField(max_length=255, primary_key=True)
+    type_evenement = models.CharField(max_length=100)
+    payload = models.TextField()
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default=STATUT_RECU)
+    tentatives = models.PositiveIntegerField(default=0)
+    derniere_erreur = models.TextField(blank=True)
+    recu_le = models.DateTimeField(auto_now_add=True)
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    traite_le = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Seuls les événements à traiter sont indexés : l'index reste petit
+            # quel que soit l'historique.
+            models.Index(
+                fields=['prochain_essai'],
+                name='evenement_a_traiter_idx',
+                condition=Q(statut__in=['recu', 'echec']),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type_evenement} {self.id_evenement} ({self.get_statut_display()})"
@@ -0,0 +1,63 @@
+"""
+Pagination par curseur (keyset) sur un couple (date, identifiant).
+
+Contrairement à OFFSET, chaque page est obtenue par une comparaison sur
+l'index (date, id) : son coût ne dépend pas de la profondeur de la page ni de
+la taille de la table. Aucun COUNT(*) n'est effectué.
+"""
+import datetime
+from dataclasses import dataclass
+
+from django.db.models import Q
+
+
+TAILLE_PAGE = 50
+
+
+@dataclass
+class PageKeyset:
+    objets: list
+    curseur_suivant: str | None
+
+    def __iter__(self):
+        return iter(self.objets)
+
+    def __len__(self):
+        return len(self.objets)
+
+
+def encoder_curseur(date, identifiant):
+    return f'{date.isoformat()}_{identifiant}'
+
+
+def decoder_curseur(curseur):
+    """
+    Renvoie (date, identifiant), ou None si le curseur est absent ou invalide.
+    """
+    try:
+        date, identifiant = curseur.split('_')
+        return datetime.date.fromisoformat(date), int(identifiant)
+    except (AttributeError, ValueError):
+        return None
+
+
+def paginer(queryset, champ_date, champ_id, curseur=None, taille=TAILLE_PAGE):
+    """
+    Renvoie la page de `queryset` (du plus récent au plus ancien) qui suit
+    `curseur`. Une ligne de plus est lue pour savoir s'il existe une page
+    suivante.
+    """
+    position = decoder_curseur(curseur)
+    if position:
+        date, identifiant = position
+        queryset = queryset.filter(
+            Q(**{f'{champ_date}__lt': date})
+            | Q(**{champ_date: date, f'{champ_id}__lt': identifiant})
+        )
+    objets = list(queryset.order_by(f'-{champ_date}', f'-{champ_id}')[:taille + 1])
+    curseur_suivant = None
+    if len(objets) > taille:
+        objets = objets[:taille]
+        dernier = objets[-1]
+        curseur_suivant = encoder_curseur(getattr(dernier, champ_date), getattr(dernier, champ_id))
+    return PageKeyset(objets, curseur_suivant)
@@ -0,0 +1,288 @@
+"""
+Client de paiement Stripe partagé par les vues de paiement.
+
+Les appels passent par un StripeClient unique (par processus pour la version
+synchrone, par boucle d'événements pour la version asynchrone) qui réutilise
+ses connexions HTTP (pool httpx) et impose des délais stricts : un fournisseur
+lent ne peut plus bloquer un worker pendant les 80 s par défaut de Stripe.
+
+Une session ouverte est mémorisée sur la réservation et réutilisée tant
+qu'elle n'a pas expiré et que le montant n'a pas changé : les doubles clics et
+rechargements ne coûtent plus d'aller-retour chez le fournisseur. Deux clics
+simultanés, qui ne voient encore aucune session, envoient la même clé
+d'idempotence (cle_idempotence) : Stripe ne crée qu'une session et renvoie
+la même aux deux.
+"""
+import asyncio
+import datetime
+import threading
+import weakref
+from collections import defaultdict
+
+import httpx
+import stripe
+from django.conf import settings
+from django.utils import timezone
+
+from . import metriques
+from .models import Reservation
+
+
+_verrou = threading.Lock()
+_client_sync = None
+_clients_async = weakref.WeakKeyDictionary()
+
+
+def _delais():
+    return httpx.Timeout(
+        getattr(settings, 'STRIPE_DELAI_LECTURE', 10.0),
+        connect=getattr(settings, 'STRIPE_DELAI_CONNEXION', 2.0),
+    )
+
+
+def _nouveau_client(sync):
+    options = {}
+    api_base = getattr(settings, 'STRIPE_API_BASE', None)
+    if api_base:
+        options['base_addresses'] = {'api': api_base}
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        http_client=stripe.HTTPXClient(timeout=_delais(), allow_sync_methods=sync),
+        max_network_retries=getattr(settings, 'STRIPE_MAX_TENTATIVES', 1),
+        **options,
+    )
+
+
+def client():
+    """
+    Client synchrone partagé par les threads du processus.
+    """
+    global _client_sync
+    if _client_sync is None:
+        with _verrou:
+            if _client_sync is None:
+                _client_sync = _nouveau_client(sync=True)
+    return _client_sync
+
+
+def client_async():
+    """
+    Client asynchrone de la boucle d'événements courante : un pool httpx ne
+    peut pas être partagé entre deux boucles.
+    """
+    boucle = asyncio.get_running_loop()
+    instance = _clients_async.get(boucle)
+    if instance is None:
+        instance = _clients_async[boucle] = _nouveau_client(sync=False)
+    return instance
+
+
+def reinitialiser():
+    """
+    Oublie les clients créés (changement de configuration, tests).
+    """
+    global _client_sync
+    with _verrou:
+        _client_sync = None
+        _clients_async.clear()
+
+
+def montant_centimes(reservation):
+    """
+    Prix total de la réservation en centimes, car Stripe travaille avec des entiers.
+    """
+    programme = reservation.programme
+    if reservation.type_reservation == 'A':
+        prix_unitaire = programme.prix_a
+    else:
+        prix_unitaire = programme.prix_b
+    return int(prix_unitaire * reservation.nombre_billet * 100)
+
+
+# Bornes imposées par Stripe à l'expiration d'une session (expires_at).
+EXPIRATION_MIN = datetime.timedelta(minutes=31)
+EXPIRATION_MAX = datetime.timedelta(hours=24)
+
+
+def _expiration(reservations):
+    """
+    Ferme la session à la fin de l'option des réservations (dans les bornes
+    de Stripe) ; une session qui la dépasse retient l'option jusqu'à sa
+    propre fin (expirations.a_expirer).
+    """
+    echeances = [
+        reservation.expire_le for reservation in reservations
+        if reservation.statut == Reservation.STATUT_EN_ATTENTE and reservation.expire_le
+    ]
+    if not echeances:
+        return {}
+    maintenant = timezone.now()
+    # Arrondi à la minute supérieure : deux créations simultanées envoient les
+    # mêmes paramètres (exigé par Stripe pour une même clé d'idempotence).
+    plancher = -(-int((maintenant + EXPIRATION_MIN).timestamp()) // 60) * 60
+    fin = min(max(int(min(echeances).timestamp()), plancher), int((maintenant + EXPIRATION_MAX).timestamp()))
+    return {'expires_at': fin}
+
+
+def parametres_session(reservation, success_url, cancel_url):
+    programme = reservation.programme
+    return {
+        'payment_method_types': ['card'],
+        'line_items': [
+            {
+                'price_data': {
+                    'currency': 'usd',
+                    'unit_amount': montant_centimes(reservation),
+                    'product_data': {
+                        'name': f'Billet pour {programme.nom_equipe1} vs {programme.nom_equipe2}',
+                        'description': f'Réservation pour {reservation.nombre_billet} billet(s) en section {reservation.type_reservation}',
+                    },
+                },
+                'quantity': 1,
+            },
+        ],
+        'metadata': {
+            'reservation_id': reservation.id_reservation,
+        },
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        **_expiration([reservation]),
+    }
+
+
+def cle_idempotence(reservation, montant):
+    """
+    Clé de création de la session qui remplace la session mémorisée (ou
+    aucune) pour ce montant : la même pour des clics simultanés, une nouvelle
+    dès qu'une session a été enregistrée ou que le montant change.
+    """
+    precedente = reservation.stripe_session_id or 'aucune'
+    return f'ticketing-reservation-{reservation.pk}-{montant}-{precedente}'
+
+
+def creer_session(reservation, success_url, cancel_url, montant=None):
+    montant = montant_centimes(reservation) if montant is None else montant
+    with metriques.chronometre_paiement('checkout.sessions.create'):
+        return client().v1.checkout.sessions.create(
+            params=parametres_session(reservation, success_url, cancel_url),
+            options={'idempotency_key': cle_idempotence(reservation, montant)},
+        )
+
+
+async def creer_session_async(reservation, success_url, cancel_url, montant=None):
+    montant = montant_centimes(reservation) if montant is None else montant
+    with metriques.chronometre_paiement('checkout.sessions.create'):
+        return await client_async().v1.checkout.sessions.create_async(
+            params=parametres_session(reservation, success_url, cancel_url),
+            options={'idempotency_key': cle_idempotence(reservation, montant)},
+        )
+
+
+# Une session qui expire dans moins de MARGE_EXPIRATION n'est pas réutilisée :
+# le spectateur n'aurait pas le temps de payer.
+MARGE_EXPIRATION = datetime.timedelta(minutes=5)
+
+
+def session_reutilisable(reservation, montant):
+    """
+    URL de la session ouverte de la réservation si elle peut être réutilisée, sinon None.
+    """
+    if not (reservation.stripe_session_id and reservation.stripe_session_url):
+        return None
+    if reservation.stripe_session_montant != montant:
+        return None
+    if not reservation.stripe_session_expire or reservation.stripe_session_expire <= timezone.now() + MARGE_EXPIRATION:
+        return None
+    return reservation.stripe_session_url
+
+
+def _champs_session(session, montant):
+    return {
+        'stripe_session_id': session.id,
+        'stripe_session_url': session.url,
+        'stripe_session_expire': datetime.datetime.fromtimestamp(session.expires_at, tz=datetime.timezone.utc),
+        'stripe_session_montant': montant,
+    }
+
+
+def url_paiement(reservation, success_url, cancel_url):
+    """
+    URL de paiement de la réservation : la session ouverte si elle est
+    réutilisable, sinon une nouvelle session mémorisée sur la réservation.
+    """
+    montant = montant_centimes(reservation)
+    url = session_reutilisable(reservation, montant)
+    if url:
+        return url
+    session = creer_session(reservation, success_url, cancel_url, montant)
+    # UPDATE ciblé : ne réécrit pas le reste de la réservation.
+    Reservation.objects.filter(pk=reservation.pk).update(**_champs_session(session, montant))
+    return session.url
+
+
+async def url_paiement_async(reservation, success_url, cancel_url):
+    montant = montant_centimes(reservation)
+    url = session_reutilisable(reservation, montant)
+    if url:
+        return url
+    session = await creer_session_async(reservation, success_url, cancel_url, montant)
+    await Reservation.objects.filter(pk=reservation.pk).aupdate(**_champs_session(session, montant))
+    return session.url
+
+
+def parametres_session_groupe(reservations, success_url, cancel_url):
+    """
+    Une seule session pour toutes les réservations d'un groupe : un article
+    par couple (programme, section), les billets étant additionnés.
+    """
+    articles = {}
+    for reservation in reservations:
+        programme = reservation.programme
+        cle = (programme.pk, reservation.type_reservation)
+        if cle not in articles:
+            prix = programme.prix_a if reservation.type_reservation == 'A' else programme.prix_b
+            articles[cle] = {
+                'price_data': {
+                    'currency': 'usd',
+                    'unit_amount': int(prix * 100),
+                    'product_data': {
+                        'name': f'Billet pour {programme.nom_equipe1} vs {programme.nom_equipe2}',
+                        'description': f'Section {reservation.type_reservation}',
+                    },
+                },
+                'quantity': 0,
+            }
+        articles[cle]['quantity'] += reservation.nombre_billet
+    return {
+        'payment_method_types': ['card'],
+        'line_items': list(articles.values()),
+        # Les réservations sont retrouvées par l'identifiant de session
+        # (metadata est limité à 500 caractères par valeur).
+        'metadata': {'groupe': len(reservations)},
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        **_expiration(reservations),
+    }
+
+
+def creer_session_groupe(reservations, success_url, cancel_url):
+    """
+    Crée la session de paiement d'un groupe et la mémorise sur chaque
+    réservation. Le paiement d'une réservation du groupe
+    redirige ensuite vers cette même session, qui règle tout le groupe.
+    """
+    with metriques.chronometre_paiement('checkout.sessions.create'):
+        session = client().v1.checkout.sessions.create(
+            params=parametres_session_groupe(reservations, success_url, cancel_url)
+        )
+    # Chaque réservation garde son propre montant, pour que session_reutilisable
+    # la reconnaisse tant qu'elle n'est pas modifiée : un UPDATE par montant
+    # distinct, et non par réservation.
+    par_montant = defaultdict(list)
+    for reservation in reservations:
+        par_montant[montant_centimes(reservation)].append(reservation.pk)
+    for montant, ids in par_montant.items():
+        Reservation.objects.filter(pk__in=ids).update(**_champs_session(session, montant), session_groupe=session.id)
+    return session
@@ -0,0 +1,235 @@
+"""
+Profilage à la demande des requêtes en production.
+
+Une requête est profilée si elle est tirée au sort (PROFILAGE['TAUX'], 0 par
+défaut) ou si elle porte l'en-tête signé PROFILAGE['EN_TETE'], obtenu par un
+membre du staff via la vue profilage_jeton. Pour une requête profilée, on
+enregistre un profil cProfile (fonctions les plus coûteuses) et chaque
+requête SQL plus lente que PROFILAGE['SEUIL_SQL'] avec son plan d'exécution
+(EXPLAIN).
+
+Les profils sont rangés dans un tampon circulaire du cache (les
+PROFILAGE['TAILLE'] derniers), partagé par les workers si le cache l'est.
+
+Désactivé, le coût est d'un tirage aléatoire et d'une lecture d'en-tête par
+requête, plus une lecture de ContextVar par requête SQL.
+"""
+import contextvars
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+
+from django.core import signing
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+CONFIGURATION_DEFAUT = {
+    # Part des requêtes profilées au hasard (0.01 : une sur cent).
+    'TAUX': 0.0,
+    # En-tête HTTP portant un jeton signé (profilage d'une requête précise).
+    'EN_TETE': 'X-Ticketing-Profil',
+    # Validité d'un jeton, en secondes.
+    'DUREE_JETON': 3600,
+    # Requêtes SQL capturées au-delà de ce seuil, en secondes.
+    'SEUIL_SQL': 0.1,
+    # Nombre de profils conservés.
+    'TAILLE': 50,
+    # Lignes du rapport cProfile conservées.
+    'LIGNES_PROFIL': 40,
+}
+
+SEL_JETON = 'ticketing.profilage'
+CLE_COMPTEUR = 'profilage:compteur'
+
+
+def configuration():
+    return {**CONFIGURATION_DEFAUT, **getattr(settings, 'PROFILAGE', {})}
+
+
+def jeton(utilisateur):
+    """
+    Jeton à placer dans l'en-tête de profilage.
+    """
+    return signing.dumps({'u': utilisateur.pk}, salt=SEL_JETON)
+
+
+def _jeton_valide(valeur, config):
+    try:
+        signing.loads(valeur, salt=SEL_JETON, max_age=config['DUREE_JETON'])
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def a_profiler(request, config):
+    if config['TAUX'] and random.random() < config['TAUX']:
+        return True
+    valeur = request.headers.get(config['EN_TETE'])
+    return bool(valeur) and _jeton_valide(valeur, config)
+
+
+# Un seul profil à la fois par processus : à partir de Python 3.12, cProfile
+# repose sur sys.monitoring, commun à tous les threads, et un second enable()
+# lève ValueError (avant 3.12, il remplaçait le premier profileur).
+_verrou_profil = threading.Lock()
+
+# Requêtes SQL lentes de la requête HTTP profilée en cours (None sinon).
+_capture = contextvars.ContextVar('ticketing_profilage', default=None)
+
+
+def capturer_sql(execute, sql, params, many, context):
+    """
+    execute_wrapper installé sur chaque connexion (voir ticketing/signals.py).
+    """
+    capture = _capture.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duree = time.perf_counter() - debut
+        capture['nombre_sql'] += 1
+        capture['duree_sql'] += duree
+        if duree >= capture['seuil']:
+            capture['lentes'].append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': None if many else params,
+                'duree': duree,
+            })
+
+
+def installer_sur(connexion):
+    if capturer_sql not in connexion.execute_wrappers:
+        connexion.execute_wrappers.append(capturer_sql)
+
+
+def _plan(requete):
+    """
+    Plan d'exécution d'une requête lente (SELECT uniquement : EXPLAIN ANALYZE
+    n'est jamais utilisé, rien n'est réexécuté).
+    """
+    if not requete['sql'].lstrip().upper().startswith('SELECT'):
+        return ''
+    connexion = connections[requete['alias']]
+    try:
+        with connexion.cursor() as curseur:
+            curseur.execute(f"{connexion.ops.explain_query_prefix()} {requete['sql']}", requete['params'])
+            return '\n'.join(' '.join(str(colonne) for colonne in ligne) for ligne in curseur.fetchall())
+    except Exception as e:
+        return f"EXPLAIN impossible : {e}"
+
+
+def debut(config):
+    """
+    Démarre la mesure ; renvoie None si un autre profil est en cours (la
+    requête est alors servie sans profilage).
+    """
+    if not _verrou_profil.acquire(blocking=False):
+        return None
+    profil = cProfile.Profile()
+    try:
+        profil.enable()
+    except ValueError:
+        # Un autre outil de profilage (hors de ce module) est actif.
+        _verrou_profil.release()
+        return None
+    capture = {'seuil': config['SEUIL_SQL'], 'lentes': [], 'nombre_sql': 0, 'duree_sql': 0.0}
+    jeton_capture = _capture.set(capture)
+    return capture, jeton_capture, profil, time.perf_counter()
+
+
+def abandonner(capture, jeton_capture, profil, debut):
+    """
+    Arrête la mesure sans rien enregistrer (la vue a levé une exception).
+    """
+    profil.disable()
+    _verrou_profil.release()
+    _capture.reset(jeton_capture)
+
+
+def arreter(request, response, config, capture, jeton_capture, profil, debut):
+    """
+    Arrête la mesure (dans le contexte de la requête) ; renvoie le profil,
+    sans les plans des requêtes lentes.
+    """
+    profil.disable()
+    duree = time.perf_counter() - debut
+    _verrou_profil.release()
+    _capture.reset(jeton_capture)
+
+    sortie = io.StringIO()
+    pstats.Stats(profil, stream=sortie).sort_stats('cumulative').print_stats(config['LIGNES_PROFIL'])
+    correspondance = getattr(request, 'resolver_match', None)
+    return {
+        'date': timezone.now().isoformat(),
+        'methode': request.method,
+        'chemin': request.get_full_path(),
+        'vue': correspondance.view_name if correspondance else '',
+        'statut': response.status_code,
+        'duree': duree,
+        'nombre_sql': capture['nombre_sql'],
+        'duree_sql': capture['duree_sql'],
+        'sql_lentes': capture['lentes'],
+        'profil': sortie.getvalue(),
+    }
+
+
+def conserver(profil, config):
+    """
+    Ajoute les plans d'exécution des requêtes lentes et enregistre le profil.
+    Exécute des requêtes SQL : en asynchrone, à appeler via sync_to_async.
+    """
+    profil['sql_lentes'] = [
+        {'sql': requete['sql'], 'duree': requete['duree'], 'plan': _plan(requete)}
+        for requete in profil['sql_lentes']
+    ]
+    enregistrer(profil, config)
+
+
+def fin(request, response, config, *mesure):
+    conserver(arreter(request, response, config, *mesure), config)
+
+
+def _cle(numero, config):
+    return f"profilage:{numero % config['TAILLE']}"
+
+
+def enregistrer(profil, config):
+    """
+    Range un profil dans le tampon circulaire : le plus ancien est écrasé.
+    """
+    cache.add(CLE_COMPTEUR, 0, timeout=None)
+    numero = cache.incr(CLE_COMPTEUR)
+    profil['numero'] = numero
+    cache.set(_cle(numero, config), profil, timeout=None)
+    return numero
+
+
+def derniers(config=None):
+    """
+    Profils du tampon, du plus récent au plus ancien.
+    """
+    config = config or configuration()
+    dernier = cache.get(CLE_COMPTEUR) or 0
+    numeros = range(dernier, max(dernier - config['TAILLE'], 0), -1)
+    profils = cache.get_many([_cle(numero, config) for numero in numeros])
+    return [
+        profils[_cle(numero, config)] for numero in numeros
+        if profils.get(_cle(numero, config), {}).get('numero') == numero
+    ]
+
+
+def profil(numero, config=None):
+    config = config or configuration()
+    resultat = cache.get(_cle(numero, config))
+    if resultat is None or resultat.get('numero') != numero:
+        return None
+    return resultat
@@ -0,0 +1,185 @@
+"""
+Recherche plein texte des programmes (équipes, stade, division).
+
+L'index est tenu par la base, pour toutes les écritures (save, delete, mais
+aussi les INSERT/UPDATE en masse des imports et de la génération de données) :
+
+- SQLite : table FTS5 ticketing_programme_fts (contenu externe, tenue à jour
+  par des triggers), classement bm25 ;
+- PostgreSQL : index GIN sur l'expression to_tsvector('simple', ...),
+  classement ts_rank.
+
+Chaque mot saisi est cherché comme préfixe ("esp sfax" trouve « Espérance »
+contre « CS Sfaxien ») ; sous SQLite, les accents sont ignorés. Les autres
+bases se rabattent sur des LIKE, sans index.
+
+Voir la migration 0011_recherche_programmes. Sous SQLite, une migration qui
+reconstruit la table ticketing_programme (modification de champ) supprime
+ses triggers : la migration suivante doit les recréer.
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Programme
+
+
+TAILLE_PAGE = 20
+# Au-delà, OFFSET coûte cher et l'utilisateur doit affiner sa recherche.
+PAGES_MAX = 50
+MOTS_MAX = 8
+
+TABLE_FTS = 'ticketing_programme_fts'
+# Poids bm25 des colonnes de l'index : équipe1, équipe2, stade, division.
+POIDS_BM25 = (10.0, 10.0, 4.0, 2.0)
+VECTEUR_POSTGRES = (
+    "to_tsvector('simple', coalesce(nom_equipe1, '') || ' ' || coalesce(nom_equipe2, '') || ' ' "
+    "|| coalesce(stadium, '') || ' ' || coalesce(division, ''))"
+)
+
+
+@dataclass
+class Resultats:
+    programmes: list
+    page: int
+    page_suivante: int | None
+
+    def __iter__(self):
+        return iter(self.programmes)
+
+    def __len__(self):
+        return len(self.programmes)
+
+
+def mots(texte):
+    return re.findall(r'\w+', texte or '')[:MOTS_MAX]
+
+
+def _filtres_sql(date_debut, date_fin, division):
+    conditions, parametres = [], []
+    if date_debut:
+        conditions.append('p.date >= %s')
+        parametres.append(connection.ops.adapt_datefield_value(date_debut))
+    if date_fin:
+        conditions.append('p.date <= %s')
+        parametres.append(connection.ops.adapt_datefield_value(date_fin))
+    if division:
+        conditions.append('p.division = %s')
+        parametres.append(division)
+    return ''.join(f' AND {condition}' for condition in conditions), parametres
+
+
+def _requete_sqlite(termes):
+    # Les mots ne contiennent que des caractères \w : les guillemets suffisent.
+    return ' '.join(f'"{mot}"*' for mot in termes)
+
+
+def _requete_postgres(termes):
+    return ' & '.join(f'{mot}:*' for mot in termes)
+
+
+def _identifiants_sqlite(termes, filtres, parametres, limite, decalage):
+    requete = _requete_sqlite(termes)
+    rang = f'bm25({TABLE_FTS}, {", ".join(map(str, POIDS_BM25))})'
+    if filtres:
+        sql = (
+            f'SELECT p.id_programme FROM {TABLE_FTS} f JOIN ticketing_programme p ON p.id_programme = f.rowid '
+            f'WHERE {TABLE_FTS} MATCH %s{filtres} ORDER BY {rang}, p.date, p.id_programme LIMIT %s OFFSET %s'
+        )
+    else:
+        # Sans filtre, l'index seul suffit : lire la date de chaque
+        # correspondance pour départager les ex aequo doublerait le coût.
+        sql = f'SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s ORDER BY {rang}, rowid LIMIT %s OFFSET %s'
+    with connection.cursor() as curseur:
+        curseur.execute(sql, [requete, *parametres, limite, decalage])
+        return [ligne[0] for ligne in curseur.fetchall()]
+
+
+def _identifiants_postgres(termes, filtres, parametres, limite, decalage):
+    requete = _requete_postgres(termes)
+    sql = (
+        f"SELECT p.id_programme FROM ticketing_programme p, to_tsquery('simple', %s) q "
+        f'WHERE {VECTEUR_POSTGRES} @@ q{filtres} '
+        f'ORDER BY ts_rank({VECTEUR_POSTGRES}, q) DESC, p.date, p.id_programme '
+        'LIMIT %s OFFSET %s'
+    )
+    with connection.cursor() as curseur:
+        curseur.execute(sql, [requete, *parametres, limite, decalage])
+        return [ligne[0] for ligne in curseur.fetchall()]
+
+
+def _programmes_sans_index(termes, date_debut, date_fin, division):
+    programmes = Programme.objects.all()
+    for mot in termes:
+        programmes = programmes.filter(
+            Q(nom_equipe1__icontains=mot) | Q(nom_equipe2__icontains=mot)
+            | Q(stadium__icontains=mot) | Q(division__icontains=mot)
+        )
+    if date_debut:
+        programmes = programmes.filter(date__gte=date_debut)
+    if date_fin:
+        programmes = programmes.filter(date__lte=date_fin)
+    if division:
+        programmes = programmes.filter(division=division)
+    return programmes.order_by('date', 'id_programme')
+
+
+def identifiants(texte, date_debut=None, date_fin=None, division=None, limite=TAILLE_PAGE, decalage=0):
+    """
+    Identifiants des programmes correspondant à la recherche, du plus
+    pertinent au moins pertinent (par date sans texte).
+    """
+    termes = mots(texte)
+    if termes and connection.vendor in ('sqlite', 'postgresql'):
+        filtres, parametres = _filtres_sql(date_debut, date_fin, division)
+        chercher = _identifiants_sqlite if connection.vendor == 'sqlite' else _identifiants_postgres
+        return chercher(termes, filtres, parametres, limite, decalage)
+    programmes = _programmes_sans_index(termes, date_debut, date_fin, division)
+    return list(programmes.values_list('pk', flat=True)[decalage:decalage + limite])
+
+
+def filtrer(programmes, texte):
+    """
+    Restreint un queryset de programmes aux correspondances de `texte`, par
+    une sous-requête sur l'index (sans classement : l'ordre du queryset est
+    conservé). Utilisé par la recherche de l'administration.
+    """
+    termes = mots(texte)
+    if not termes:
+        return programmes
+    if connection.vendor == 'sqlite':
+        return programmes.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s', [_requete_sqlite(termes)]
+        ))
+    if connection.vendor == 'postgresql':
+        return programmes.filter(pk__in=RawSQL(
+            f"SELECT id_programme FROM ticketing_programme WHERE {VECTEUR_POSTGRES} @@ to_tsquery('simple', %s)",
+            [_requete_postgres(termes)],
+        ))
+    return programmes.filter(pk__in=_programmes_sans_index(termes, None, None, None).values('pk'))
+
+
+def rechercher(texte='', date_debut=None, date_fin=None, division=None, page=1, taille=TAILLE_PAGE):
+    """
+    Une page de résultats classés (deux requêtes : identifiants, puis programmes).
+    """
+    page = min(max(page or 1, 1), PAGES_MAX)
+    # Une ligne de plus indique s'il existe une page suivante.
+    ids = identifiants(texte, date_debut, date_fin, division, limite=taille + 1, decalage=(page - 1) * taille)
+    suivante = page + 1 if len(ids) > taille and page < PAGES_MAX else None
+    ids = ids[:taille]
+    programmes = Programme.objects.in_bulk(ids)
+    return Resultats([programmes[pk] for pk in ids if pk in programmes], page, suivante)
+
+
+def reconstruire():
+    """
+    Reconstruit l'index SQLite à partir de la table des programmes (après une
+    restauration, par exemple). L'index PostgreSQL n'a pas à l'être.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as curseur:
+            curseur.execute(f"INSERT INTO {TABLE_FTS}({TABLE_FTS}) VALUES ('rebuild')")
@@ -0,0 +1,126 @@
+"""
+Lectures sur les réplicas, écritures sur la base principale.
+
+RouteurReplicas envoie toutes les écritures vers 'default' et les lectures
+des requêtes HTTP vers un réplica de REPLIQUES['ALIAS'], tiré au sort une fois
+par requête (toutes ses lectures voient le même état). Les lectures restent
+sur 'default' :
+
+- hors requête HTTP (commandes, tâches) : ReplicasMiddleware n'a ouvert
+  aucun contexte ;
+- dans une transaction sur 'default' ;
+- après une écriture, jusqu'à la fin de la requête ;
+- pendant DUREE_EPINGLAGE secondes après une écriture, grâce à un cookie
+  signé : un spectateur voit sa réservation dans son historique juste après
+  l'avoir faite, même si le réplica est en retard.
+
+DUREE_EPINGLAGE doit couvrir le retard de réplication habituel. Sans réplica
+configuré, le routeur renvoie tout vers 'default' et le middleware ne pose
+aucun cookie.
+"""
+import contextvars
+import os
+import random
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+CONFIGURATION_DEFAUT = {
+    'ALIAS': (),
+    'DUREE_EPINGLAGE': 10,
+}
+
+COOKIE = 'primaire'
+SEL_COOKIE = 'ticketing.replicas'
+
+
+def configuration():
+    return {**CONFIGURATION_DEFAUT, **getattr(settings, 'REPLIQUES', {})}
+
+
+@dataclass
+class _Contexte:
+    replique: str | None
+    ecriture: bool = False
+
+
+_contexte = contextvars.ContextVar('ticketing_replicas', default=None)
+
+
+def debut_requete(request):
+    """
+    Choisit la base des lectures de la requête ; renvoie le jeton à passer à
+    fin_requete.
+    """
+    config = configuration()
+    replique = None
+    if config['ALIAS']:
+        epinglee = request.get_signed_cookie(
+            COOKIE, default=None, salt=SEL_COOKIE, max_age=config['DUREE_EPINGLAGE']
+        )
+        if epinglee is None:
+            replique = random.choice(config['ALIAS'])
+    return _contexte.set(_Contexte(replique))
+
+
+def fin_requete(response, jeton):
+    contexte = _contexte.get()
+    _contexte.reset(jeton)
+    config = configuration()
+    if contexte.ecriture and config['ALIAS']:
+        response.set_signed_cookie(
+            COOKIE, '1', salt=SEL_COOKIE, max_age=config['DUREE_EPINGLAGE'], httponly=True, samesite='Lax',
+        )
+    return response
+
+
+class RouteurReplicas:
+    """
+    Routeur de bases (DATABASE_ROUTERS), voir la docstring du module.
+    """
+    def db_for_read(self, model, **hints):
+        contexte = _contexte.get()
+        if contexte is None or contexte.replique is None or contexte.ecriture:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return contexte.replique
+
+    def db_for_write(self, model, **hints):
+        contexte = _contexte.get()
+        if contexte is not None:
+            contexte.ecriture = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Un objet lu sur un réplica peut être rattaché à un objet de la base
+        # principale : ce sont les mêmes données.
+        bases = {DEFAULT_DB_ALIAS, *configuration()['ALIAS']}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Le schéma des réplicas vient de la réplication.
+        if db in configuration()['ALIAS']:
+            return False
+        return None
+
+
+def synchroniser_sqlite(alias):
+    """
+    Remplace le réplica SQLite `alias` par une copie de la base principale
+    SQLite. Tient lieu de réplication pour essayer les réplicas en local
+    (commande synchroniser_repliques).
+    """
+    destination = str(connections[alias].settings_dict['NAME'])
+    copie = f'{destination}.copie'
+    if os.path.exists(copie):
+        os.remove(copie)
+    with connections[DEFAULT_DB_ALIAS].cursor() as curseur:
+        curseur.execute('VACUUM INTO %s', [copie])
+    # Les connexions déjà ouvertes gardent l'ancien fichier jusqu'à leur
+    # fermeture (en fin de requête).
+    os.replace(copie, destination)
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentification, billets, cache_programmes, compteurs, controle, droits, expirations, metriques, profilage
+from .inventory import liberer_places
+from .models import Billet, CustomUser, Paiement, Programme, Reservation
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_creee(sender, instance, created, **kwargs):
+    """
+    Compte les billets d'une nouvelle réservation.
+    """
+    if created:
+        compteurs.reservations_ajoutees([instance])
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_supprimee(sender, instance, **kwargs):
+    """
+    Rend à l'inventaire les places d'une réservation supprimée et les
+    retire des compteurs (déjà fait pour une réservation expirée).
+    """
+    if instance.statut != Reservation.STATUT_EXPIREE:
+        if instance.type_reservation in ('A', 'B'):
+            liberer_places(instance.programme_id, instance.type_reservation, instance.nombre_billet)
+        compteurs.reservations_ajoutees([instance], signe=-1)
+    # Billets supprimés en cascade : les lecteurs rechargent leurs bits.
+    transaction.on_commit(lambda: controle.revoquer(instance.programme_id))
+
+
+@receiver(post_save, sender=Paiement)
+def paiement_enregistre(sender, instance, created, **kwargs):
+    """
+    Ajoute un paiement confirmé (webhook Stripe, saisie d'un agent) à la
+    recette de sa section, confirme la réservation et émet ses billets.
+    """
+    if created:
+        compteurs.paiements_ajoutes([instance])
+        expirations.confirmer([instance.reservation])
+        billets.emettre([instance.reservation])
+
+
+@receiver(post_delete, sender=Paiement)
+def paiement_supprime(sender, instance, **kwargs):
+    # Paiement annulé : ses billets ne doivent plus passer le contrôle.
+    if Billet.objects.filter(reservation_id=instance.reservation_id).delete()[0]:
+        programme_id = Reservation.objects.filter(pk=instance.reservation_id).values_list(
+            'programme_id', flat=True,
+        ).first()
+        if programme_id is not None:
+            transaction.on_commit(lambda: controle.revoquer(programme_id))
+    try:
+        compteurs.paiements_ajoutes([instance], signe=-1)
+    except Reservation.DoesNotExist:
+        # Réservation déjà supprimée : ses compteurs ont été retirés avec elle
+        # ou le seront par verifier_compteurs.
+        pass
+
+
+@receiver(post_save, sender=Programme)
+def programme_cree(sender, instance, created, **kwargs):
+    if created:
+        compteurs.initialiser([instance])
+
+
+@receiver(post_save, sender=Programme)
+@receiver(post_delete, sender=Programme)
+def programme_modifie(sender, instance, **kwargs):
+    """
+    Invalide la liste des programmes en cache, une fois la transaction validée
+    (sinon une requête concurrente pourrait remettre en cache l'ancien état).
+    """
+    transaction.on_commit(cache_programmes.invalider)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def utilisateur_modifie(sender, instance, **kwargs):
+    """
+    Retire l'utilisateur du cache d'authentification et son instantané de
+    droits, tout de suite puis une fois la transaction validée (une requête
+    concurrente a pu remettre en cache l'ancien état entre-temps).
+    """
+    def oublier():
+        authentification.oublier(instance.pk)
+        droits.oublier(instance.username)
+
+    oublier()
+    transaction.on_commit(oublier)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def profil_modifie(sender, instance, **kwargs):
+    """
+    Les rôles agent et spectateur viennent du CustomUser de même nom.
+    """
+    droits.oublier(instance.username)
+    transaction.on_commit(lambda: droits.oublier(instance.username))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def associations_droits_modifiees(sender, action, **kwargs):
+    """
+    Groupes d'un utilisateur, permissions d'un utilisateur ou d'un groupe :
+    tous les instantanés de droits deviennent obsolètes.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(droits.invalider)
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Group)
+def groupe_ou_permission_modifie(sender, **kwargs):
+    # Les suppressions en cascade des associations n'émettent pas m2m_changed.
+    transaction.on_commit(droits.invalider)
+
+
+@receiver(connection_created)
+def connexion_ouverte(sender, connection, **kwargs):
+    """
+    Mesure les requêtes SQL de chaque connexion pour les métriques par vue
+    et le profilage à la demande.
+    """
+    metriques.installer_sur(connection)
+    profilage.installer_sur(connection)
@@ -0,0 +1,152 @@
+"""
+Suggestions de saisie assistée (vue suggestions, widget SaisieAssistee).
+
+Chaque entité est cherchée par préfixe avec une requête servie par un index,
+limitée à LIMITE lignes : le coût ne dépend pas de la taille des tables.
+Les préfixes de texte sont des bornes d'intervalle (col >= 'abc' AND
+col < 'abc\\U0010ffff') plutôt que des LIKE 'abc%', que SQLite n'évalue pas
+sur l'index (LIKE y est insensible à la casse). Les réponses sont gardées
+DUREE_CACHE secondes.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Max, Q
+
+from . import recherche
+from .models import CustomUser, Programme, Reservation
+
+
+LIMITE = 10
+LONGUEUR_MAX = 100
+DUREE_CACHE = 30
+# Longueur maximale d'un identifiant de réservation (préfixes numériques).
+CHIFFRES_MAX = 12
+
+
+def _prefixe(champ, valeur):
+    return {f'{champ}__gte': valeur, f'{champ}__lt': valeur + '\U0010ffff'}
+
+
+def _utilisateur(utilisateur):
+    return {'id': utilisateur.pk, 'libelle': utilisateur.username}
+
+
+def agents(texte):
+    User = get_user_model()
+    return [
+        _utilisateur(agent) for agent in
+        User.objects.filter(is_staff=True, **_prefixe('username', texte)).only('username').order_by('username')[:LIMITE]
+    ]
+
+
+def spectateurs(texte):
+    """
+    Par nom d'utilisateur, ou par numéro de téléphone si le texte est un
+    numéro (le téléphone n'existe que sur CustomUser : le compte est retrouvé
+    par son nom d'utilisateur).
+    """
+    User = get_user_model()
+    condition = Q(**_prefixe('username', texte))
+    numero = texte.replace(' ', '')
+    if numero.lstrip('+').isdigit():
+        noms = CustomUser.objects.filter(**_prefixe('num_phone', numero)).order_by('num_phone').values_list(
+            'username', flat=True
+        )[:LIMITE]
+        condition |= Q(username__in=list(noms))
+    return [
+        _utilisateur(spectateur) for spectateur in
+        User.objects.filter(condition).only('username').order_by('username')[:LIMITE]
+    ]
+
+
+def _programme(programme):
+    return {
+        'id': programme.pk,
+        'libelle': f'{programme.nom_equipe1} vs {programme.nom_equipe2} ({programme.date:%d/%m/%Y})',
+    }
+
+
+def programmes(texte):
+    # Index plein texte : chaque mot est un préfixe (ticketing/recherche.py).
+    return [_programme(programme) for programme in recherche.rechercher(texte, taille=LIMITE)]
+
+
+def _intervalles_identifiant(chiffres, dernier):
+    """
+    Intervalles des identifiants commençant par `chiffres`, dans l'ordre
+    croissant : 12 -> [12, 13), [120, 130), [1200, 1300)...
+    """
+    debut, fin = int(chiffres), int(chiffres) + 1
+    while debut <= dernier:
+        yield debut, fin
+        debut, fin = debut * 10, fin * 10
+
+
+def _reservation(reservation):
+    return {
+        'id': reservation.pk,
+        'libelle': f'Réservation {reservation.pk} — {reservation.spectateur.username}, '
+                   f'{reservation.programme.nom_equipe1} vs {reservation.programme.nom_equipe2}',
+    }
+
+
+def reservations(texte):
+    """
+    Les intervalles sont disjoints et croissants : on les parcourt dans
+    l'ordre (lectures de clé primaire limitées) jusqu'à LIMITE réservations.
+    """
+    if not texte.isdigit() or texte.startswith('0') or len(texte) > CHIFFRES_MAX:
+        return []
+    dernier = Reservation.objects.aggregate(dernier=Max('pk'))['dernier'] or 0
+    resultat = []
+    for debut, fin in _intervalles_identifiant(texte, dernier):
+        resultat += Reservation.objects.filter(pk__gte=debut, pk__lt=fin).select_related(
+            'spectateur', 'programme'
+        ).only(
+            'spectateur__username', 'programme__nom_equipe1', 'programme__nom_equipe2',
+        ).order_by('pk')[:LIMITE - len(resultat)]
+        if len(resultat) >= LIMITE:
+            break
+    return [_reservation(reservation) for reservation in resultat]
+
+
+ENTITES = {
+    'agents': agents,
+    'spectateurs': spectateurs,
+    'programmes': programmes,
+    'reservations': reservations,
+}
+
+
+def suggerer(entite, texte):
+    texte = (texte or '').strip()[:LONGUEUR_MAX]
+    if not texte:
+        return []
+    # Empreinte du texte : les clés restent valides pour Memcached.
+    cle = f'suggestions:{entite}:{hashlib.sha1(texte.encode()).hexdigest()}'
+    resultat = cache.get(cle)
+    if resultat is None:
+        resultat = ENTITES[entite](texte)
+        cache.set(cle, resultat, DUREE_CACHE)
+    return resultat
+
+
+def libelle(entite, pk):
+    """
+    Libellé de la valeur courante d'un champ (une lecture par clé primaire).
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    User = get_user_model()
+    if entite in ('agents', 'spectateurs'):
+        utilisateur = User.objects.filter(pk=pk).only('username').first()
+        return utilisateur and utilisateur.username
+    if entite == 'programmes':
+        programme = Programme.objects.filter(pk=pk).only('nom_equipe1', 'nom_equipe2', 'date').first()
+        return programme and _programme(programme)['libelle']
+    reservation = Reservation.objects.filter(pk=pk).select_related('spectateur', 'programme').first()
+    return reservation and _reservation(reservation)['libelle']
@@ -1,3 +1,1765 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .inventory import reserver_places, PlacesInsuffisantes
+from .models import Billet, CompteurVentes, CumulJournalier, CustomUser, EvenementStripe, Paiement, Programme, Reservation
+from . import billets, charge, compteurs, controle, cumuls, droits, expirations, metriques, paiements, profilage, recherche, replicas, suggestions, webhooks
+from .imports import importer_programmes
+from .middleware import ProfilageMiddleware
+from .faux_stripe import FauxStripe
+
+User = get_user_model()
+
+SECRET_WEBHOOK = 'whsec_test'
+
+
+def signer_webhook(payload, secret=SECRET_WEBHOOK):
+    """
+    Construit l'en-tête Stripe-Signature d'un payload, comme le fait Stripe.
+    """
+    horodatage = int(time.time())
+    signature = hmac.new(secret.encode(), f'{horodatage}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={horodatage},v1={signature}'
+
+
+def evenement_checkout(id_evenement, reservation_id, montant=6000):
+    return json.dumps({
+        'id': id_evenement,
+        'object': 'event',
+        'type': 'checkout.session.completed',
+        'data': {'object': {
+            'id': f'cs_{id_evenement}',
+            'object': 'checkout.session',
+            'amount_total': montant,
+            'metadata': {'reservation_id': str(reservation_id)},
+        }},
+    })
+
+
+def creer_programme(agent, **kwargs):
+    valeurs = {
+        'nom_equipe1': 'Espérance',
+        'nom_equipe2': 'Club Africain',
+        'stadium': 'Radès',
+        'date': datetime.date(2025, 10, 5),
+        'version': '1',
+        'division': 'Ligue 1',
+        'prix_a': Decimal('30.00'),
+        'prix_b': Decimal('15.00'),
+        'capacite_a': 10,
+        'capacite_b': 20,
+        'agent': agent,
+    }
+    valeurs.update(kwargs)
+    return Programme.objects.create(**valeurs)
+
+
+class InventaireTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.programme = creer_programme(self.agent)
+
+    def test_places_initiales_egales_a_la_capacite(self):
+        self.assertEqual(self.programme.places_restantes_a, 10)
+        self.assertEqual(self.programme.places_restantes_b, 20)
+
+    def test_reserver_places_refuse_le_surbooking(self):
+        reserver_places(self.programme.pk, 'A', 8)
+        with self.assertRaises(PlacesInsuffisantes):
+            reserver_places(self.programme.pk, 'A', 3)
+        self.programme.refresh_from_db()
+        self.assertEqual(self.programme.places_restantes_a, 2)
+
+    def test_modifier_la_capacite_conserve_les_places_vendues(self):
+        reserver_places(self.programme.pk, 'B', 5)
+        self.programme.capacite_b = 30
+        self.programme.save()
+        self.assertEqual(self.programme.places_restantes_b, 25)
+
+    def test_reservation_create_decremente_et_suppression_libere(self):
+        self.client.force_login(self.spectateur)
+        url = reverse('reservation_create', args=[self.programme.pk])
+        response = self.client.post(url, {'type_reservation': 'A', 'nombre_billet': 4})
+        self.assertRedirects(response, reverse('reservation_history'), fetch_redirect_response=False)
+        self.programme.refresh_from_db()
+        self.assertEqual(self.programme.places_restantes_a, 6)
+
+        response = self.client.post(url, {'type_reservation': 'A', 'nombre_billet': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        Reservation.objects.get().delete()
+        self.programme.refresh_from_db()
+        self.assertEqual(self.programme.places_restantes_a, 10)
+
+    def test_liberation_bornee_par_la_capacite(self):
+        # Réservation créée hors inventaire (administration, import) : sa
+        # suppression ne fait pas dépasser la jauge.
+        reserver_places(self.programme.pk, 'B', 3)
+        Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation='B', nombre_billet=5,
+        ).delete()
+        self.programme.refresh_from_db()
+        self.assertEqual(self.programme.places_restantes_b, 20)
+
+
+class InventaireConcurrenceTests(TransactionTestCase):
+    """
+    Des réservations parallèles ne doivent jamais dépasser la capacité.
+    """
+    def test_pas_de_surbooking_en_parallele(self):
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        programme = creer_programme(agent, capacite_a=25)
+        reussites = []
+        echecs = []
+        depart = threading.Barrier(20)
+
+        def acheter():
+            try:
+                depart.wait()
+                for _ in range(3):
+                    try:
+                        reserver_places(programme.pk, 'A', 1)
+                        reussites.append(1)
+                    except PlacesInsuffisantes:
+                        echecs.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=acheter) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        programme.refresh_from_db()
+        self.assertEqual(len(reussites), 25)
+        self.assertEqual(len(echecs), 35)
+        self.assertEqual(programme.places_restantes_a, 0)
+
+
+@override_settings(FILE_ATTENTE={'ACTIVE': True, 'ADMISSIONS_PAR_SECONDE': 2})
+class FileAttenteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('reservation_create', args=[42])
+
+    @mock.patch('ticketing.file_attente.time.time', return_value=1000.0)
+    def test_admissions_limitees_par_seconde(self, horloge):
+        visiteurs = [Client() for _ in range(5)]
+        reponses = [visiteur.get(self.url) for visiteur in visiteurs[:2]]
+        # Admis : la vue s'exécute (redirection vers la connexion).
+        self.assertEqual([r.status_code for r in reponses], [302, 302])
+
+        with self.assertNumQueries(0):
+            reponse = visiteurs[2].get(self.url)
+        self.assertEqual(reponse.status_code, 503)
+        self.assertEqual(reponse.context['place'].position, 1)
+
+        statut = visiteurs[3].get(reverse('file_attente_jeton', args=['programme-42'])).json()
+        self.assertEqual((statut['position'], statut['admis']), (2, False))
+
+        # Une seconde plus tard, les deux visiteurs suivants passent, dans l'ordre.
+        horloge.return_value = 1001.0
+        self.assertEqual(visiteurs[2].get(self.url).status_code, 302)
+        self.assertEqual(visiteurs[3].get(self.url).status_code, 302)
+        self.assertEqual(visiteurs[4].get(self.url).status_code, 503)
+
+    def test_vues_hors_vente_non_concernees(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    def test_portee_inconnue(self):
+        reponse = self.client.get(reverse('file_attente_jeton', args=['nimporte-quoi']))
+        self.assertEqual(reponse.status_code, 404)
+
+
+class CacheProgrammesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.programme = creer_programme(self.agent)
+
+    def test_accueil_anonyme_sans_requete_sql(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Espérance vs Club Africain')
+
+    def test_modification_invalide_le_cache(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('programme_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.programme.nom_equipe2 = 'Étoile du Sahel'
+            self.programme.save()
+        self.assertContains(self.client.get(reverse('home')), 'Espérance vs Étoile du Sahel')
+        self.assertContains(self.client.get(reverse('programme_list')), 'Espérance vs Étoile du Sahel')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.programme.delete()
+        self.assertNotContains(self.client.get(reverse('home')), 'Étoile du Sahel')
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class PaginationKeysetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', password='x')
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.programmes = [creer_programme(agent), creer_programme(agent, nom_equipe2='CSS')]
+        spectateurs = [User.objects.create_user(f'fan{i}', password='x') for i in range(3)]
+        Reservation.objects.bulk_create(
+            Reservation(
+                spectateur=spectateurs[i % 3], programme=self.programmes[i % 2],
+                type_reservation='A', nombre_billet=1,
+            )
+            for i in range(120)
+        )
+        for i, reservation in enumerate(Reservation.objects.order_by('pk')):
+            Reservation.objects.filter(pk=reservation.pk).update(
+                date_reservation=datetime.date(2025, 1, 1) + datetime.timedelta(days=i // 7)
+            )
+            if i % 2:
+                Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=30)
+        self.client.force_login(self.admin)
+
+    def parcourir(self, nom_url, cle, params=None):
+        params = dict(params or {})
+        vus = []
+        # Met l'utilisateur en cache (la session y est depuis la connexion).
+        self.client.get(reverse('home'))
+        while True:
+            with self.assertNumQueries(1):  # la page
+                response = self.client.get(reverse(nom_url), params)
+            vus += [getattr(objet, cle) for objet in response.context['page']]
+            if not response.context['page'].curseur_suivant:
+                return vus
+            params['curseur'] = response.context['page'].curseur_suivant
+
+    def test_reservation_management_parcourt_tout_sans_doublon(self):
+        vus = self.parcourir('reservation_management', 'id_reservation')
+        attendus = list(Reservation.objects.order_by('-date_reservation', '-id_reservation').values_list('pk', flat=True))
+        self.assertEqual(vus, attendus)
+
+    def test_filtres_programme_et_dates(self):
+        vus = self.parcourir('reservation_management', 'id_reservation', {
+            'programme': self.programmes[0].pk, 'date_debut': '2025-01-08', 'date_fin': '2025-01-31',
+        })
+        attendus = Reservation.objects.filter(
+            programme=self.programmes[0], date_reservation__range=('2025-01-08', '2025-01-31')
+        )
+        self.assertEqual(sorted(vus), sorted(attendus.values_list('pk', flat=True)))
+
+    def test_paiement_list(self):
+        vus = self.parcourir('paiement_list', 'id_paiement')
+        self.assertEqual(len(vus), 60)
+        self.assertEqual(len(set(vus)), 60)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        spectateur = User.objects.create_user('fan', password='x', email='fan@example.com')
+        self.programme = creer_programme(agent)
+        for section in ('A', 'B', 'B'):
+            reservation = Reservation.objects.create(
+                spectateur=spectateur, programme=self.programme, type_reservation=section, nombre_billet=2,
+            )
+            Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=60)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def test_export_csv_en_flux(self):
+        response = self.client.get(reverse('reservations_export'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lignes = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lignes[0].split(',')[:4], ['id_reservation', 'date_reservation', 'section', 'nombre_billet'])
+        self.assertEqual(len(lignes), 4)
+        self.assertIn('fan@example.com', lignes[1])
+
+    def test_export_ndjson_filtre_par_section(self):
+        response = self.client.get(reverse('paiements_export'), {'format': 'ndjson', 'section': 'B'})
+        lignes = [json.loads(ligne) for ligne in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual({ligne['section'] for ligne in lignes}, {'B'})
+        self.assertEqual(lignes[0]['montant'], '60.00')
+
+    def test_export_filtres_invalides(self):
+        response = self.client.get(reverse('reservations_export'), {'section': 'Z', 'date_debut': 'hier'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['erreurs']), {'section', 'date_debut'})
+
+    def test_commande_exporter_ventes(self):
+        sortie = io.StringIO()
+        call_command('exporter_ventes', 'reservations', '--section', 'A', stdout=sortie)
+        self.assertEqual(len(sortie.getvalue().splitlines()), 2)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=SECRET_WEBHOOK)
+class WebhookTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        spectateur = User.objects.create_user('fan', password='x')
+        self.reservation = Reservation.objects.create(
+            spectateur=spectateur, programme=creer_programme(agent), type_reservation='A', nombre_billet=2,
+        )
+
+    def poster(self, payload, signature=None):
+        return self.client.post(
+            reverse('stripe_webhook'), payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature or signer_webhook(payload),
+        )
+
+    def test_accuse_reception_sans_traitement(self):
+        with self.assertNumQueries(1):
+            response = self.poster(evenement_checkout('evt_1', self.reservation.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(EvenementStripe.objects.get().statut, EvenementStripe.STATUT_RECU)
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_signature_invalide(self):
+        payload = evenement_checkout('evt_1', self.reservation.pk)
+        response = self.poster(payload, signer_webhook(payload, 'whsec_autre'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(EvenementStripe.objects.exists())
+
+    def test_rejeux_dedupliques_et_traitement_idempotent(self):
+        payload = evenement_checkout('evt_1', self.reservation.pk)
+        self.poster(payload)
+        self.poster(payload)
+        self.poster(evenement_checkout('evt_2', self.reservation.pk))
+        self.assertEqual(EvenementStripe.objects.count(), 2)
+
+        self.assertEqual(webhooks.traiter_lot(), {'traites': 2, 'echecs': 0, 'abandonnes': 0})
+        paiement = Paiement.objects.get()
+        self.assertEqual(paiement.montant, Decimal('60.00'))
+        self.assertEqual(webhooks.traiter_lot(), {'traites': 0, 'echecs': 0, 'abandonnes': 0})
+
+    def test_reservation_inconnue_abandonnee(self):
+        self.poster(evenement_checkout('evt_1', 999999))
+        with self.assertLogs('ticketing.webhooks', 'ERROR'):
+            self.assertEqual(webhooks.traiter_lot()['abandonnes'], 1)
+        self.assertEqual(EvenementStripe.objects.get().statut, EvenementStripe.STATUT_ABANDONNE)
+
+    def test_echec_retente_puis_abandonne(self):
+        self.poster(evenement_checkout('evt_1', self.reservation.pk))
+        with mock.patch.dict(webhooks.TRAITEMENTS, {'checkout.session.completed': mock.Mock(side_effect=RuntimeError('boom'))}):
+            self.assertEqual(webhooks.traiter_lot()['echecs'], 1)
+            evenement = EvenementStripe.objects.get()
+            self.assertEqual((evenement.statut, evenement.tentatives), (EvenementStripe.STATUT_ECHEC, 1))
+            # Pas de nouvel essai avant le délai.
+            self.assertEqual(webhooks.traiter_lot()['echecs'], 0)
+            EvenementStripe.objects.update(prochain_essai=evenement.recu_le)
+            with self.assertLogs('ticketing.webhooks', 'ERROR'):
+                self.assertEqual(webhooks.traiter_lot(max_tentatives=2)['abandonnes'], 1)
+
+        call_command('traiter_webhooks', stdout=io.StringIO())
+        self.assertFalse(Paiement.objects.exists())
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.serveur = FauxStripe().demarrer()
+        cls.addClassCleanup(cls.serveur.arreter)
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(override_settings(STRIPE_API_BASE=self.serveur.url))
+        self.serveur.sessions.clear()
+        self.serveur.idempotence.clear()
+        paiements.reinitialiser()
+        self.addCleanup(paiements.reinitialiser)
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.reservation = Reservation.objects.create(
+            spectateur=self.spectateur, programme=creer_programme(agent), type_reservation='B', nombre_billet=3,
+        )
+
+    def sessions_creees(self):
+        # Filtre sur la réservation : une requête expirée d'un test précédent
+        # peut encore enregistrer sa session sur le serveur partagé.
+        return [
+            session for session in self.serveur.sessions.values()
+            if session['metadata'].get('reservation_id') == str(self.reservation.pk)
+        ]
+
+    def test_session_synchrone(self):
+        self.client.force_login(self.spectateur)
+        response = self.client.get(reverse('create_checkout_session', args=[self.reservation.pk]))
+        self.assertEqual(response.status_code, 302)
+        session = self.serveur.sessions[response.url.rsplit('/', 1)[1]]
+        self.assertEqual(session['amount_total'], 4500)
+        self.assertEqual(session['metadata'], {'reservation_id': str(self.reservation.pk)})
+
+    async def test_session_asynchrone(self):
+        await self.async_client.aforce_login(self.spectateur)
+        response = await self.async_client.get(reverse('create_checkout_session_async', args=[self.reservation.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(self.serveur.url + '/pay/cs_test_'))
+
+    async def test_delai_depasse(self):
+        self.serveur.latence = 0.5
+        self.addCleanup(setattr, self.serveur, 'latence', 0.0)
+        with override_settings(STRIPE_DELAI_LECTURE=0.1, STRIPE_MAX_TENTATIVES=0):
+            paiements.reinitialiser()
+            await self.async_client.aforce_login(self.spectateur)
+            response = await self.async_client.get(reverse('create_checkout_session_async', args=[self.reservation.pk]))
+        self.assertRedirects(response, reverse('reservation_history'), fetch_redirect_response=False)
+
+    def test_session_ouverte_reutilisee(self):
+        self.client.force_login(self.spectateur)
+        url = reverse('create_checkout_session', args=[self.reservation.pk])
+        premiere = self.client.get(url).url
+        self.assertEqual(self.client.get(url).url, premiere)
+        self.assertEqual(len(self.sessions_creees()), 1)
+
+        # Montant modifié : nouvelle session.
+        Reservation.objects.filter(pk=self.reservation.pk).update(nombre_billet=4)
+        self.assertNotEqual(self.client.get(url).url, premiere)
+        self.assertEqual(len(self.sessions_creees()), 2)
+
+        # Session sur le point d'expirer : nouvelle session.
+        Reservation.objects.filter(pk=self.reservation.pk).update(
+            stripe_session_expire=timezone.now() + datetime.timedelta(minutes=1)
+        )
+        self.client.get(url)
+        self.assertEqual(len(self.sessions_creees()), 3)
+
+    def test_clics_simultanes_une_seule_session(self):
+        # Deux requêtes ont lu la réservation avant que l'une n'enregistre sa session.
+        copies = [Reservation.objects.select_related('programme').get(pk=self.reservation.pk) for _ in range(2)]
+        urls = [paiements.url_paiement(copie, '/succes/', '/echec/') for copie in copies]
+        self.assertEqual(urls[0], urls[1])
+        self.assertEqual(len(self.sessions_creees()), 1)
+        # Session enregistrée puis sur le point d'expirer : une nouvelle clé.
+        Reservation.objects.filter(pk=self.reservation.pk).update(stripe_session_expire=timezone.now())
+        reservation = Reservation.objects.select_related('programme').get(pk=self.reservation.pk)
+        self.assertNotEqual(paiements.url_paiement(reservation, '/succes/', '/echec/'), urls[0])
+
+    def test_reservation_deja_payee(self):
+        Paiement.objects.create(reservation=self.reservation, mode_paiement='Stripe', montant=45)
+        self.client.force_login(self.spectateur)
+        response = self.client.get(reverse('create_checkout_session', args=[self.reservation.pk]))
+        self.assertRedirects(response, reverse('reservation_history'), fetch_redirect_response=False)
+        self.assertEqual(len(self.sessions_creees()), 0)
+
+
+class ImportProgrammesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user('agent', password='x', is_staff=True)
+
+    def ligne(self, i, **kwargs):
+        valeurs = {
+            'nom_equipe1': f'Equipe {i}', 'nom_equipe2': f'Adversaire {i}', 'stadium': f'Stade {i % 7}',
+            'date': str(datetime.date(2025, 8, 1) + datetime.timedelta(days=i % 200)),
+            'version': '1', 'division': f'D{i % 3}', 'prix_a': '20.00', 'prix_b': '10.00',
+            'capacite_a': '100', 'capacite_b': '200', 'agent': 'agent',
+        }
+        valeurs.update(kwargs)
+        return valeurs
+
+    def test_import_en_lots_et_rejouable(self):
+        lignes = [self.ligne(i) for i in range(2000)]
+        with CaptureQueriesContext(connection) as requetes:
+            rapport = importer_programmes(lignes)
+        # Insertions par lots des programmes et de leurs compteurs (SQLite
+        # limite le nombre de paramètres par requête).
+        self.assertLess(len(requetes), 60)
+        self.assertEqual((rapport.crees, rapport.mis_a_jour, rapport.erreurs), (2000, 0, []))
+        self.assertEqual(Programme.objects.get(nom_equipe1='Equipe 5').places_restantes_b, 200)
+
+        reserver_places(Programme.objects.get(nom_equipe1='Equipe 5').pk, 'B', 50)
+        lignes[5]['capacite_b'] = '300'
+        rapport = importer_programmes(lignes)
+        self.assertEqual((rapport.crees, rapport.mis_a_jour, rapport.inchanges), (0, 1, 1999))
+        programme = Programme.objects.get(nom_equipe1='Equipe 5')
+        self.assertEqual((programme.capacite_b, programme.places_restantes_b), (300, 250))
+        self.assertEqual(Programme.objects.count(), 2000)
+
+    def test_erreurs_par_ligne(self):
+        lignes = [
+            self.ligne(1),
+            self.ligne(2, date='pas une date', prix_a=''),
+            self.ligne(3, agent='inconnu'),
+            self.ligne(1),
+        ]
+        rapport = importer_programmes(lignes)
+        self.assertEqual(rapport.crees, 1)
+        self.assertEqual([numero for numero, _ in rapport.erreurs], [2, 3, 4])
+        self.assertEqual(set(rapport.erreurs[0][1]), {'date', 'prix_a'})
+        self.assertIn('agent', rapport.erreurs[1][1])
+
+    def test_lignes_et_fichiers_mal_formes(self):
+        rapport = importer_programmes([self.ligne(1), ['pas', 'un', 'objet'], self.ligne(2, agent=7)])
+        self.assertEqual(rapport.crees, 1)
+        self.assertEqual([(numero, set(erreurs)) for numero, erreurs in rapport.erreurs], [(2, {'__all__'}), (3, {'agent'})])
+
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        for nom, contenu in (
+            # Champ au-delà de csv.field_size_limit() : csv.Error.
+            ('saison.csv', b'nom_equipe1\n"' + b'x' * 200_000 + b'"\n'),
+            ('saison.csv', 'équipe'.encode('latin-1')),
+            ('saison.json', b'{"pas": "une liste"}'),
+            ('saison.json', b'[{'),
+        ):
+            with self.subTest(contenu=contenu):
+                response = self.client.post(reverse('programme_import'), {'fichier': SimpleUploadedFile(nom, contenu)})
+                self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(Programme.objects.count(), 1)
+
+    def test_televersement_par_un_agent(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        contenu = json.dumps([self.ligne(i, agent='') for i in range(3)]).encode()
+        response = self.client.post(reverse('programme_import'), {
+            'fichier': SimpleUploadedFile('saison.json', contenu, content_type='application/json'),
+        })
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(Programme.objects.filter(agent__username='admin').count(), 3)
+
+    def test_commande_simulation(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fichier:
+            fichier.write(
+                'nom_equipe1,nom_equipe2,stadium,date,version,division,prix_a,prix_b,capacite_a,capacite_b,agent\n'
+                'A,B,Radès,2025-09-01,1,L1,10,5,10,10,agent\n'
+            )
+        self.addCleanup(os.remove, fichier.name)
+        sortie = io.StringIO()
+        call_command('importer_programmes', fichier.name, '--simulation', stdout=sortie)
+        self.assertIn('1 programme(s) créé(s)', sortie.getvalue())
+        self.assertFalse(Programme.objects.exists())
+
+
+class ReservationGroupeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.serveur = FauxStripe().demarrer()
+        cls.addClassCleanup(cls.serveur.arreter)
+
+    def setUp(self):
+        self.enterContext(override_settings(STRIPE_API_BASE=self.serveur.url))
+        paiements.reinitialiser()
+        self.addCleanup(paiements.reinitialiser)
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.club = User.objects.create_user('club', password='x')
+        self.client.force_login(self.club)
+        self.derby = creer_programme(agent)
+        self.finale = creer_programme(agent, nom_equipe1='Étoile', nom_equipe2='CSS')
+
+    def reserver(self, lignes, mode='tout_ou_rien'):
+        return self.client.post(
+            reverse('reservation_groupe'), json.dumps({'mode': mode, 'lignes': lignes}),
+            content_type='application/json',
+        )
+
+    def test_tout_ou_rien_une_session_pour_le_groupe(self):
+        lignes = [
+            {'programme': self.derby.pk, 'section': 'A', 'quantite': 4},
+            {'programme': self.derby.pk, 'section': 'A', 'quantite': 2},
+            {'programme': self.finale.pk, 'section': 'B', 'quantite': 10},
+        ]
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.reserver(lignes)
+        self.assertEqual(response.status_code, 201, response.json())
+        # Session, utilisateur, programmes, un UPDATE d'inventaire et un de
+        # compteur par couple, un INSERT, un UPDATE de session par montant distinct.
+        self.assertLessEqual(len(requetes), 13, [q["sql"] for q in requetes])
+        donnees = response.json()
+        self.assertEqual([ligne['statut'] for ligne in donnees['lignes']], ['reservee'] * 3)
+        self.assertEqual(donnees['paiement']['montant'], 6 * 30 + 10 * 15)
+
+        self.derby.refresh_from_db()
+        self.finale.refresh_from_db()
+        self.assertEqual((self.derby.places_restantes_a, self.finale.places_restantes_b), (4, 10))
+        session_id = donnees['paiement']['url'].rsplit('/', 1)[1]
+        self.assertEqual(Reservation.objects.filter(stripe_session_id=session_id).count(), 3)
+        # Une réservation du groupe ouvre ensuite sa propre session : elle
+        # reste réglée par le paiement du groupe.
+        Reservation.objects.filter(pk=Reservation.objects.filter(session_groupe=session_id).first().pk).update(
+            stripe_session_id='cs_test_individuelle',
+        )
+
+        # Le paiement de la session règle les trois réservations, une seule fois.
+        session = self.serveur.sessions[session_id]
+        webhooks.traiter_checkout_complete(session)
+        webhooks.traiter_checkout_complete(session)
+        self.assertEqual(
+            sorted(Paiement.objects.values_list('montant', flat=True)),
+            [Decimal('60.00'), Decimal('120.00'), Decimal('150.00')],
+        )
+
+    def test_tout_ou_rien_refuse_sans_rien_reserver(self):
+        response = self.reserver([
+            {'programme': self.derby.pk, 'section': 'B', 'quantite': 5},
+            {'programme': self.finale.pk, 'section': 'A', 'quantite': 11},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([ligne['statut'] for ligne in response.json()['lignes']], ['refusee', 'refusee'])
+        self.assertFalse(Reservation.objects.exists())
+        self.derby.refresh_from_db()
+        self.assertEqual(self.derby.places_restantes_b, 20)
+
+    def test_partiel_accepte_ce_qui_tient(self):
+        response = self.reserver([
+            {'programme': self.derby.pk, 'section': 'A', 'quantite': 8},
+            {'programme': self.derby.pk, 'section': 'A', 'quantite': 5},
+            {'programme': self.derby.pk, 'section': 'A', 'quantite': 2},
+            {'programme': 999999, 'section': 'A', 'quantite': 1},
+        ], mode='partiel')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [ligne['statut'] for ligne in response.json()['lignes']],
+            ['reservee', 'refusee', 'reservee', 'invalide'],
+        )
+        self.derby.refresh_from_db()
+        self.assertEqual(self.derby.places_restantes_a, 0)
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_demande_invalide(self):
+        self.assertEqual(self.reserver([]).status_code, 400)
+        self.assertEqual(self.reserver([{'programme': self.derby.pk, 'section': 'C', 'quantite': 1}]).status_code, 400)
+        self.assertEqual(self.reserver([{'programme': self.derby.pk, 'section': 'A', 'quantite': 1}], mode='x').status_code, 400)
+        self.assertFalse(Reservation.objects.exists())
+
+
+class CompteursVentesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.programme = creer_programme(self.agent)
+
+    def compteur(self, section):
+        return CompteurVentes.objects.get(programme=self.programme, section=section)
+
+    def test_reservations_et_paiements_comptes(self):
+        premiere = Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation='A', nombre_billet=2,
+        )
+        Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation='A', nombre_billet=3,
+        )
+        Paiement.objects.create(reservation=premiere, mode_paiement='Stripe', montant=Decimal('60.00'))
+        compteur = self.compteur('A')
+        self.assertEqual(
+            (compteur.billets_reserves, compteur.billets_payes, compteur.recette), (5, 2, Decimal('60.00'))
+        )
+
+        # La suppression retire la réservation et son paiement.
+        premiere.delete()
+        compteur = self.compteur('A')
+        self.assertEqual(
+            (compteur.billets_reserves, compteur.billets_payes, compteur.recette), (3, 0, Decimal('0.00'))
+        )
+        self.assertEqual(compteurs.recalculer(), [])
+
+    def test_paiement_par_webhook(self):
+        reservation = Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation='B', nombre_billet=4,
+        )
+        session = json.loads(evenement_checkout('evt_1', reservation.pk))['data']['object']
+        webhooks.traiter_checkout_complete(session)
+        webhooks.traiter_checkout_complete(session)
+        self.assertEqual((self.compteur('B').billets_payes, self.compteur('B').recette), (4, Decimal('60.00')))
+
+    def test_liste_des_programmes_sans_parcourir_les_reservations(self):
+        for i in range(3):
+            programme = creer_programme(self.agent, nom_equipe1=f'Équipe {i}')
+            Reservation.objects.create(
+                spectateur=self.spectateur, programme=programme, type_reservation='B', nombre_billet=i + 1,
+            )
+        self.client.force_login(self.agent)
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(reverse('programme_list'))
+        self.assertContains(response, '0 payés / 3 réservés')
+        self.assertFalse([q for q in requetes if 'ticketing_reservation' in q['sql']])
+
+    def test_verification_et_correction_des_ecarts(self):
+        Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation='A', nombre_billet=2,
+        )
+        CompteurVentes.objects.update(billets_reserves=7)
+        with self.assertRaises(CommandError):
+            call_command('verifier_compteurs', stdout=io.StringIO())
+        sortie = io.StringIO()
+        call_command('verifier_compteurs', '--corriger', stdout=sortie)
+        self.assertIn('billets_reserves 7 au lieu de 2', sortie.getvalue())
+        self.assertEqual(self.compteur('A').billets_reserves, 2)
+        call_command('verifier_compteurs', stdout=io.StringIO())
+
+
+class CumulsVentesTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.rades = creer_programme(agent)
+        self.sousse = creer_programme(agent, stadium='Olympique de Sousse', division='Ligue 2')
+        self.hier = timezone.localdate() - datetime.timedelta(days=1)
+
+    def vendre(self, programme, jour, billets, payer=True):
+        reservation = Reservation.objects.create(
+            spectateur=self.spectateur, programme=programme, type_reservation='B', nombre_billet=billets,
+        )
+        Reservation.objects.filter(pk=reservation.pk).update(date_reservation=jour)
+        if payer:
+            paiement = Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=billets * 15)
+            Paiement.objects.filter(pk=paiement.pk).update(date_paiement=jour)
+
+    def test_cumul_incremental_et_rattrapage(self):
+        avant_hier = self.hier - datetime.timedelta(days=1)
+        self.vendre(self.rades, avant_hier, 2)
+        self.vendre(self.rades, avant_hier, 3, payer=False)
+        self.vendre(self.sousse, self.hier, 4)
+        # La journée en cours n'est pas cumulée.
+        self.vendre(self.sousse, timezone.localdate(), 5)
+
+        call_command('cumuler_ventes', stdout=io.StringIO())
+        cumul = CumulJournalier.objects.get(jour=avant_hier, stadium='Radès')
+        self.assertEqual(
+            (cumul.reservations, cumul.billets_reserves, cumul.paiements, cumul.billets_payes, cumul.recette),
+            (2, 5, 1, 2, Decimal('30.00')),
+        )
+        self.assertEqual(CumulJournalier.objects.count(), 2)
+        self.assertFalse(CumulJournalier.objects.filter(jour=timezone.localdate()).exists())
+
+        # Rien de nouveau : seul le dernier jour cumulé est relu.
+        self.assertEqual(cumuls.plage_incrementale(), (self.hier, self.hier))
+
+        # Une vente supprimée après coup est corrigée par un rattrapage.
+        Reservation.objects.filter(date_reservation=avant_hier, nombre_billet=3).delete()
+        call_command('cumuler_ventes', '--depuis', str(avant_hier), stdout=io.StringIO())
+        self.assertEqual(CumulJournalier.objects.get(jour=avant_hier).billets_reserves, 2)
+
+    def test_rapport_lu_dans_les_cumuls(self):
+        self.vendre(self.rades, datetime.date(2024, 3, 1), 2)
+        self.vendre(self.rades, datetime.date(2024, 3, 20), 4)
+        self.vendre(self.sousse, datetime.date(2025, 1, 5), 1)
+        call_command('cumuler_ventes', stdout=io.StringIO())
+
+        lignes = list(cumuls.rapport(par='mois', stadium='Radès'))
+        self.assertEqual(len(lignes), 1)
+        self.assertEqual((lignes[0]['total_billets_payes'], lignes[0]['total_recette']), (6, Decimal('90.00')))
+
+        agent = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(agent)
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(reverse('rapport_ventes'), {'par': 'annee'})
+        self.assertContains(response, 'Olympique de Sousse')
+        self.assertFalse([
+            q for q in requetes
+            if 'ticketing_reservation' in q['sql'] or 'ticketing_paiement' in q['sql']
+        ])
+
+
+class MetriquesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metriques.registre.reinitialiser()
+        self.addCleanup(metriques.registre.reinitialiser)
+        agent = User.objects.create_user('agent', password='x', is_staff=True)
+        creer_programme(agent)
+
+    def serie(self, texte, prefixe):
+        for ligne in texte.splitlines():
+            if ligne.startswith(prefixe):
+                return float(ligne.rsplit(' ', 1)[1])
+        self.fail(f"{prefixe} absent de :\n{texte}")
+
+    def test_mesures_par_vue(self):
+        self.client.get(reverse('programme_list'))
+        self.client.get(reverse('programme_list'))
+        self.client.get('/inexistant/')
+        texte = self.client.get(reverse('metriques')).content.decode()
+
+        self.assertEqual(self.serie(texte, 'ticketing_vue_duree_secondes_count{vue="programme_list"}'), 2)
+        self.assertEqual(self.serie(texte, 'ticketing_vue_duree_secondes_bucket{vue="programme_list",le="+Inf"}'), 2)
+        # Liste en cache puis compteurs : une requête SQL la seconde fois.
+        self.assertGreaterEqual(self.serie(texte, 'ticketing_vue_requetes_sql_sum{vue="programme_list"}'), 2)
+        self.assertGreater(self.serie(texte, 'ticketing_vue_reponse_octets_sum{vue="programme_list"}'), 0)
+        self.assertEqual(self.serie(texte, 'ticketing_vue_duree_secondes_count{vue="non_resolue"}'), 1)
+
+    def test_reserve_au_collecteur_local(self):
+        self.assertEqual(self.client.get(reverse('metriques'), REMOTE_ADDR='10.1.2.3').status_code, 404)
+
+    def test_agregation_entre_processus(self):
+        repertoire = self.enterContext(tempfile.TemporaryDirectory())
+        autre = metriques.Registre()
+        autre.observer('ticketing_vue_duree_secondes', {'vue': 'home'}, 0.3)
+        with open(os.path.join(repertoire, 'metriques-999999.json'), 'w') as f:
+            json.dump(autre.instantane(), f)
+
+        with override_settings(METRIQUES={'REPERTOIRE': repertoire}):
+            self.client.get(reverse('home'))
+            texte = self.client.get(reverse('metriques')).content.decode()
+        self.assertEqual(self.serie(texte, 'ticketing_vue_duree_secondes_count{vue="home"}'), 2)
+        self.assertEqual(self.serie(texte, 'ticketing_vue_duree_secondes_bucket{vue="home",le="0.25"}'), 1)
+        self.assertTrue(os.path.exists(os.path.join(repertoire, f'metriques-{os.getpid()}.json')))
+
+    def test_appels_au_fournisseur_de_paiement(self):
+        with metriques.chronometre_paiement('checkout.sessions.create'):
+            pass
+        with self.assertRaises(RuntimeError), metriques.chronometre_paiement('checkout.sessions.create'):
+            raise RuntimeError
+        texte = metriques.exposition()
+        for resultat in ('ok', 'erreur'):
+            self.assertEqual(self.serie(
+                texte,
+                f'ticketing_paiement_duree_secondes_count{{operation="checkout.sessions.create",resultat="{resultat}"}}',
+            ), 1)
+
+
+class ProfilageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('agent', password='x', is_staff=True)
+        creer_programme(self.staff)
+
+    def test_desactive_par_defaut(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'), HTTP_X_TICKETING_PROFIL='jeton-invalide')
+        self.assertEqual(profilage.derniers(), [])
+
+    def test_en_tete_signe_et_sql_lentes(self):
+        self.client.force_login(self.staff)
+        jeton = self.client.get(reverse('profilage_jeton')).json()['jeton']
+        with override_settings(PROFILAGE={'SEUIL_SQL': 0}):
+            self.client.get(reverse('programme_list'), HTTP_X_TICKETING_PROFIL=jeton)
+        [profil] = profilage.derniers()
+        self.assertEqual((profil['vue'], profil['statut']), ('programme_list', 200))
+        self.assertIn('cumulative', profil['profil'])
+        requete = next(r for r in profil['sql_lentes'] if 'ticketing_programme' in r['sql'])
+        # Plan SQLite (EXPLAIN QUERY PLAN) ou PostgreSQL (EXPLAIN).
+        self.assertRegex(requete['plan'], 'SCAN|SEARCH|Scan')
+
+        response = self.client.get(reverse('profilage_detail', args=[profil['numero']]))
+        self.assertContains(response, 'ticketing_programme')
+
+    async def test_plans_en_asynchrone(self):
+        await self.async_client.aforce_login(self.staff)
+        with override_settings(PROFILAGE={'SEUIL_SQL': 0}):
+            response = await self.async_client.get(
+                reverse('create_checkout_session_async', args=[999999]),
+                headers={'X-Ticketing-Profil': profilage.jeton(self.staff)},
+            )
+        self.assertEqual(response.status_code, 404)
+        [profil] = profilage.derniers()
+        requete = next(r for r in profil['sql_lentes'] if 'ticketing_reservation' in r['sql'])
+        # EXPLAIN exécuté hors de la boucle d'événements.
+        self.assertRegex(requete['plan'], 'SCAN|SEARCH|Scan|Index')
+
+    def test_profils_simultanes(self):
+        premier_entre, second_fini = threading.Event(), threading.Event()
+
+        def vue(request):
+            if request.path == '/premier/':
+                premier_entre.set()
+                second_fini.wait(5)
+            return HttpResponse('ok')
+
+        middleware = ProfilageMiddleware(vue)
+        reponses = {}
+
+        def servir(chemin):
+            reponses[chemin] = middleware(RequestFactory().get(chemin))
+
+        with override_settings(PROFILAGE={'TAUX': 1.0}):
+            premier = threading.Thread(target=servir, args=['/premier/'])
+            premier.start()
+            premier_entre.wait(5)
+            # Profil du premier en cours : le second est servi sans profilage.
+            servir('/second/')
+            second_fini.set()
+            premier.join()
+            self.assertEqual([r.status_code for r in reponses.values()], [200, 200])
+            self.assertEqual([p['chemin'] for p in profilage.derniers()], ['/premier/'])
+
+            # Verrou rendu, y compris après une exception de la vue.
+            with self.assertRaises(ZeroDivisionError):
+                ProfilageMiddleware(lambda request: 1 / 0)(RequestFactory().get('/erreur/'))
+            servir('/troisieme/')
+            self.assertEqual([p['chemin'] for p in profilage.derniers()], ['/troisieme/', '/premier/'])
+
+            # Autre outil de profilage actif (Python 3.12+) : requête servie sans profil.
+            with mock.patch.object(profilage.cProfile.Profile, 'enable', side_effect=ValueError):
+                servir('/quatrieme/')
+            self.assertEqual(reponses['/quatrieme/'].status_code, 200)
+            self.assertEqual(len(profilage.derniers()), 2)
+            self.assertFalse(profilage._verrou_profil.locked())
+
+    def test_echantillonnage_et_tampon_borne(self):
+        with override_settings(PROFILAGE={'TAUX': 1.0, 'TAILLE': 2}):
+            for _ in range(3):
+                self.client.get(reverse('home'))
+            self.assertEqual([p['numero'] for p in profilage.derniers()], [3, 2])
+            self.assertIsNone(profilage.profil(1))
+
+    def test_reserve_au_staff(self):
+        self.client.force_login(User.objects.create_user('fan', password='x'))
+        self.assertEqual(self.client.get(reverse('profilage_liste')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('profilage_jeton')).status_code, 302)
+
+
+class GenerationDonneesTests(TestCase):
+    def generer(self, graine):
+        sortie = io.StringIO()
+        call_command(
+            'generer_donnees', '--graine', str(graine), '--agents', '2', '--spectateurs', '20',
+            '--programmes-par-saison', '10', '--reservations', '500', '--lot', '100', stdout=sortie,
+        )
+        return sortie.getvalue()
+
+    def test_volumes_et_coherence(self):
+        sortie = self.generer(1)
+        self.assertIn('500 réservation(s)', sortie)
+        self.assertEqual(User.objects.filter(is_staff=True).count(), 2)
+        self.assertEqual((Programme.objects.count(), Reservation.objects.count()), (10, 500))
+        self.assertTrue(0 < Paiement.objects.count() < 500)
+        # Un seul hachage, et des comptes utilisables.
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        self.assertTrue(self.client.login(username=User.objects.last().username, password='motdepasse'))
+
+        # Inventaire et compteurs cohérents avec les ventes générées.
+        for programme in Programme.objects.all():
+            vendus_a = sum(programme.reservations.filter(type_reservation='A').values_list('nombre_billet', flat=True))
+            self.assertEqual(programme.capacite_a - programme.places_restantes_a, vendus_a)
+        self.assertEqual(compteurs.recalculer(), [])
+        for paiement in Paiement.objects.select_related('reservation__programme')[:50]:
+            self.assertGreaterEqual(paiement.date_paiement, paiement.reservation.date_reservation)
+
+        # Séquences recalées : l'ORM insère à la suite des clés générées.
+        derniere = Reservation.objects.latest('pk').pk
+        reservation = Reservation.objects.create(
+            spectateur=User.objects.last(), programme=Programme.objects.first(),
+            type_reservation='B', nombre_billet=1,
+        )
+        self.assertEqual(reservation.pk, derniere + 1)
+
+    def test_graine_reproductible_et_ajout(self):
+        self.generer(7)
+        premieres = list(Reservation.objects.order_by('pk').values_list('type_reservation', 'nombre_billet')[:50])
+        Reservation.objects.all().delete()
+        # Une seconde génération s'ajoute aux données existantes (clés suivantes).
+        self.generer(7)
+        self.assertEqual(
+            list(Reservation.objects.order_by('pk').values_list('type_reservation', 'nombre_billet')[:50]), premieres
+        )
+        self.assertEqual(Programme.objects.count(), 20)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TestDeChargeTests(TransactionTestCase):
+    # Avec des réplicas configurés, le serveur lit aussi sur leurs alias.
+    databases = '__all__'
+
+    def test_parcours_complets_et_invariants(self):
+        sortie = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        sortie.close()
+        self.addCleanup(os.remove, sortie.name)
+        call_command(
+            'tester_charge', '--paliers', '1,2', '--parcours', '3', '--taux-rejeu', '1', '--sortie', sortie.name,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+        with open(sortie.name, encoding='utf-8') as f:
+            resultat = json.load(f)
+
+        self.assertEqual([palier['concurrence'] for palier in resultat['paliers']], [1, 2])
+        for palier in resultat['paliers']:
+            connexion = palier['etapes']['connexion']
+            self.assertEqual((connexion['appels'], connexion['erreurs']), (3, 0))
+            self.assertLessEqual(connexion['p50_ms'], connexion['p95_ms'])
+            self.assertLessEqual(connexion['p95_ms'], connexion['p99_ms'])
+            # Chaque événement est envoyé deux fois.
+            self.assertEqual(palier['etapes']['webhook']['appels'], 2 * palier['parcours_regles'])
+        invariants = resultat['invariants']
+        self.assertTrue(invariants['ok'], invariants)
+        self.assertEqual(invariants['paiements'], invariants['reservations_reglees'])
+        # Les données du test sont supprimées.
+        self.assertFalse(Reservation.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_centiles(self):
+        durees = [i / 100 for i in range(1, 101)]
+        self.assertEqual(
+            (charge.centile(durees, 50), charge.centile(durees, 95), charge.centile(durees, 99)), (0.5, 0.95, 0.99)
+        )
+        self.assertEqual(charge.centile([0.2], 99), 0.2)
+        self.assertIsNone(charge.centile([], 50))
+
+
+class BudgetRequetesTests(TestCase):
+    """
+    Le nombre de requêtes SQL de chaque vue de lecture ne doit pas dépendre
+    du volume de données : chaque vue est mesurée avec N puis 10N lignes
+    (cache vidé), contre un plafond de requêtes et de durée.
+    """
+    N = 10
+
+    # (nom, URL, requêtes max, secondes max à 10N) ; une requête de marge
+    # sur la mesure actuelle : un budget dépassé doit être un choix explicite.
+    BUDGETS = (
+        ('home', lambda t: reverse('home'), 4, 1.0),
+        ('programme_recherche', lambda t: reverse('programme_recherche') + '?q=equipe+adv', 5, 1.0),
+        ('reservation_create', lambda t: reverse('reservation_create', args=[t.programme.pk]), 4, 1.0),
+        ('reservation_history', lambda t: reverse('reservation_history'), 4, 1.0),
+        ('programme_list', lambda t: reverse('programme_list'), 5, 1.0),
+        ('programme_create', lambda t: reverse('programme_create'), 4, 1.0),
+        ('programme_import', lambda t: reverse('programme_import'), 3, 1.0),
+        ('programme_update', lambda t: reverse('programme_update', args=[t.programme.pk]), 5, 1.0),
+        ('reservation_management', lambda t: reverse('reservation_management'), 4, 1.0),
+        ('reservations_export', lambda t: reverse('reservations_export'), 4, 1.0),
+        ('agent_list', lambda t: reverse('agent_list'), 4, 1.0),
+        ('agent_update', lambda t: reverse('agent_update', args=[t.agent_personnalise.pk]), 4, 1.0),
+        ('paiement_list', lambda t: reverse('paiement_list'), 4, 1.0),
+        ('paiements_export', lambda t: reverse('paiements_export'), 4, 1.0),
+        ('rapport_ventes', lambda t: reverse('rapport_ventes'), 5, 1.0),
+        ('metriques', lambda t: reverse('metriques'), 1, 1.0),
+        ('profilage_liste', lambda t: reverse('profilage_liste'), 3, 1.0),
+        ('admin_customuser', lambda t: reverse('admin:ticketing_customuser_changelist'), 6, 2.0),
+        ('admin_programme', lambda t: reverse('admin:ticketing_programme_changelist'), 9, 2.0),
+        ('admin_reservation', lambda t: reverse('admin:ticketing_reservation_changelist'), 6, 2.0),
+        ('admin_paiement', lambda t: reverse('admin:ticketing_paiement_changelist'), 7, 2.0),
+        ('admin_evenementstripe', lambda t: reverse('admin:ticketing_evenementstripe_changelist'), 7, 2.0),
+        ('admin_billet', lambda t: reverse('admin:ticketing_billet_changelist'), 7, 2.0),
+        ('admin_user', lambda t: reverse('admin:auth_user_changelist'), 7, 2.0),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('budget', password='x')
+        cls.programme = creer_programme(cls.admin)
+        cls.agent_personnalise = CustomUser.objects.create(username='agent_budget', is_agent=True)
+        cls.semes = 0
+        cls.semer(cls.N)
+
+    @classmethod
+    def semer(cls, nombre):
+        """
+        `nombre` lignes de plus dans chaque table listée (bulk_create, sans
+        signaux : seules les requêtes des vues sont en jeu).
+        """
+        debut, cls.semes = cls.semes, cls.semes + nombre
+        spectateurs = User.objects.bulk_create([User(username=f'budget{i}') for i in range(debut, cls.semes)])
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'agent_budget{i}', is_agent=True) for i in range(debut, cls.semes)
+        ])
+        programmes = Programme.objects.bulk_create([
+            Programme(
+                nom_equipe1=f'Équipe {i}', nom_equipe2='Adverse', stadium=f'Stade {i % 3}',
+                date=datetime.date(2025, 9, 1) + datetime.timedelta(days=i), version='1', division='Ligue 1',
+                prix_a=20, prix_b=10, capacite_a=100, capacite_b=100, places_restantes_a=100,
+                places_restantes_b=100, agent=cls.admin,
+            )
+            for i in range(debut, cls.semes)
+        ])
+        compteurs.initialiser(programmes)
+        # L'administrateur est aussi spectateur : son historique grandit.
+        reservations = Reservation.objects.bulk_create([
+            Reservation(
+                spectateur=cls.admin if i % 2 else spectateur, programme=programme,
+                type_reservation='A', nombre_billet=2,
+            )
+            for i, (spectateur, programme) in enumerate(zip(spectateurs, programmes))
+        ])
+        Paiement.objects.bulk_create([
+            Paiement(reservation=reservation, mode_paiement='Stripe', montant=40) for reservation in reservations
+        ])
+        billets.emettre(reservations)
+        EvenementStripe.objects.bulk_create([
+            EvenementStripe(id_evenement=f'evt_budget_{i}', type_evenement='checkout.session.completed', payload='{}')
+            for i in range(debut, cls.semes)
+        ])
+        cumuls.cumuler(timezone.localdate() - datetime.timedelta(days=1), timezone.localdate())
+
+    def mesurer(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as requetes:
+            debut = time.perf_counter()
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            duree = time.perf_counter() - debut
+        self.assertEqual(response.status_code, 200, url)
+        return [requete['sql'] for requete in requetes.captured_queries], duree
+
+    def test_requetes_independantes_du_volume(self):
+        self.client.force_login(self.admin)
+        petites = {nom: self.mesurer(url(self)) for nom, url, _, _ in self.BUDGETS}
+        self.semer(9 * self.N)
+        for nom, url, max_requetes, max_secondes in self.BUDGETS:
+            with self.subTest(vue=nom):
+                requetes, duree = self.mesurer(url(self))
+                detail = '\n'.join(requetes)
+                self.assertEqual(
+                    len(requetes), len(petites[nom][0]),
+                    f"{nom} : {len(petites[nom][0])} requêtes pour {self.N} lignes, {len(requetes)} pour "
+                    f"{10 * self.N} :\n{detail}",
+                )
+                self.assertLessEqual(len(requetes), max_requetes, f"{nom} dépasse son budget :\n{detail}")
+                self.assertLess(duree, max_secondes, f"{nom} : {duree * 1000:.0f} ms")
+
+
+class RechercheProgrammesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='x', is_staff=True, is_superuser=True)
+        cls.derby = creer_programme(cls.agent, date=datetime.date(2025, 10, 5))
+        cls.sahel = creer_programme(
+            cls.agent, nom_equipe1='Étoile du Sahel', nom_equipe2='CS Sfaxien', stadium='Olympique de Sousse',
+            date=datetime.date(2025, 11, 2),
+        )
+        cls.coupe = creer_programme(
+            cls.agent, nom_equipe1='US Monastir', nom_equipe2='Espérance', stadium='Mustapha Ben Jannet',
+            division='Coupe', date=datetime.date(2026, 1, 10),
+        )
+
+    def test_prefixes_accents_et_classement(self):
+        self.assertEqual(recherche.rechercher('etoi sfax').programmes, [self.sahel])
+        self.assertEqual(recherche.rechercher('RADES').programmes, [self.derby])
+        # L'équipe pèse plus que le stade : « Espérance » avant « Olympique ».
+        self.assertEqual(recherche.rechercher('esp').programmes, [self.derby, self.coupe])
+        self.assertEqual(recherche.rechercher('coupe esp').programmes, [self.coupe])
+        self.assertEqual(recherche.rechercher('"esp* OR').programmes, [])
+
+    def test_filtres_de_dates_et_division(self):
+        self.assertEqual(recherche.rechercher('esp', date_debut=datetime.date(2025, 12, 1)).programmes, [self.coupe])
+        self.assertEqual(recherche.rechercher('esp', division='Ligue 1').programmes, [self.derby])
+        # Sans texte : filtres seuls, par date.
+        self.assertEqual(
+            recherche.rechercher('', date_fin=datetime.date(2025, 12, 1)).programmes, [self.derby, self.sahel]
+        )
+
+    def test_index_suit_les_modifications(self):
+        self.sahel.nom_equipe1 = 'Stade Gabésien'
+        self.sahel.save()
+        self.assertEqual(recherche.rechercher('etoile').programmes, [])
+        self.assertEqual(recherche.rechercher('gabes').programmes, [self.sahel])
+        self.derby.delete()
+        self.assertEqual(recherche.rechercher('rades').programmes, [])
+        # Les écritures en masse (INSERT direct) sont indexées aussi.
+        call_command('generer_donnees', '--agents', '1', '--spectateurs', '1', '--programmes-par-saison', '30',
+                     '--reservations', '0', stdout=io.StringIO())
+        self.assertEqual(
+            sum(len(recherche.identifiants(division, limite=100)) for division in ('ligue', 'coupe')),
+            Programme.objects.count(),
+        )
+
+    def test_pagination(self):
+        for jour in range(25):
+            creer_programme(self.agent, nom_equipe1='Stade Tunisien', date=datetime.date(2025, 9, 1 + jour))
+        premiere = recherche.rechercher('tunisien', taille=10)
+        troisieme = recherche.rechercher('tunisien', page=3, taille=10)
+        self.assertEqual((len(premiere), premiere.page_suivante), (10, 2))
+        self.assertEqual((len(troisieme), troisieme.page_suivante), (5, None))
+        self.assertFalse({p.pk for p in premiere} & {p.pk for p in troisieme})
+
+    def test_vue_json_et_html(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('programme_recherche'), {'q': 'esp', 'format': 'json'})
+        donnees = response.json()
+        self.assertEqual([r['id'] for r in donnees['resultats']], [self.derby.pk, self.coupe.pk])
+        self.assertEqual(donnees['resultats'][0]['url'], reverse('reservation_create', args=[self.derby.pk]))
+        self.assertIsNone(donnees['page_suivante'])
+
+        response = self.client.get(reverse('programme_recherche'), {'q': 'sousse'})
+        self.assertContains(response, 'Étoile du Sahel')
+        self.assertNotContains(response, 'Club Africain')
+        response = self.client.get(reverse('programme_recherche'), {'date_debut': 'hier', 'format': 'json'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recherche_admin_par_index(self):
+        self.client.force_login(self.agent)
+        response = self.client.get(reverse('admin:ticketing_programme_changelist'), {'q': 'sfax'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.sahel])
+
+
+class SuggestionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cls.agents = [User.objects.create_user(f'agent{i:02}', is_staff=True) for i in range(12)]
+        cls.spectateur = User.objects.create_user('agentine')
+        CustomUser.objects.create(username='agentine', num_phone='21698765432')
+        cls.programme = creer_programme(cls.agents[0], nom_equipe1='Stade Tunisien')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_agents_et_spectateurs_par_prefixe(self):
+        agents = suggestions.suggerer('agents', 'agent')
+        # Le staff seulement, par ordre alphabétique, limité.
+        self.assertEqual([s['libelle'] for s in agents], [f'agent{i:02}' for i in range(10)])
+        self.assertEqual(suggestions.suggerer('agents', 'agent1'), [
+            {'id': self.agents[10].pk, 'libelle': 'agent10'}, {'id': self.agents[11].pk, 'libelle': 'agent11'},
+        ])
+        self.assertEqual(suggestions.suggerer('spectateurs', 'agenti'), [{'id': self.spectateur.pk, 'libelle': 'agentine'}])
+        self.assertEqual(suggestions.suggerer('spectateurs', '216 98'), [{'id': self.spectateur.pk, 'libelle': 'agentine'}])
+        self.assertEqual(suggestions.suggerer('spectateurs', '21699'), [])
+
+    def test_programmes_et_reservations(self):
+        self.assertEqual([s['id'] for s in suggestions.suggerer('programmes', 'tunis')], [self.programme.pk])
+        Reservation.objects.bulk_create([
+            Reservation(id_reservation=pk, spectateur=self.spectateur, programme=self.programme,
+                        type_reservation='A', nombre_billet=1)
+            for pk in (13, 1300, 125, 12, 120)
+        ])
+        self.assertEqual([s['id'] for s in suggestions.suggerer('reservations', '12')], [12, 120, 125])
+        self.assertEqual([s['id'] for s in suggestions.suggerer('reservations', '1')], [12, 13, 120, 125, 1300])
+        self.assertIn('agentine', suggestions.suggerer('reservations', '13')[0]['libelle'])
+        self.assertEqual(suggestions.suggerer('reservations', '012'), [])
+
+    def test_vue_reservee_au_staff_et_mise_en_cache(self):
+        url = reverse('suggestions', args=['agents'])
+        self.client.force_login(self.spectateur)
+        self.assertEqual(self.client.get(url, {'q': 'agent'}).status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('suggestions', args=['inconnue']), {'q': 'a'}).status_code, 404)
+        for attendues in (1, 0):
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(len(self.client.get(url, {'q': 'agent'}).json()['suggestions']), 10)
+            self.assertEqual(len([r for r in requetes.captured_queries if '"username" >=' in r['sql']]), attendues)
+
+    def test_formulaire_programme_sans_liste_d_agents(self):
+        from .forms import ProgrammeForm
+        User.objects.bulk_create([User(username=f'agent_masse{i}', is_staff=True) for i in range(500)])
+        with self.assertNumQueries(0):
+            html = ProgrammeForm().as_p()
+        self.assertNotIn('agent_masse', html)
+        with self.assertNumQueries(1):
+            html = ProgrammeForm(instance=self.programme).as_p()
+        self.assertIn('value="agent00"', html)
+
+    def test_creation_et_modification_avec_agent_facultatif(self):
+        self.client.force_login(self.admin)
+        donnees = {
+            'nom_equipe1': 'CA Bizertin', 'nom_equipe2': 'AS Marsa', 'stadium': 'Bizerte', 'date': '2025-12-01',
+            'version': '1', 'division': 'Ligue 1', 'prix_a': '20', 'prix_b': '10', 'capacite_a': 10, 'capacite_b': 10,
+        }
+        self.assertEqual(self.client.post(reverse('programme_create'), donnees).json()['status'], 'success')
+        self.assertEqual(Programme.objects.get(nom_equipe1='CA Bizertin').agent, self.admin)
+        response = self.client.post(reverse('programme_create'), {**donnees, 'agent': self.spectateur.pk})
+        self.assertIn('agent', response.json()['errors'])
+
+        response = self.client.post(
+            reverse('programme_update', args=[self.programme.pk]), {**donnees, 'nom_equipe1': 'Stade Gabésien'}
+        )
+        self.assertEqual(response.json()['status'], 'success')
+        self.programme.refresh_from_db()
+        self.assertEqual((self.programme.nom_equipe1, self.programme.agent), ('Stade Gabésien', self.agents[0]))
+        self.client.post(reverse('programme_update', args=[self.programme.pk]), {**donnees, 'agent': self.agents[3].pk})
+        self.programme.refresh_from_db()
+        self.assertEqual(self.programme.agent, self.agents[3])
+
+
+class ReplicasTests(TransactionTestCase):
+    """
+    Base principale (la base de test) et réplica SQLite dans un fichier,
+    synchronisé à la demande : entre deux copies, le réplica est en retard.
+    """
+    ALIAS = 'replique_test'
+
+    def setUp(self):
+        self.repertoire = tempfile.TemporaryDirectory()
+        reglages_base = connections.configure_settings({
+            'default': {},
+            self.ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(self.repertoire.name, 'r.sqlite3')},
+        })[self.ALIAS]
+        connections[self.ALIAS] = DatabaseWrapper(reglages_base, self.ALIAS)
+        reglages = override_settings(REPLIQUES={'ALIAS': (self.ALIAS,), 'DUREE_EPINGLAGE': 10})
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        cache.clear()
+
+        agent = User.objects.create_user('agent', is_staff=True)
+        self.spectateur = User.objects.create_user('fan')
+        self.programme = creer_programme(agent)
+        self.client.force_login(self.spectateur)
+        replicas.synchroniser_sqlite(self.ALIAS)
+
+    def tearDown(self):
+        connections[self.ALIAS].close()
+        del connections[self.ALIAS]
+        self.repertoire.cleanup()
+
+    def historique(self, client=None):
+        response = (client or self.client).get(reverse('reservation_history'))
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['reservations'])
+
+    def test_lecture_sur_le_replica_puis_sur_la_base_principale_apres_une_ecriture(self):
+        # Écrite hors requête : absente du réplica tant qu'il n'est pas synchronisé.
+        Reservation.objects.create(spectateur=self.spectateur, programme=self.programme, type_reservation='B', nombre_billet=1)
+        self.assertEqual(self.historique(), [])
+
+        response = self.client.post(
+            reverse('reservation_create', args=[self.programme.pk]), {'type_reservation': 'A', 'nombre_billet': 2}
+        )
+        self.assertRedirects(response, reverse('reservation_history'), fetch_redirect_response=False)
+        self.assertIn(replicas.COOKIE, response.cookies)
+        # Épinglé à la base principale : les deux réservations sont visibles.
+        self.assertEqual(len(self.historique()), 2)
+
+        # Sans le cookie (expiré), la lecture revient au réplica en retard.
+        del self.client.cookies[replicas.COOKIE]
+        self.assertEqual(self.historique(), [])
+        replicas.synchroniser_sqlite(self.ALIAS)
+        connections[self.ALIAS].close()
+        self.assertEqual(len(self.historique()), 2)
+
+    def test_cookie_falsifie_ou_perime_ignore(self):
+        routeur = replicas.RouteurReplicas()
+        requete = RequestFactory().get('/')
+        requete.COOKIES[replicas.COOKIE] = '1'
+        jeton = replicas.debut_requete(requete)
+        self.assertEqual(routeur.db_for_read(Programme), self.ALIAS)
+        self.assertEqual(routeur.db_for_write(Programme), 'default')
+        self.assertEqual(routeur.db_for_read(Programme), 'default')
+        response = replicas.fin_requete(HttpResponse(), jeton)
+
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 11):
+            jeton = replicas.debut_requete(RequestFactory().get('/', HTTP_COOKIE=response.cookies.output(header='')))
+            self.assertEqual(routeur.db_for_read(Programme), self.ALIAS)
+            replicas.fin_requete(HttpResponse(), jeton)
+        # Hors requête, tout reste sur la base principale.
+        self.assertEqual(routeur.db_for_read(Programme), 'default')
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class AuthentificationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.client.force_login(self.spectateur)
+        self.url = reverse('reservation_history')
+
+    def requetes_authentification(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [r['sql'] for r in requetes.captured_queries if 'django_session' in r['sql'] or 'auth_user' in r['sql']]
+
+    def test_aucune_requete_d_authentification_cache_chaud(self):
+        self.assertEqual(self.requetes_authentification(), [])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_profil_cookie(self):
+        self.client.force_login(self.spectateur)
+        self.assertEqual(self.requetes_authentification(), [])
+
+    def test_modification_de_l_utilisateur_invalide_le_cache(self):
+        self.client.get(self.url)
+        self.spectateur.set_password('nouveau')
+        self.spectateur.save()
+        # Le condensat de session ne correspond plus : déconnecté.
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+        self.client.force_login(self.spectateur)
+        self.client.get(self.url)
+        self.spectateur.is_active = False
+        self.spectateur.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_utilisateur_supprime(self):
+        self.client.get(self.url)
+        self.spectateur.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class DroitsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.guichet = Group.objects.create(name='Guichet')
+        self.agent = User.objects.create_user('guichetier', password='x', is_staff=True)
+        self.agent.groups.add(self.guichet)
+        self.url = reverse('reservation_management')
+        self.client.force_login(self.agent)
+
+    def autoriser(self, *codenames):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.guichet.permissions.add(*Permission.objects.filter(
+                content_type__app_label='ticketing', codename__in=codenames,
+            ))
+
+    def test_permissions_des_groupes_en_cache(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.autoriser('view_reservation')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Session, utilisateur et permissions en cache : seule la page est lue.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # Retrait du groupe, puis suppression du groupe.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.groups.remove(self.guichet)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.groups.add(self.guichet)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.guichet.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_permissions_propres_et_vues_agents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.user_permissions.add(Permission.objects.get(codename='add_programme'))
+        self.assertEqual(self.client.get(reverse('programme_create')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('programme_update', args=[1])).status_code, 403)
+
+    def test_instantane(self):
+        self.autoriser('view_reservation', 'view_paiement')
+        instantane = droits.calculer(self.agent)
+        self.assertEqual(instantane.permissions, {'ticketing.view_reservation', 'ticketing.view_paiement'})
+        self.assertTrue(instantane.agent and instantane.staff)
+        self.assertFalse(instantane.spectateur or instantane.superuser)
+        admin = User.objects.create_superuser('admin', password='x')
+        self.assertIn('auth.delete_user', droits.calculer(admin).permissions)
+
+    def test_role_requis(self):
+        url = reverse('suggestions', args=['agents'])
+        self.assertEqual(self.client.get(url, {'q': 'g'}).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {'q': 'g'}).status_code, 302)
+
+        # Agent par son CustomUser, sans être staff.
+        guichetiere = User.objects.create_user('guichetiere', password='x')
+        profil = CustomUser.objects.create(username='guichetiere', is_agent=True)
+        self.client.force_login(guichetiere)
+        self.client.get(url, {'q': 'g'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'q': 'g'}).status_code, 200)
+        profil.is_agent = False
+        profil.is_spectateur = True
+        profil.save()
+        self.assertEqual(self.client.get(url, {'q': 'g'}).status_code, 403)
+
+        with self.assertRaises(ValueError):
+            droits.role_requis('caissier')
+
+
+class BilletsTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.programme = creer_programme(self.agent)
+
+    def reserver(self, section='A', nombre=2, spectateur=None):
+        return Reservation.objects.create(
+            spectateur=spectateur or self.spectateur, programme=self.programme,
+            type_reservation=section, nombre_billet=nombre,
+        )
+
+    def test_code_verifiable_hors_ligne(self):
+        cle = billets.cle_programme(self.programme.pk)
+        code = billets.encoder(self.programme.pk, 'B', 1234, cle)
+        self.assertEqual(len(code), 32)
+        self.assertRegex(code, r'^[A-Z2-7]+$')
+        with self.assertNumQueries(0):
+            contenu = billets.verifier(code.lower(), cle)
+        self.assertEqual(contenu, billets.Contenu(self.programme.pk, 'B', 1234))
+
+        falsifie = billets.encoder(self.programme.pk, 'B', 1235, cle)[:16] + code[16:]
+        for invalide, cle_lecteur in ((code, billets.cle_programme(self.programme.pk + 1)),
+                                      (falsifie, cle), ('pas un billet', cle), (code[:-8], cle)):
+            with self.subTest(code=invalide), self.assertRaises(billets.BilletInvalide):
+                billets.verifier(invalide, cle_lecteur)
+
+        sortie = io.StringIO()
+        call_command('cle_controle', str(self.programme.pk), stdout=sortie)
+        self.assertEqual(billets.verifier(code, base64.b32decode(sortie.getvalue().strip())).numero, 1234)
+
+    def test_emission_au_paiement_et_numerotation_par_section(self):
+        premiere = self.reserver('A', 3)
+        Paiement.objects.create(reservation=premiere, mode_paiement='Stripe', montant=90)
+        seconde, tribune = self.reserver('A', 2), self.reserver('B', 1)
+        for reservation in (seconde, tribune):
+            Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=30)
+        # Un second appel (rejeu) n'émet rien.
+        self.assertEqual(billets.emettre([premiere, seconde]), [])
+
+        numeros = lambda r: list(r.billets.order_by('numero').values_list('section', 'numero'))
+        self.assertEqual(numeros(premiere), [('A', 1), ('A', 2), ('A', 3)])
+        self.assertEqual(numeros(seconde), [('A', 4), ('A', 5)])
+        self.assertEqual(numeros(tribune), [('B', 1)])
+        cle = billets.cle_programme(self.programme.pk)
+        for billet in Billet.objects.all():
+            self.assertEqual(
+                billets.verifier(billet.code, cle), billets.Contenu(self.programme.pk, billet.section, billet.numero)
+            )
+
+        # Paiement annulé : billets retirés.
+        premiere.paiement.delete()
+        self.assertFalse(premiere.billets.exists())
+
+    def test_emission_en_masse_et_rattrapage(self):
+        reservations = [self.reserver('A' if i % 3 else 'B', 2) for i in range(30)]
+        Paiement.objects.bulk_create([
+            Paiement(reservation=reservation, mode_paiement='Stripe', montant=60) for reservation in reservations
+        ])
+        # Point de sauvegarde, déjà émis ?, par section la réservation des
+        # numéros (UPDATE, SELECT), puis un seul INSERT.
+        with self.assertNumQueries(2 + 1 + 2 * 2 + 1):
+            self.assertEqual(len(billets.emettre(reservations[:20])), 40)
+
+        sortie = io.StringIO()
+        call_command('emettre_billets', '--lot', '3', stdout=sortie)
+        self.assertIn('20 billet(s)', sortie.getvalue())
+        self.assertEqual(Billet.objects.count(), 60)
+        self.assertEqual(
+            sorted(Billet.objects.filter(section='A').values_list('numero', flat=True)), list(range(1, 41))
+        )
+        self.assertFalse(billets.a_emettre().exists())
+
+    def test_webhook_de_groupe(self):
+        reservations = [self.reserver(), self.reserver('B', 3)]
+        Reservation.objects.filter(pk__in=[r.pk for r in reservations]).update(stripe_session_id='cs_groupe', session_groupe='cs_groupe')
+        webhooks.traiter_checkout_groupe({'id': 'cs_groupe', 'metadata': {'groupe': '1'}})
+        webhooks.traiter_checkout_groupe({'id': 'cs_groupe', 'metadata': {'groupe': '1'}})
+        self.assertEqual([r.billets.count() for r in reservations], [2, 3])
+
+    def test_page_des_billets(self):
+        reservation = self.reserver('A', 2)
+        Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=60)
+        self.client.force_login(self.spectateur)
+        response = self.client.get(reverse('reservation_billets', args=[reservation.pk]))
+        for billet in reservation.billets.all():
+            self.assertContains(response, billet.code)
+        self.assertContains(self.client.get(reverse('reservation_history')), reverse('reservation_billets', args=[reservation.pk]))
+
+        self.client.force_login(self.agent)
+        self.assertEqual(self.client.get(reverse('reservation_billets', args=[reservation.pk])).status_code, 404)
+
+
+@override_settings(CONTROLE={'TAILLE_LOT': 1000, 'DELAI_ECRITURE': 3600})
+class ControleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        controle.reinitialiser()
+        self.addCleanup(controle.reinitialiser)
+        agent = User.objects.create_user('agent', is_staff=True)
+        self.programme = creer_programme(agent)
+        self.spectateur = User.objects.create_user('fan')
+        self.reservation = self.payer('A', 3)
+        self.codes = list(self.reservation.billets.order_by('numero').values_list('code', flat=True))
+        self.url = reverse('controle_scans', args=[self.programme.pk])
+
+    def payer(self, section, nombre):
+        reservation = Reservation.objects.create(
+            spectateur=self.spectateur, programme=self.programme, type_reservation=section, nombre_billet=nombre,
+        )
+        Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=30 * nombre)
+        return reservation
+
+    def scanner(self, *scans, appareil='porte-1'):
+        response = self.client.post(
+            self.url, json.dumps({'scans': [{'code': code, 'horodatage': h} for code, h in scans]}),
+            content_type='application/json',
+            headers={'X-Controle-Jeton': controle.jeton(self.programme.pk, appareil)},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [resultat['statut'] for resultat in response.json()['resultats']]
+
+    def test_passages_decides_en_memoire_et_ecrits_par_lots(self):
+        self.assertEqual(self.scanner((self.codes[0], None)), ['valide'])
+        with self.assertNumQueries(0):
+            statuts = self.scanner((self.codes[1], None), (self.codes[0], None), ('PAS UN BILLET', None))
+        self.assertEqual(statuts, ['valide', 'deja_utilise', 'invalide'])
+        autre = creer_programme(User.objects.get(username='agent'))
+        self.assertEqual(self.scanner((billets.encoder(autre.pk, 'A', 1), None)), ['invalide'])
+        self.assertFalse(Billet.objects.filter(utilise_le__isnull=False).exists())
+
+        # Point de sauvegarde, une lecture par section, un UPDATE groupé.
+        with self.assertNumQueries(4):
+            self.assertEqual(controle.vider(), 2)
+        self.assertEqual(
+            list(self.reservation.billets.order_by('numero').values_list('appareil', flat=True)),
+            ['porte-1', 'porte-1', ''],
+        )
+
+        # Nouveau processus : les bits sont relus depuis la base.
+        controle.reinitialiser()
+        self.assertEqual(self.scanner((self.codes[0], None), (self.codes[2], None)), ['deja_utilise', 'valide'])
+
+    def test_le_passage_le_plus_ancien_est_retenu(self):
+        maintenant = timezone.now()
+        t = lambda secondes: (maintenant - datetime.timedelta(seconds=secondes)).isoformat()
+        # Lot dans le désordre : traité par horodatage, résultats dans l'ordre du lot.
+        self.assertEqual(self.scanner((self.codes[0], t(10)), (self.codes[0], t(20))), ['deja_utilise', 'valide'])
+        # Journal d'un lecteur reconnecté, arrivé après coup mais plus ancien.
+        self.assertEqual(self.scanner((self.codes[0], t(30)), appareil='porte-2'), ['deja_utilise'])
+        # Horloge en avance : ramenée à l'heure du serveur.
+        futur = (maintenant + datetime.timedelta(hours=1)).isoformat()
+        self.assertEqual(self.scanner((self.codes[1], futur)), ['valide'])
+        controle.vider()
+
+        premier = self.reservation.billets.get(numero=1)
+        self.assertEqual((premier.utilise_le, premier.appareil), (maintenant - datetime.timedelta(seconds=30), 'porte-2'))
+        self.assertLessEqual(self.reservation.billets.get(numero=2).utilise_le, timezone.now())
+        # Un lot déjà écrit ne remplace pas un passage plus ancien.
+        self.scanner((self.codes[0], t(25)), appareil='porte-3')
+        controle.vider()
+        self.assertEqual(self.reservation.billets.get(numero=1).appareil, 'porte-2')
+
+    def test_billets_emis_puis_annules_apres_chargement(self):
+        self.scanner((self.codes[0], None))
+        tribune = self.payer('B', 1)
+        code = tribune.billets.get().code
+        # Billet émis après le chargement : une lecture groupée pour le lot.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scanner((code, None)), ['valide'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reservation.paiement.delete()
+        self.assertEqual(self.scanner((self.codes[1], None), (self.codes[0], None)), ['invalide', 'invalide'])
+        # Les passages en attente ont été écrits avant le rechargement.
+        self.assertTrue(Billet.objects.filter(pk=tribune.billets.get().pk, utilise_le__isnull=False).exists())
+
+    def test_jeton_du_lecteur(self):
+        corps = json.dumps({'scans': [{'code': self.codes[0]}]})
+        autre = controle.jeton(self.programme.pk + 1, 'porte-1')
+        for en_tetes in ({}, {'X-Controle-Jeton': 'faux'}, {'X-Controle-Jeton': autre}):
+            with self.subTest(en_tetes=en_tetes):
+                response = self.client.post(self.url, corps, content_type='application/json', headers=en_tetes)
+                self.assertEqual(response.status_code, 403)
+
+        sortie = io.StringIO()
+        call_command('cle_controle', str(self.programme.pk), '--appareil', 'porte-9', stdout=sortie)
+        cle, jeton = sortie.getvalue().split()
+        self.assertEqual(billets.verifier(self.codes[0], base64.b32decode(cle)).numero, 1)
+        self.assertEqual(controle.lire_jeton(jeton, self.programme.pk), 'porte-9')
+        for corps in ('pas du json', json.dumps({'scans': 'x'}), json.dumps({'scans': [{'code': 'x', 'horodatage': 'hier'}]})):
+            with self.subTest(corps=corps):
+                response = self.client.post(self.url, corps, content_type='application/json', headers={'X-Controle-Jeton': jeton})
+                self.assertEqual(response.status_code, 400)
+
+
+class ExpirationsTests(TestCase):
+    def setUp(self):
+        agent = User.objects.create_user('agent', is_staff=True)
+        self.spectateur = User.objects.create_user('fan', password='x')
+        self.programme = creer_programme(agent)
+        self.client.force_login(self.spectateur)
+
+    def reserver(self, section='A', nombre=2):
+        self.client.post(
+            reverse('reservation_create', args=[self.programme.pk]),
+            {'type_reservation': section, 'nombre_billet': nombre},
+        )
+        return Reservation.objects.latest('pk')
+
+    def places(self):
+        self.programme.refresh_from_db()
+        return (self.programme.places_restantes_a, self.programme.places_restantes_b)
+
+    def test_option_posee_a_la_creation_puis_confirmee_par_le_paiement(self):
+        avant = timezone.now()
+        reservation = self.reserver()
+        self.assertEqual(reservation.statut, Reservation.STATUT_EN_ATTENTE)
+        self.assertTrue(avant + expirations.duree() <= reservation.expire_le <= timezone.now() + expirations.duree())
+        self.assertEqual(self.places(), (8, 20))
+        self.assertContains(self.client.get(reverse('reservation_history')), 'En attente de paiement')
+
+        Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=60)
+        reservation.refresh_from_db()
+        self.assertEqual((reservation.statut, reservation.expire_le), (Reservation.STATUT_CONFIRMEE, None))
+        self.assertEqual(expirations.expirer(maintenant=timezone.now() + expirations.duree()), 0)
+        self.assertEqual(self.places(), (8, 20))
+
+    def test_balayage_par_lots(self):
+        echues = [self.reserver('A', 2), self.reserver('A', 1), self.reserver('B', 4)]
+        en_cours = self.reserver('B', 3)
+        Reservation.objects.filter(pk__in=[r.pk for r in echues]).update(expire_le=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(self.places(), (7, 13))
+
+        # Point de sauvegarde, options échues, statuts, puis inventaire et
+        # compteur par couple programme/section.
+        with self.assertNumQueries(2 + 1 + 1 + 2 * 2):
+            self.assertEqual(expirations.expirer(taille=10), 3)
+        self.assertEqual(self.places(), (10, 17))
+        self.assertEqual(
+            set(Reservation.objects.values_list('pk', 'statut')),
+            {*((r.pk, Reservation.STATUT_EXPIREE) for r in echues), (en_cours.pk, Reservation.STATUT_EN_ATTENTE)},
+        )
+        self.assertEqual(compteurs.recalculer(), [])
+
+        # Expirée puis supprimée : les places ne sont pas rendues deux fois.
+        Reservation.objects.get(pk=echues[0].pk).delete()
+        self.assertEqual(self.places(), (10, 17))
+        self.assertEqual(compteurs.recalculer(), [])
+
+        sortie = io.StringIO()
+        Reservation.objects.filter(pk=en_cours.pk).update(expire_le=timezone.now())
+        call_command('expirer_reservations', '--lot', '1', stdout=sortie)
+        self.assertIn('1 réservation(s) expirée(s)', sortie.getvalue())
+        self.assertEqual(self.places(), (10, 20))
+
+    def test_session_stripe_ouverte_retient_l_option(self):
+        reservation = self.reserver('A', 3)
+        maintenant = timezone.now() + expirations.duree()
+        # Session créée tard : Stripe l'a prolongée au-delà de l'option.
+        Reservation.objects.filter(pk=reservation.pk).update(
+            stripe_session_expire=maintenant + datetime.timedelta(minutes=10),
+        )
+        self.assertEqual(expirations.expirer(maintenant=maintenant), 0)
+        self.assertEqual(self.places(), (7, 20))
+
+        self.assertEqual(expirations.expirer(maintenant=maintenant + datetime.timedelta(minutes=10)), 1)
+        self.assertEqual(self.places(), (10, 20))
+
+    def test_index_partiel(self):
+        plan = expirations.a_expirer().order_by('expire_le').values('pk').explain()
+        self.assertIn('reservation_option_expire_idx', plan)
+
+    def test_paiement_apres_expiration(self):
+        reservation = self.reserver('A', 4)
+        Reservation.objects.filter(pk=reservation.pk).update(expire_le=timezone.now())
+        expirations.expirer()
+        response = self.client.get(reverse('create_checkout_session', args=[reservation.pk]))
+        self.assertRedirects(response, reverse('reservation_history'), fetch_redirect_response=False)
+
+        # Session Stripe réglée à la dernière minute : les places sont reprises.
+        reservation.refresh_from_db()
+        Paiement.objects.create(reservation=reservation, mode_paiement='Stripe', montant=120)
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.statut, Reservation.STATUT_CONFIRMEE)
+        self.assertEqual(self.places(), (6, 20))
+        self.assertEqual(compteurs.recalculer(), [])
+
+    def test_session_stripe_fermee_avec_l_option(self):
+        reservation = self.reserver()
+        Reservation.objects.filter(pk=reservation.pk).update(expire_le=timezone.now() + datetime.timedelta(hours=2))
+        reservation = Reservation.objects.select_related('programme').get(pk=reservation.pk)
+        parametres = paiements.parametres_session(reservation, '/succes/', '/echec/')
+        self.assertEqual(parametres['expires_at'], int(reservation.expire_le.timestamp()))
+        # Stripe refuse une expiration à moins de 30 minutes.
+        reservation.expire_le = timezone.now()
+        parametres = paiements.parametres_session(reservation, '/succes/', '/echec/')
+        self.assertGreater(parametres['expires_at'], time.time() + 30 * 60)
+        reservation.statut = Reservation.STATUT_CONFIRMEE
+        self.assertNotIn('expires_at', paiements.parametres_session(reservation, '/succes/', '/echec/'))
@@ -9,17 +9,27 @@ urlpatterns = [
 
     # URLs pour les spectateurs
     path('', views.home, name='home'),
+    path('programmes/recherche/', views.programme_recherche, name='programme_recherche'),
     path('programmes/<int:programme_id>/reserver/', views.reservation_create, name='reservation_create'),
+    path('reservations/groupe/', views.reservation_groupe, name='reservation_groupe'),
     path('reservations/historique/', views.reservation_history, name='reservation_history'),
+    path('reservations/<int:reservation_id>/billets/', views.reservation_billets, name='reservation_billets'),
+    path('file-attente/<slug:portee>/', views.file_attente_jeton, name='file_attente_jeton'),
+
+    # Contrôle d'accès (lecteurs de billets)
+    path('controle/<int:programme_id>/scans/', views.controle_scans, name='controle_scans'),
 
     # URLs pour les agents (CRUD Programme)
     path('programmes/', views.programme_list, name='programme_list'),
     path('programmes/creer/', views.programme_create, name='programme_create'),
+    path('programmes/importer/', views.programme_import, name='programme_import'),
     path('programmes/modifier/<int:programme_id>/', views.programme_update, name='programme_update'),
+    path('suggestions/<slug:entite>/', views.suggestions_saisie, name='suggestions'),
     path('programmes/supprimer/<int:programme_id>/', views.programme_delete, name='programme_delete'),
 
     # URLs pour la gestion des réservations par l'agent
     path('reservations/gestion/', views.reservation_management, name='reservation_management'),
+    path('reservations/export/', views.reservations_export, name='reservations_export'),
 
     # URLs pour la gestion des utilisateurs (Admin)
     path('agents/', views.agent_list, name='agent_list'),
@@ -30,11 +40,20 @@ urlpatterns = [
     # URLs pour la gestion des paiements
     # path('paiements/creer/', views.paiement_create, name='paiement_create'),
     path('paiements/', views.paiement_list, name='paiement_list'),
+    path('paiements/export/', views.paiements_export, name='paiements_export'),
+    path('ventes/rapport/', views.rapport_ventes, name='rapport_ventes'),
     path('paiements/supprimer/<int:pk>/', views.paiement_delete, name='paiement_delete'),
 
 
     path('paiement/<int:reservation_id>/', views.create_checkout_session, name='create_checkout_session'),
+    path('paiement/<int:reservation_id>/async/', views.create_checkout_session_async, name='create_checkout_session_async'),
     path('paiement/succes/', views.stripe_success, name='stripe_success'),
     path('paiement/echec/', views.stripe_cancel, name='stripe_cancel'),
     path('paiement/webhook/', views.stripe_webhook, name='stripe_webhook'),
+
+    # Supervision
+    path('metrics', views.metriques_prometheus, name='metriques'),
+    path('profilage/', views.profilage_liste, name='profilage_liste'),
+    path('profilage/jeton/', views.profilage_jeton, name='profilage_jeton'),
+    path('profilage/<int:numero>/', views.profilage_detail, name='profilage_detail'),
 ]
\ No newline at end of file
@@ -1,20 +1,34 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
 from django.conf import settings
-from .models import Programme, Reservation, Paiement, CustomUser
-from .forms import ProgrammeForm, ReservationForm, PaiementForm, CustomUserCreationForm, CustomUserChangeForm
+from django.db import transaction
+from .models import Programme, Reservation, Paiement, CustomUser, EvenementStripe
+from .forms import ProgrammeForm, ReservationSpectateurForm, CustomUserCreationForm, CustomUserChangeForm, FiltreVentesForm, RapportVentesForm, RechercheProgrammesForm
+from .inventory import reserver_places, PlacesInsuffisantes
+from . import file_attente, cache_programmes
+from .pagination import paginer
+from . import exports, expirations, paiements, groupes, compteurs, controle, cumuls, metriques, profilage, recherche, suggestions
+from .imports import importer_programmes, lire_televersement
+from .droits import role_requis
 
 import stripe
-import os
 import json
 
 # Assurez-vous d'avoir configuré vos clés Stripe dans settings.py
+# (les sessions de paiement passent par le client de ticketing/paiements.py)
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 # Vues pour l'authentification et l'enregistrement
@@ -28,8 +42,9 @@ def user_login(request):
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
             username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
+            # Le formulaire a déjà authentifié l'utilisateur : ne pas hacher
+            # le mot de passe une seconde fois.
+            user = form.get_user()
             if user is not None:
                 login(request, user)
                 messages.success(request, f"Bienvenue, {username} !")
@@ -89,10 +104,67 @@ def user_signup(request):
 def home(request):
     """
     Vue de la page d'accueil, affichant la liste des programmes.
-    """
-    programmes = Programme.objects.all().order_by('date')
+    Pour un visiteur anonyme (ni session ni messages en attente), la page
+    rendue est servie depuis le cache, sans aucune requête SQL.
+    """
+    anonyme = (
+        settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+    if anonyme:
+        html = cache_programmes.page('home', lambda: render_to_string(
+            'ticket_app/home.html',
+            {'programmes': cache_programmes.programmes('date')},
+            request,
+        ))
+        response = HttpResponse(html)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    programmes = cache_programmes.programmes('date')
     return render(request, 'ticket_app/home.html', {'programmes': programmes})
 
+def programme_recherche(request):
+    """
+    Recherche plein texte des programmes (équipes, stade, division) avec
+    filtres de dates, résultats classés et paginés. ?format=json renvoie les
+    résultats en JSON.
+    """
+    filtres = RechercheProgrammesForm(request.GET)
+    if not filtres.is_valid():
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'erreurs': filtres.errors}, status=400)
+        return render(request, 'ticket_app/programme_recherche.html', {'filtres': filtres, 'resultats': None})
+    donnees = filtres.cleaned_data
+    resultats = recherche.rechercher(
+        donnees['q'], donnees['date_debut'], donnees['date_fin'], donnees['division'], donnees['page'],
+    )
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'resultats': [
+                {
+                    'id': programme.pk,
+                    'nom_equipe1': programme.nom_equipe1,
+                    'nom_equipe2': programme.nom_equipe2,
+                    'stadium': programme.stadium,
+                    'division': programme.division,
+                    'date': programme.date,
+                    'prix_a': programme.prix_a,
+                    'prix_b': programme.prix_b,
+                    'url': reverse('reservation_create', args=[programme.pk]),
+                }
+                for programme in resultats
+            ],
+            'page': resultats.page,
+            'page_suivante': resultats.page_suivante,
+        })
+    parametres = request.GET.copy()
+    parametres.pop('page', None)
+    return render(request, 'ticket_app/programme_recherche.html', {
+        'filtres': filtres,
+        'resultats': resultats,
+        'parametres': parametres.urlencode(),
+    })
+
 @login_required
 def reservation_create(request, programme_id):
     """
@@ -101,32 +173,141 @@ def reservation_create(request, programme_id):
     """
     programme = get_object_or_404(Programme, pk=programme_id)
     if request.method == 'POST':
-        form = ReservationForm(request.POST)
+        form = ReservationSpectateurForm(request.POST)
         if form.is_valid():
             reservation = form.save(commit=False)
             reservation.spectateur = request.user
             reservation.programme = programme
-            reservation.save()
-            messages.success(request, 'Votre réservation a été créée avec succès.')
-            return redirect('reservation_history')
+            # Option sur les places jusqu'au paiement (voir ticketing/expirations.py).
+            reservation.statut = Reservation.STATUT_EN_ATTENTE
+            reservation.expire_le = expirations.echeance()
+            try:
+                # Les places sont retirées et la réservation créée dans la même
+                # transaction : un échec de l'insertion rend les places.
+                with transaction.atomic():
+                    reserver_places(programme.pk, reservation.type_reservation, reservation.nombre_billet)
+                    reservation.save()
+            except PlacesInsuffisantes as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, 'Votre réservation a été créée avec succès.')
+                return redirect('reservation_history')
     else:
-        form = ReservationForm()
+        form = ReservationSpectateurForm()
     return render(request, 'ticket_app/reservation_form.html', {'form': form, 'programme': programme})
 
+@login_required
+@require_POST
+def reservation_groupe(request):
+    """
+    Réservation de groupe (clubs, sponsors) en JSON :
+        {"mode": "tout_ou_rien" | "partiel",
+         "lignes": [{"programme": 12, "section": "A", "quantite": 40}, ...]}
+    Toutes les réservations sont créées dans une transaction et réglées par
+    une seule session de paiement. La réponse donne le statut de chaque ligne.
+    """
+    try:
+        donnees = json.loads(request.body)
+        if not isinstance(donnees, dict):
+            raise groupes.DemandeInvalide("Un objet JSON est attendu.")
+        lignes = groupes.lire_lignes(donnees.get('lignes'))
+        reservations = groupes.reserver_groupe(
+            request.user, lignes, donnees.get('mode', groupes.MODE_TOUT_OU_RIEN)
+        )
+    except (ValueError, groupes.DemandeInvalide) as e:
+        return JsonResponse({'message': f'Demande invalide : {e}', 'status': 'error'}, status=400)
+
+    resultat = {'lignes': [ligne.as_dict() for ligne in lignes], 'paiement': None}
+    if not reservations:
+        invalide = any(ligne.statut == groupes.STATUT_INVALIDE for ligne in lignes)
+        return JsonResponse({
+            'message': 'Aucune place réservée.', 'status': 'error', **resultat,
+        }, status=400 if invalide else 409)
+
+    try:
+        session = paiements.creer_session_groupe(
+            reservations,
+            success_url=request.build_absolute_uri('/paiement/succes/'),
+            cancel_url=request.build_absolute_uri('/paiement/echec/'),
+        )
+        resultat['paiement'] = {'url': session.url, 'montant': session.amount_total / 100}
+        message = f'{len(reservations)} réservation(s) créée(s).'
+    except Exception as e:
+        # Les places restent réservées : chaque réservation peut encore être
+        # payée depuis l'historique.
+        message = f"{len(reservations)} réservation(s) créée(s), mais la session de paiement a échoué : {e}"
+    return JsonResponse({'message': message, 'status': 'success', **resultat}, status=201)
+
+def file_attente_jeton(request, portee):
+    """
+    Point d'entrée JSON de la salle d'attente : attribue un numéro au visiteur
+    (cookie signé) et renvoie sa position et son attente estimée.
+    N'accède pas à la base de données.
+    """
+    config = file_attente.configuration()
+    portees_valides = {file_attente.portee_pour_vue(vue, {}) for vue in config['VUES']}
+    nom, _, identifiant = portee.rpartition('-')
+    if portee not in portees_valides and not (nom == 'programme' and identifiant.isdigit()):
+        return JsonResponse({'message': 'File d\'attente inconnue.', 'status': 'error'}, status=404)
+
+    place, valeur_cookie = file_attente.placer(request, portee)
+    response = JsonResponse(place.as_dict())
+    response['Cache-Control'] = 'no-store'
+    if valeur_cookie:
+        file_attente.ecrire_cookie(response, portee, valeur_cookie)
+    return response
+
 @login_required
 def reservation_history(request):
     """
     Vue pour afficher l'historique des réservations de l'utilisateur.
     """
-    reservations = Reservation.objects.filter(spectateur=request.user).order_by('-date_reservation')
+    # Le programme est lu dans la même requête (titre de chaque carte).
+    reservations = Reservation.objects.filter(spectateur=request.user).select_related('programme').only(
+        'date_reservation', 'type_reservation', 'nombre_billet', 'statut', 'expire_le',
+        'programme__nom_equipe1', 'programme__nom_equipe2',
+    ).order_by('-date_reservation')
     return render(request, 'ticket_app/reservation_history.html', {'reservations': reservations})
 
 
+@login_required
+def reservation_billets(request, reservation_id):
+    """
+    Billets électroniques d'une réservation payée du spectateur, à présenter
+    au contrôle (un code par place, voir ticketing/billets.py).
+    """
+    reservation = get_object_or_404(
+        Reservation.objects.select_related('programme'), pk=reservation_id, spectateur=request.user,
+    )
+    billets = reservation.billets.order_by('numero')
+    return render(request, 'ticket_app/reservation_billets.html', {'reservation': reservation, 'billets': billets})
+
+
+@csrf_exempt
+@require_POST
+def controle_scans(request, programme_id):
+    """
+    Passages d'un lecteur de contrôle, par lots : {"scans": [{"code": ...,
+    "horodatage": ISO 8601}, ...]}. Le lecteur s'authentifie par le jeton
+    signé de la commande cle_controle ; le statut de chaque passage est
+    décidé en mémoire (voir ticketing/controle.py).
+    """
+    appareil = controle.lire_jeton(request.headers.get(controle.configuration()['EN_TETE']), programme_id)
+    if appareil is None:
+        return JsonResponse({'erreur': "Jeton de contrôle invalide."}, status=403)
+    try:
+        scans = json.loads(request.body)['scans']
+        resultats = controle.traiter(programme_id, appareil, scans)
+    except (ValueError, KeyError, TypeError, controle.RequeteInvalide) as e:
+        return JsonResponse({'erreur': str(e)}, status=400)
+    return JsonResponse({'resultats': resultats})
+
+
 # Vues pour les Agents (CRUD pour Programme et Réservation)
 # ---
 
 @login_required
-@permission_required('app_name.add_programme', raise_exception=True)
+@permission_required('ticketing.add_programme', raise_exception=True)
 def programme_create(request):
     """
     Vue pour créer un nouveau programme (match).
@@ -136,7 +317,8 @@ def programme_create(request):
         form = ProgrammeForm(request.POST)
         if form.is_valid():
             programme = form.save(commit=False)
-            programme.agent = request.user
+            if not programme.agent_id:
+                programme.agent = request.user
             programme.save()
             return JsonResponse({'message': 'Le programme a été créé avec succès.', 'status': 'success'})
         return JsonResponse({'message': 'Erreur de formulaire.', 'errors': form.errors, 'status': 'error'})
@@ -147,7 +329,33 @@ def programme_create(request):
 
 
 @login_required
-@permission_required('app_name.change_programme', raise_exception=True)
+@permission_required('ticketing.add_programme', raise_exception=True)
+def programme_import(request):
+    """
+    Vue pour importer les programmes d'une saison (fichier CSV ou JSON).
+    Les lignes en erreur sont signalées, les autres sont créées ou mises à jour.
+    """
+    if request.method == 'POST':
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return JsonResponse({'message': 'Aucun fichier fourni.', 'status': 'error'})
+        try:
+            lignes = lire_televersement(fichier)
+        except ValidationError as e:
+            return JsonResponse({'message': ' '.join(e.messages), 'status': 'error'})
+        rapport = importer_programmes(
+            lignes, agent_defaut=request.user, simulation=bool(request.POST.get('simulation'))
+        )
+        return JsonResponse({
+            'message': f"{rapport.crees} programme(s) créé(s), {rapport.mis_a_jour} mis à jour.",
+            'status': 'error' if rapport.erreurs else 'success',
+            **rapport.as_dict(),
+        })
+    return render(request, 'ticket_app/programme_import.html')
+
+
+@login_required
+@permission_required('ticketing.change_programme', raise_exception=True)
 def programme_update(request, programme_id):
     """
     Vue pour mettre à jour un programme existant.
@@ -166,7 +374,7 @@ def programme_update(request, programme_id):
     return render(request, 'ticket_app/programme_form.html', {'form': form})
 
 @login_required
-@permission_required('app_name.delete_programme', raise_exception=True)
+@permission_required('ticketing.delete_programme', raise_exception=True)
 @require_POST
 def programme_delete(request, programme_id):
     """
@@ -181,13 +389,74 @@ def programme_delete(request, programme_id):
         return JsonResponse({'message': f'Erreur lors de la suppression : {e}', 'status': 'error'})
 
 @login_required
-@permission_required('app_name.view_reservation', raise_exception=True)
+@permission_required('ticketing.view_reservation', raise_exception=True)
 def reservation_management(request):
     """
     Vue pour la gestion des réservations par l'agent.
+    Pagination par curseur : le coût d'une page ne dépend pas de la taille de la table.
+    """
+    filtres = FiltreVentesForm(request.GET or None)
+    reservations = Reservation.objects.select_related('spectateur', 'programme').only(
+        'id_reservation', 'date_reservation', 'type_reservation', 'nombre_billet',
+        'spectateur__username', 'programme__nom_equipe1', 'programme__nom_equipe2',
+    )
+    reservations = filtres.filtrer(reservations, 'date_reservation', 'programme', 'type_reservation')
+    page = paginer(reservations, 'date_reservation', 'id_reservation', request.GET.get('curseur'))
+    return render(request, 'ticket_app/reservation_management.html', {
+        'reservations': page,
+        'page': page,
+        'filtres': filtres,
+    })
+
+def _export_ventes(request, nom):
+    filtres = FiltreVentesForm(request.GET)
+    # Un filtre invalide n'est pas ignoré : l'export complet serait servi à sa place.
+    if not filtres.is_valid():
+        return JsonResponse({'erreurs': filtres.errors}, status=400)
+    format_export = request.GET.get('format', 'csv')
+    if format_export not in exports.FORMATS:
+        format_export = 'csv'
+    response = StreamingHttpResponse(
+        exports.flux(nom, format_export, filtres),
+        content_type=exports.FORMATS[format_export],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nom}.{format_export}"'
+    return response
+
+@login_required
+@permission_required('ticketing.view_reservation', raise_exception=True)
+def reservations_export(request):
+    """
+    Export en flux (CSV ou NDJSON) des réservations, avec les mêmes filtres
+    que la vue de gestion.
     """
-    reservations = Reservation.objects.all().order_by('-date_reservation')
-    return render(request, 'ticket_app/reservation_management.html', {'reservations': reservations})
+    return _export_ventes(request, 'reservations')
+
+@login_required
+@permission_required('ticketing.view_paiement', raise_exception=True)
+def paiements_export(request):
+    """
+    Export en flux (CSV ou NDJSON) des paiements, avec les mêmes filtres
+    que la liste des paiements.
+    """
+    return _export_ventes(request, 'paiements')
+
+@login_required
+@permission_required('ticketing.view_paiement', raise_exception=True)
+def rapport_ventes(request):
+    """
+    Rapport des ventes par période, division et stade, calculé uniquement à
+    partir des cumuls journaliers (commande cumuler_ventes).
+    """
+    filtres = RapportVentesForm(request.GET or {'par': 'mois'})
+    lignes = []
+    if filtres.is_valid():
+        lignes = cumuls.rapport(**filtres.cleaned_data)
+    return render(request, 'ticket_app/rapport_ventes.html', {
+        'filtres': filtres,
+        'lignes': lignes,
+        'dernier_cumul': cumuls.dernier_cumul(),
+    })
 
 # Vues pour l'Admin
 # ---
@@ -252,11 +521,23 @@ def agent_delete(request, pk):
     except Exception as e:
         return JsonResponse({'message': f'Erreur lors de la suppression : {e}', 'status': 'error'})
 
+@role_requis('agent')
+def suggestions_saisie(request, entite):
+    """
+    Suggestions de la saisie assistée (widget SaisieAssistee) : au plus
+    quelques lignes correspondant au préfixe ?q=, réservées aux agents.
+    """
+    if entite not in suggestions.ENTITES:
+        raise Http404
+    return JsonResponse({'suggestions': suggestions.suggerer(entite, request.GET.get('q'))})
+
 def programme_list(request):
     """
     Vue pour lister les programmes (accessible aux agents).
     """
-    programmes = Programme.objects.all().order_by('-date')
+    # La liste vient du cache ; les ventes, qui changent à chaque réservation,
+    # sont lues dans les compteurs (une requête, sans parcourir les réservations).
+    programmes = compteurs.par_programme(cache_programmes.programmes('-date'))
     return render(request, 'ticket_app/programme_list.html', {'programmes': programmes})
 
 # Vues de paiement
@@ -268,42 +549,50 @@ def create_checkout_session(request, reservation_id):
     Vue pour créer une session de paiement Stripe.
     Cette vue remplace paiement_create.
     """
-    reservation = get_object_or_404(Reservation, pk=reservation_id, spectateur=request.user)
-    programme = reservation.programme
-    
-    # Calcule le prix total en fonction du type de réservation
-    if reservation.type_reservation == 'A':
-        prix_unitaire = programme.prix_a
-    else:
-        prix_unitaire = programme.prix_b
-
-    # Convertit le prix en centimes, car Stripe travaille avec des entiers
-    total_amount = int(prix_unitaire * reservation.nombre_billet * 100)
+    reservation = get_object_or_404(
+        Reservation.objects.select_related('programme', 'paiement'), pk=reservation_id, spectateur=request.user
+    )
+    if hasattr(reservation, 'paiement'):
+        messages.info(request, "Cette réservation est déjà payée.")
+        return redirect('reservation_history')
+    if reservation.statut == Reservation.STATUT_EXPIREE:
+        messages.error(request, "Cette réservation a expiré : ses places ont été remises en vente.")
+        return redirect('reservation_history')
+    try:
+        url = paiements.url_paiement(
+            reservation,
+            success_url=request.build_absolute_uri('/paiement/succes/'),
+            cancel_url=request.build_absolute_uri('/paiement/echec/'),
+        )
+        return redirect(url)
+    except Exception as e:
+        messages.error(request, f"Une erreur s'est produite lors de la création de la session de paiement: {e}")
+        return redirect('reservation_history')
 
+@login_required
+async def create_checkout_session_async(request, reservation_id):
+    """
+    Version asynchrone de create_checkout_session, servie par config/asgi.py.
+    L'appel à Stripe n'occupe pas de thread : un même worker multiplexe de
+    nombreux paiements en cours.
+    """
+    user = await request.auser()
+    reservation = await aget_object_or_404(
+        Reservation.objects.select_related('programme', 'paiement'), pk=reservation_id, spectateur=user
+    )
+    if hasattr(reservation, 'paiement'):
+        messages.info(request, "Cette réservation est déjà payée.")
+        return redirect('reservation_history')
+    if reservation.statut == Reservation.STATUT_EXPIREE:
+        messages.error(request, "Cette réservation a expiré : ses places ont été remises en vente.")
+        return redirect('reservation_history')
     try:
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[
-                {
-                    'price_data': {
-                        'currency': 'usd',
-                        'unit_amount': total_amount,
-                        'product_data': {
-                            'name': f'Billet pour {programme.nom_equipe1} vs {programme.nom_equipe2}',
-                            'description': f'Réservation pour {reservation.nombre_billet} billet(s) en section {reservation.type_reservation}',
-                        },
-                    },
-                    'quantity': 1,
-                },
-            ],
-            metadata={
-                'reservation_id': reservation.id_reservation
-            },
-            mode='payment',
+        url = await paiements.url_paiement_async(
+            reservation,
             success_url=request.build_absolute_uri('/paiement/succes/'),
             cancel_url=request.build_absolute_uri('/paiement/echec/'),
         )
-        return redirect(checkout_session.url)
+        return redirect(url)
     except Exception as e:
         messages.error(request, f"Une erreur s'est produite lors de la création de la session de paiement: {e}")
         return redirect('reservation_history')
@@ -326,7 +615,10 @@ def stripe_cancel(request):
 @require_POST
 def stripe_webhook(request):
     """
-    Vue pour gérer les webhooks de Stripe et confirmer les paiements.
+    Vue pour recevoir les webhooks de Stripe.
+    L'événement vérifié est seulement enregistré dans la boîte de réception
+    (une fois par identifiant) ; il est traité en arrière-plan par la commande
+    traiter_webhooks. La réponse part ainsi en quelques millisecondes.
     """
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -343,38 +635,80 @@ def stripe_webhook(request):
         # Invalid signature
         return HttpResponse(status=400)
 
-    # Gérer les événements de paiement
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        reservation_id = session.get('metadata', {}).get('reservation_id')
-
-        if reservation_id:
-            try:
-                reservation = Reservation.objects.get(pk=int(reservation_id))
-                montant_total = session['amount_total'] / 100 # Convertir en dollars
-                
-                # Créer une nouvelle instance de Paiement
-                Paiement.objects.create(
-                    reservation=reservation,
-                    mode_paiement='Stripe',
-                    montant=montant_total
-                )
-                
-                # Optionnel : marquer la réservation comme payée
-                # reservation.is_paid = True
-                # reservation.save()
-
-            except Reservation.DoesNotExist:
-                return HttpResponse(status=404)
-        
+    # Un seul INSERT ; les rejeux de Stripe (même identifiant) sont ignorés.
+    EvenementStripe.objects.bulk_create([
+        EvenementStripe(
+            id_evenement=event['id'],
+            type_evenement=event['type'],
+            payload=payload.decode('utf-8'),
+        )
+    ], ignore_conflicts=True)
     return HttpResponse(status=200)
 
-def paiement_list(request):
+def metriques_prometheus(request):
+    """
+    Métriques au format texte de Prometheus, additionnées sur tous les workers.
+    Réservée aux adresses de METRIQUES['IPS_AUTORISEES'] (collecteur local).
+    """
+    config = metriques.configuration()
+    if request.META.get('REMOTE_ADDR') not in config['IPS_AUTORISEES']:
+        return HttpResponse(status=404)
+    return HttpResponse(
+        metriques.exposition(config), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+@staff_member_required
+def profilage_liste(request):
+    """
+    Derniers profils de requêtes (tampon circulaire), réservés au staff.
+    """
+    return render(request, 'ticket_app/profilage_liste.html', {
+        'profils': profilage.derniers(),
+        'config': profilage.configuration(),
+    })
+
+@staff_member_required
+def profilage_detail(request, numero):
+    """
+    Profil cProfile et requêtes SQL lentes (avec leur plan) d'une requête.
     """
-    Vue pour lister tous les paiements.
+    profil = profilage.profil(numero)
+    if profil is None:
+        raise Http404("Profil expiré ou inconnu.")
+    return render(request, 'ticket_app/profilage_detail.html', {'profil': profil})
+
+@staff_member_required
+def profilage_jeton(request):
+    """
+    Jeton signé à envoyer dans l'en-tête de profilage pour profiler ses
+    propres requêtes (curl -H "X-Ticketing-Profil: <jeton>" ...).
+    """
+    config = profilage.configuration()
+    return JsonResponse({
+        'en_tete': config['EN_TETE'],
+        'jeton': profilage.jeton(request.user),
+        'validite': config['DUREE_JETON'],
+    })
+
+def paiement_list(request):
     """
-    paiements = Paiement.objects.all().order_by('-date_paiement')
-    return render(request, 'ticket_app/paiement_list.html', {'paiements': paiements})
+    Vue pour lister tous les paiements, paginés par curseur.
+    """
+    filtres = FiltreVentesForm(request.GET or None)
+    paiements = Paiement.objects.select_related(
+        'reservation__spectateur', 'reservation__programme'
+    ).only(
+        'id_paiement', 'date_paiement', 'montant', 'mode_paiement',
+        'reservation__id_reservation', 'reservation__spectateur__username',
+        'reservation__programme__nom_equipe1', 'reservation__programme__nom_equipe2',
+    )
+    paiements = filtres.filtrer(paiements, 'date_paiement', 'reservation__programme', 'reservation__type_reservation')
+    page = paginer(paiements, 'date_paiement', 'id_paiement', request.GET.get('curseur'))
+    return render(request, 'ticket_app/paiement_list.html', {
+        'paiements': page,
+        'page': page,
+        'filtres': filtres,
+    })
 
 @require_POST
 def paiement_delete(request, pk):
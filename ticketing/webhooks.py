@@ -0,0 +1,155 @@
+"""
+Traitement en arrière-plan des événements Stripe reçus par stripe_webhook.
+
+Les événements sont lus par lots dans la boîte de réception (EvenementStripe).
+Chaque événement est traité dans son propre point de sauvegarde : un échec
+n'annule pas le reste du lot. Un événement en échec est retenté avec un délai
+croissant, puis abandonné après MAX_TENTATIVES. Les traitements sont
+idempotents : rejouer un événement ne crée pas de second paiement.
+"""
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import billets, compteurs, expirations
+from .models import EvenementStripe, Paiement, Reservation
+from .paiements import montant_centimes
+
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 100
+MAX_TENTATIVES = 5
+DELAI_MAX = timedelta(hours=1)
+
+
+class EvenementInvalide(Exception):
+    """
+    Erreur définitive : l'événement est abandonné sans nouvelle tentative.
+    """
+
+
+def traiter_checkout_complete(session):
+    """
+    Enregistre le paiement d'une session de paiement terminée.
+    """
+    metadata = session.get('metadata') or {}
+    if metadata.get('groupe'):
+        traiter_checkout_groupe(session)
+        return
+    reservation_id = metadata.get('reservation_id')
+    if not reservation_id:
+        return
+    try:
+        reservation = Reservation.objects.get(pk=int(reservation_id))
+    except (Reservation.DoesNotExist, ValueError):
+        raise EvenementInvalide(f"Réservation {reservation_id} introuvable.")
+
+    # get_or_create rend le traitement idempotent face aux rejeux de Stripe.
+    Paiement.objects.get_or_create(
+        reservation=reservation,
+        defaults={
+            'mode_paiement': 'Stripe',
+            'montant': Decimal(session['amount_total']) / 100,
+        },
+    )
+
+
+def traiter_checkout_groupe(session):
+    """
+    Enregistre en un seul INSERT les paiements des réservations d'une session
+    de groupe, retrouvées par session_groupe (stripe_session_id a pu être
+    remplacé depuis par une session individuelle), confirme ces réservations
+    et émet leurs billets.
+    """
+    reservations = list(
+        Reservation.objects.filter(session_groupe=session['id']).select_related('programme')
+    )
+    if not reservations:
+        # Groupe d'une seule réservation, antérieur à session_groupe.
+        reservations = list(
+            Reservation.objects.filter(stripe_session_id=session['id']).select_related('programme')
+        )
+    if not reservations:
+        raise EvenementInvalide(f"Aucune réservation pour la session {session['id']}.")
+    # Les réservations déjà payées sont écartées : le traitement reste
+    # idempotent et seuls les nouveaux paiements sont comptés.
+    deja_payees = set(
+        Paiement.objects.filter(reservation__in=reservations).values_list('reservation_id', flat=True)
+    )
+    nouveaux = Paiement.objects.bulk_create([
+        Paiement(
+            reservation=reservation,
+            mode_paiement='Stripe',
+            montant=Decimal(montant_centimes(reservation)) / 100,
+        )
+        for reservation in reservations if reservation.pk not in deja_payees
+    ])
+    compteurs.paiements_ajoutes(nouveaux)
+    expirations.confirmer([paiement.reservation for paiement in nouveaux])
+    billets.emettre([paiement.reservation for paiement in nouveaux])
+
+
+TRAITEMENTS = {
+    'checkout.session.completed': traiter_checkout_complete,
+}
+
+
+def traiter_evenement(evenement):
+    traitement = TRAITEMENTS.get(evenement.type_evenement)
+    if traitement is None:
+        return
+    donnees = json.loads(evenement.payload)
+    traitement(donnees['data']['object'])
+
+
+def _delai(tentatives):
+    return min(timedelta(seconds=2 ** tentatives), DELAI_MAX)
+
+
+def traiter_lot(taille=TAILLE_LOT, max_tentatives=MAX_TENTATIVES):
+    """
+    Traite un lot d'événements en attente. Renvoie le nombre d'événements
+    traités, en échec et abandonnés.
+    """
+    resultat = {'traites': 0, 'echecs': 0, 'abandonnes': 0}
+    maintenant = timezone.now()
+    with transaction.atomic():
+        # skip_locked : plusieurs workers peuvent tourner en parallèle sans se
+        # partager les mêmes événements (ignoré par SQLite).
+        evenements = list(
+            EvenementStripe.objects.select_for_update(skip_locked=True)
+            .filter(statut__in=[EvenementStripe.STATUT_RECU, EvenementStripe.STATUT_ECHEC],
+                    prochain_essai__lte=maintenant)
+            .order_by('prochain_essai')[:taille]
+        )
+        for evenement in evenements:
+            evenement.tentatives += 1
+            try:
+                with transaction.atomic():
+                    traiter_evenement(evenement)
+            except Exception as e:
+                definitif = isinstance(e, EvenementInvalide) or evenement.tentatives >= max_tentatives
+                evenement.derniere_erreur = f"{type(e).__name__}: {e}"
+                if definitif:
+                    evenement.statut = EvenementStripe.STATUT_ABANDONNE
+                    resultat['abandonnes'] += 1
+                    logger.error("Événement Stripe %s abandonné : %s", evenement.pk, e)
+                else:
+                    evenement.statut = EvenementStripe.STATUT_ECHEC
+                    evenement.prochain_essai = maintenant + _delai(evenement.tentatives)
+                    resultat['echecs'] += 1
+            else:
+                evenement.statut = EvenementStripe.STATUT_TRAITE
+                evenement.traite_le = timezone.now()
+                evenement.derniere_erreur = ''
+                resultat['traites'] += 1
+        EvenementStripe.objects.bulk_update(
+            evenements,
+            ['statut', 'tentatives', 'derniere_erreur', 'prochain_essai', 'traite_le'],
+        )
+    return resultat